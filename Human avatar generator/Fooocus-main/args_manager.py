@@ -40,6 +40,21 @@ args_parser.parser.add_argument("--always-download-new-model", action='store_tru
 args_parser.parser.add_argument("--rebuild-hash-cache", help="Generates missing model and LoRA hashes.",
                                 type=int, nargs="?", metavar="CPU_NUM_THREADS", const=-1)
 
+args_parser.parser.add_argument("--rebuild-asset-index", action='store_true',
+                                help="List all model, LoRA, VAE and wildcard folders again instead of reusing the listings of unchanged folders.")
+
+args_parser.parser.add_argument("--headless", action='store_true',
+                                help="Serve a local HTTP JSON generation API (POST /generate, GET /queue) instead of the Gradio UI.")
+
+args_parser.parser.add_argument("--headless-batch", type=str, default=None, metavar="JOBS_JSONL",
+                                help="Run the generation jobs in a JSONL file (or - for stdin) without any UI, then exit.")
+
+args_parser.parser.add_argument("--profile-startup", action='store_true',
+                                help="Print the time taken by each launch phase and the slowest imports once the app is ready.")
+
+args_parser.parser.add_argument("--lazy-load", action='store_true',
+                                help="Start the app before torch and the generation backend are loaded, they are loaded with the first task.")
+
 args_parser.parser.set_defaults(
     disable_cuda_malloc=True,
     in_browser=True,
@@ -0,0 +1,29 @@
+import time
+
+import torch
+
+from modules.anisotropic import adaptive_anisotropic_filter
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+repeats = 5
+
+# Latent sizes of 512, 1024 and 1536 pixel images, as seen by patched_sampling_function on every step.
+for size in [64, 128, 192]:
+    x = torch.randn(1, 4, size, size, device=device)
+    g = torch.randn(1, 4, size, size, device=device)
+
+    for method in ['unfold', 'shifted']:
+        adaptive_anisotropic_filter(x, g, method=method)
+
+        if device == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        t = time.perf_counter()
+        for _ in range(repeats):
+            adaptive_anisotropic_filter(x, g, method=method)
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        per_step = (time.perf_counter() - t) / repeats
+
+        memory = f', peak {torch.cuda.max_memory_allocated() / 2 ** 20:.1f} MB' if device == 'cuda' else ''
+        print(f'{size * 8}px {method}: {per_step * 1000:.1f} ms per step{memory}')
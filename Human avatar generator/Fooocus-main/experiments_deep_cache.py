@@ -0,0 +1,72 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+import modules.config
+import modules.default_pipeline as pipeline
+import modules.patch
+from modules.patch import PatchSettings, patch_settings
+
+# Renders the same seeds with the full UNet (Speed) and with Deep Cache at a few refresh intervals,
+# and reports the time per image and the SSIM of every Deep Cache image to its full compute reference.
+prompt = 'portrait photo of a podcast host in a studio, microphone, soft light'
+negative_prompt = 'blurry, lowres'
+seeds = [1, 2, 3, 4]
+steps = 30
+width, height = 1024, 1024
+intervals = [2, 3, 5]
+
+
+def ssim(a, b):
+    # mean SSIM over the channels, gaussian window of 11 pixels and sigma 1.5 as in Wang et al.
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a, b = a.astype(np.float64), b.astype(np.float64)
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a * mu_a
+    var_b = blur(b * b) - mu_b * mu_b
+    covariance = blur(a * b) - mu_a * mu_b
+    s = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / ((mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2))
+    return float(s.mean())
+
+
+def render(deep_cache_interval):
+    pid = os.getpid()
+    images, timings = [], []
+    # one DeepCache for all seeds, its stats cover the whole run
+    patch_settings[pid] = PatchSettings(deep_cache_interval=deep_cache_interval,
+                                        deep_cache_shallow_blocks=modules.config.deep_cache_shallow_blocks)
+    for seed in seeds:
+        t = time.perf_counter()
+        images += pipeline.process_diffusion(positive_cond=positive_cond, negative_cond=negative_cond, steps=steps,
+                                             switch=steps, width=width, height=height, image_seed=seed,
+                                             callback=None, sampler_name=modules.config.default_sampler,
+                                             scheduler_name=modules.config.default_scheduler,
+                                             cfg_scale=modules.config.default_cfg_scale, disable_preview=True)
+        timings.append(time.perf_counter() - t)
+    deep_cache = patch_settings[pid].deep_cache
+    return images, timings, deep_cache.stats() if deep_cache is not None else None
+
+
+modules.patch.patch_all()
+pipeline.refresh_everything(refiner_model_name='None', base_model_name=modules.config.default_base_model_name,
+                            loras=[])
+positive_cond = pipeline.clip_encode(texts=[prompt], pool_top_k=1)
+negative_cond = pipeline.clip_encode(texts=[negative_prompt], pool_top_k=1)
+
+# the first image of each run also moves the model onto the device, it is not timed
+reference_images, reference_timings, _ = render(0)
+reference_time = sum(reference_timings[1:]) / (len(reference_timings) - 1)
+print(f'full compute: {reference_time:.2f} s per image')
+
+for interval in intervals:
+    images, timings, stats = render(interval)
+    mean_time = sum(timings[1:]) / (len(timings) - 1)
+    scores = [ssim(image, reference) for image, reference in zip(images, reference_images)]
+    print(f'deep cache interval {interval}: {mean_time:.2f} s per image ({reference_time / mean_time:.2f}x), '
+          f'SSIM to full compute mean {np.mean(scores):.4f} min {np.min(scores):.4f}, {stats}')
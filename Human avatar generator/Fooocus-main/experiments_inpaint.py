@@ -0,0 +1,88 @@
+import time
+
+import cv2
+import numpy as np
+
+import modules.inpaint_preprocess as preprocess
+from modules.util import resample_image, set_image_shape_ceil
+
+
+# The former implementations, for reference.
+def reference_morphological_open(x):
+    x_int16 = np.zeros_like(x, dtype=np.int16)
+    x_int16[x > 127] = 256
+    for i in range(32):
+        maxed = preprocess.max_filter_opencv(x_int16, ksize=3) - 8
+        x_int16 = np.maximum(maxed, x_int16)
+    return np.clip(x_int16, 0, 255).astype(np.uint8)
+
+
+def reference_solve_abcd(x, a, b, c, d, k):
+    H, W = x.shape[:2]
+    while True:
+        if b - a >= H * k and d - c >= W * k:
+            break
+        add_h = (b - a) < (d - c)
+        add_w = not add_h
+        if b - a == H:
+            add_w = True
+        if d - c == W:
+            add_h = True
+        if add_h:
+            a -= 1
+            b += 1
+        if add_w:
+            c -= 1
+            d += 1
+        a, b, c, d = preprocess.regulate_abcd(x, a, b, c, d)
+    return a, b, c, d
+
+
+def reference_fooocus_fill(image, mask):
+    current_image = image.copy()
+    area = np.where(mask < 127)
+    store = image[area]
+    for k, repeats in preprocess.FILL_PASSES:
+        for _ in range(repeats):
+            current_image = preprocess.box_blur(current_image, k)
+            current_image[area] = store
+    return current_image
+
+
+def timed(f, *args):
+    t = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - t
+
+
+# Inpaint preprocessing as in InpaintWorker.__init__, on a smooth synthetic image with an inpainted blob
+# and with the 30% outpaint border of apply_outpaint.
+rng = np.random.default_rng(0)
+for W, H in [(1600, 1280), (2048, 2048)]:
+    image = cv2.resize((rng.random((H // 32, W // 32, 3)) * 255).astype(np.uint8), (W, H), interpolation=cv2.INTER_CUBIC)
+    inpaint_mask = np.zeros((H, W), dtype=np.uint8)
+    cv2.ellipse(inpaint_mask, (W // 2, H // 2), (W // 8, H // 6), 30, 0, 360, 255, -1)
+    outpaint_mask = np.zeros((H, W), dtype=np.uint8)
+    outpaint_mask[:, int(W * 0.77):] = 255
+
+    for name, mask in [('inpaint', inpaint_mask), ('outpaint', outpaint_mask)]:
+        print(f'{W}x{H} {name}:')
+
+        a, b, c, d = preprocess.compute_initial_abcd(mask > 0)
+        box, t_new = timed(preprocess.solve_abcd, mask, a, b, c, d, 0.618)
+        reference_box, t_ref = timed(reference_solve_abcd, mask, a, b, c, d, 0.618)
+        print(f'  solve_abcd          {t_ref * 1000:8.2f} ms -> {t_new * 1000:8.2f} ms, same box: {box == reference_box}')
+
+        a, b, c, d = box
+        interested_image = set_image_shape_ceil(image[a:b, c:d], 1024)
+        h, w = interested_image.shape[:2]
+        interested_mask = preprocess.up255(resample_image(mask[a:b, c:d], w, h), t=127)
+        fill, t_new = timed(preprocess.fooocus_fill, interested_image, interested_mask)
+        reference_fill, t_ref = timed(reference_fooocus_fill, interested_image, interested_mask)
+        difference = np.abs(fill.astype(np.float32) - reference_fill)[interested_mask >= 127].mean()
+        print(f'  fooocus_fill        {t_ref * 1000:8.2f} ms -> {t_new * 1000:8.2f} ms, mean abs difference {difference:.2f}')
+
+        soft_mask, t_new = timed(preprocess.morphological_open, mask)
+        reference_soft_mask, t_ref = timed(reference_morphological_open, mask)
+        print(f'  morphological_open  {t_ref * 1000:8.2f} ms -> {t_new * 1000:8.2f} ms, '
+              f'identical: {np.array_equal(soft_mask, reference_soft_mask)}')
@@ -0,0 +1,40 @@
+import time
+
+import ldm_patched.modules.model_management as model_management
+import modules.config
+import modules.core as core
+from modules.util import get_file_from_folder_list
+
+# Alternates between avatar presets the way switching presets in the UI does, and times
+# refresh_loras plus patching the weights onto the device for every switch.
+base_model = get_file_from_folder_list(modules.config.default_base_model_name, modules.config.paths_checkpoints)
+modules.config.update_files()
+loras = modules.config.lora_filenames[:3]
+presets = [[(name, 0.8)] for name in loras] + [[(name, 0.5) for name in loras]]
+rounds = 3
+
+model = core.load_model(base_model)
+
+for cached in [False, True]:
+    core.lora_file_cache.clear()
+    core.lora_delta_cache.clear()
+    if not cached:
+        core.lora_file_cache.max_bytes = 0
+        core.lora_delta_cache.max_bytes = 0
+    else:
+        core.lora_file_cache.max_bytes = modules.config.lora_cache_max_mb * 2 ** 20
+        core.lora_delta_cache.max_bytes = modules.config.lora_delta_cache_max_mb * 2 ** 20
+
+    timings = []
+    for _ in range(rounds):
+        for preset in presets:
+            t = time.perf_counter()
+            model.refresh_loras(preset)
+            model_management.load_models_gpu([model.unet_with_lora, model.clip_with_lora.patcher])
+            timings.append(time.perf_counter() - t)
+
+    # the first round of the cached run fills the caches
+    warm = timings[len(presets):]
+    print(f'cache {"on" if cached else "off"}: first switch {timings[0]:.2f} s, '
+          f'mean switch after the first round {sum(warm) / len(warm):.2f} s')
+    print(f'  files {core.lora_file_cache.stats()}, deltas {core.lora_delta_cache.stats()}')
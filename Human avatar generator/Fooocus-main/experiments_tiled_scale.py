@@ -0,0 +1,27 @@
+import time
+
+import torch
+
+import ldm_patched.modules.utils
+from modules.upscaler import perform_upscale
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+# tiled_scale alone, with a small 4x conv net standing in for the upscale model
+net = torch.nn.Sequential(torch.nn.Conv2d(3, 32, 3, padding=1), torch.nn.LeakyReLU(),
+                          torch.nn.Conv2d(32, 48, 3, padding=1), torch.nn.PixelShuffle(4)).to(device).eval()
+x = torch.rand(1, 3, 1024, 1024, device=device)
+
+for tile_batch_size, workers in [(1, 1), (4, 1), (1, 2), (1, 4)]:
+    t = time.perf_counter()
+    ldm_patched.modules.utils.tiled_scale(x, net, 512, 512, 32, upscale_amount=4, output_device=device,
+                                          tile_batch_size=tile_batch_size, workers=workers)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    print(f'tile_batch_size={tile_batch_size} workers={workers}: {time.perf_counter() - t:.2f} s')
+
+# the real 4x upscale of a 1024px avatar, as done by the upscale and vary tasks
+img = (torch.rand(1024, 1024, 3) * 255).byte().numpy()
+t = time.perf_counter()
+perform_upscale(img)
+print(f'perform_upscale 1024px: {time.perf_counter() - t:.2f} s')
@@ -1,4 +1,7 @@
+import hashlib
 import os
+import threading
+from collections import OrderedDict
 
 import numpy as np
 import torch
@@ -13,6 +16,14 @@ safety_checker_repo_root = os.path.join(os.path.dirname(__file__), 'safety_check
 config_path = os.path.join(safety_checker_repo_root, "configs", "config.json")
 preprocessor_config_path = os.path.join(safety_checker_repo_root, "configs", "preprocessor_config.json")
 
+VERDICT_CACHE_SIZE = 1024
+MAX_BATCH_SIZE = 8
+
+
+def image_hash(image: np.ndarray) -> str:
+    image = np.ascontiguousarray(image)
+    return hashlib.sha1(str(image.shape).encode('utf-8') + image.data).hexdigest()
+
 
 class Censor:
     def __init__(self):
@@ -20,6 +31,9 @@ class Censor:
         self.clip_image_processor: CLIPImageProcessor | None = None
         self.load_device = torch.device('cpu')
         self.offload_device = torch.device('cpu')
+        # {image_hash: has_nsfw_concept}, so an image shown, saved and shown again is only checked once
+        self.verdicts = OrderedDict()
+        self.lock = threading.Lock()
 
     def init(self):
         if self.safety_checker_model is None and self.clip_image_processor is None:
@@ -36,20 +50,72 @@ class Censor:
 
             self.safety_checker_model = ModelPatcher(model, load_device=self.load_device, offload_device=self.offload_device)
 
-    def censor(self, images: list | np.ndarray) -> list | np.ndarray:
-        self.init()
-        model_management.load_model_gpu(self.safety_checker_model)
+    def preprocess(self, images: list) -> torch.Tensor:
+        """
+        What clip_image_processor does (resize of the shortest edge, center crop, normalize), on whole batches of
+        same sized images on the load device. Resizing is antialiased bicubic like the PIL resize of the processor.
+        """
+        size = self.clip_image_processor.size['shortest_edge']
+        crop_height, crop_width = self.clip_image_processor.crop_size['height'], self.clip_image_processor.crop_size['width']
+        mean = torch.tensor(self.clip_image_processor.image_mean, device=self.load_device).view(1, 3, 1, 1)
+        std = torch.tensor(self.clip_image_processor.image_std, device=self.load_device).view(1, 3, 1, 1)
+
+        groups = {}
+        for index, image in enumerate(images):
+            if image.ndim == 2:
+                image = np.stack([image] * 3, axis=2)
+            groups.setdefault(image.shape[:2], []).append((index, image[:, :, :3]))
+
+        pixel_values = [None] * len(images)
+        for (H, W), group in groups.items():
+            x = torch.from_numpy(np.stack([image for _, image in group], axis=0)).to(self.load_device)
+            x = x.permute(0, 3, 1, 2).float()
+            short = min(H, W)
+            x = torch.nn.functional.interpolate(x, size=(int(size * H / short), int(size * W / short)),
+                                                mode='bicubic', antialias=True, align_corners=False)
+            top, left = (x.shape[2] - crop_height) // 2, (x.shape[3] - crop_width) // 2
+            x = x[:, :, top:top + crop_height, left:left + crop_width].clamp(0, 255).round()
+            x = (x / 255.0 - mean) / std
+            for (index, _), value in zip(group, x):
+                pixel_values[index] = value
+        return torch.stack(pixel_values, dim=0)
+
+    def has_nsfw_concepts(self, images: list) -> list:
+        with self.lock:
+            hashes = [image_hash(image) for image in images]
+            unknown = {}
+            for image, h in zip(images, hashes):
+                if h not in self.verdicts and h not in unknown:
+                    unknown[h] = image
+
+            if len(unknown) > 0:
+                self.init()
+                model_management.load_model_gpu(self.safety_checker_model)
+                model = self.safety_checker_model.model
+                pending_hashes, pending_images = list(unknown.keys()), list(unknown.values())
+                for i in range(0, len(pending_images), MAX_BATCH_SIZE):
+                    clip_input = self.preprocess(pending_images[i:i + MAX_BATCH_SIZE]).to(model.dtype)
+                    for h, verdict in zip(pending_hashes[i:i + MAX_BATCH_SIZE], model.has_nsfw_concepts(clip_input)):
+                        self.verdicts[h] = bool(verdict)
+                if any(self.verdicts[h] for h in pending_hashes):
+                    print('[Censor] Potential NSFW content was detected in one or more images. A black image will be returned instead.')
+
+            result = []
+            for h in hashes:
+                self.verdicts.move_to_end(h)
+                result.append(self.verdicts[h])
+            while len(self.verdicts) > VERDICT_CACHE_SIZE:
+                self.verdicts.popitem(last=False)
+            return result
 
+    def censor(self, images: list | np.ndarray) -> list | np.ndarray:
         single = False
-        if not isinstance(images, (list, np.ndarray)):
+        if not isinstance(images, list):
             images = [images]
             single = True
 
-        safety_checker_input = self.clip_image_processor(images, return_tensors="pt")
-        safety_checker_input.to(device=self.load_device)
-        checked_images, has_nsfw_concept = self.safety_checker_model.model(images=images,
-                                                                           clip_input=safety_checker_input.pixel_values)
-        checked_images = [image.astype(np.uint8) for image in checked_images]
+        checked_images = [np.zeros(image.shape, dtype=np.uint8) if has_nsfw_concept else image.astype(np.uint8)
+                          for image, has_nsfw_concept in zip(images, self.has_nsfw_concepts(images))]
 
         if single:
             checked_images = checked_images[0]
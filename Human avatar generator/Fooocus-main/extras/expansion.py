@@ -10,8 +10,8 @@ import torch
 import math
 import ldm_patched.modules.model_management as model_management
 
-from transformers.generation.logits_process import LogitsProcessorList
-from transformers import AutoTokenizer, AutoModelForCausalLM, set_seed
+from collections import OrderedDict
+from transformers import AutoTokenizer, AutoModelForCausalLM
 from modules.config import path_fooocus_expansion
 from ldm_patched.modules.model_patcher import ModelPatcher
 
@@ -19,6 +19,8 @@ from ldm_patched.modules.model_patcher import ModelPatcher
 # limitation of np.random.seed(), called from transformers.set_seed()
 SEED_LIMIT_NUMPY = 2**32
 neg_inf = - 8192.0
+top_k = 100
+cache_size = 1024
 
 
 def safe_str(x):
@@ -78,52 +80,124 @@ class FooocusExpansion:
         self.patcher = ModelPatcher(self.model, load_device=load_device, offload_device=offload_device)
         print(f'Fooocus Expansion engine loaded for {load_device}, use_fp16 = {use_fp16}.')
 
+        self.cache = OrderedDict()
+
     @torch.no_grad()
     @torch.inference_mode()
     def logits_processor(self, input_ids, scores):
-        assert scores.ndim == 2 and scores.shape[0] == 1
         self.logits_bias = self.logits_bias.to(scores)
 
-        bias = self.logits_bias.clone()
-        bias[0, input_ids[0].to(bias.device).long()] = neg_inf
-        bias[0, 11] = 0
+        # Same as adding a per-row copy of logits_bias with the tokens already used banned and ',' allowed,
+        # without cloning the full vocabulary bias on every step.
+        result = scores + self.logits_bias
+        input_ids = input_ids.to(scores.device).long()
+        result.scatter_(1, input_ids, scores.gather(1, input_ids) + neg_inf)
+        result[:, 11] = scores[:, 11]
 
-        return scores + bias
+        return result
 
     @torch.no_grad()
     @torch.inference_mode()
     def __call__(self, prompt, seed):
-        if prompt == '':
-            return ''
+        return self.expand_batch([prompt], [seed])[0]
 
-        if self.patcher.current_device != self.patcher.load_device:
-            print('Fooocus Expansion loaded by itself.')
-            model_management.load_model_gpu(self.patcher)
+    @torch.no_grad()
+    @torch.inference_mode()
+    def expand_batch(self, prompts, seeds):
+        """Expand every (prompt, seed) pair, generating all uncached ones in a single batch.
+
+        Each row samples from its own generator seeded with its seed, so a row gets the
+        same expansion as when it is expanded alone.
+        """
+        results = [None] * len(prompts)
+        rows = []
+
+        for i, (prompt, seed) in enumerate(zip(prompts, seeds)):
+            seed = int(seed) % SEED_LIMIT_NUMPY
+            if prompt == '':
+                results[i] = ''
+                continue
+            if (prompt, seed) in self.cache:
+                self.cache.move_to_end((prompt, seed))
+                results[i] = self.cache[(prompt, seed)]
+                continue
 
-        seed = int(seed) % SEED_LIMIT_NUMPY
-        set_seed(seed)
-        prompt = safe_str(prompt) + ','
+            text = safe_str(prompt) + ','
+            input_ids = self.tokenizer(text)['input_ids']
 
-        tokenized_kwargs = self.tokenizer(prompt, return_tensors="pt")
-        tokenized_kwargs.data['input_ids'] = tokenized_kwargs.data['input_ids'].to(self.patcher.load_device)
-        tokenized_kwargs.data['attention_mask'] = tokenized_kwargs.data['attention_mask'].to(self.patcher.load_device)
+            current_token_length = len(input_ids)
+            max_token_length = 75 * int(math.ceil(float(current_token_length) / 75.0))
+            max_new_tokens = max_token_length - current_token_length
 
-        current_token_length = int(tokenized_kwargs.data['input_ids'].shape[1])
-        max_token_length = 75 * int(math.ceil(float(current_token_length) / 75.0))
-        max_new_tokens = max_token_length - current_token_length
+            if max_new_tokens == 0:
+                results[i] = self.remember(prompt, seed, text[:-1])
+                continue
 
-        if max_new_tokens == 0:
-            return prompt[:-1]
+            rows.append((i, prompt, seed, input_ids, max_new_tokens))
 
-        # https://huggingface.co/blog/introducing-csearch
-        # https://huggingface.co/docs/transformers/generation_strategies
-        features = self.model.generate(**tokenized_kwargs,
-                                       top_k=100,
-                                       max_new_tokens=max_new_tokens,
-                                       do_sample=True,
-                                       logits_processor=LogitsProcessorList([self.logits_processor]))
+        if len(rows) == 0:
+            return results
 
+        if self.patcher.current_device != self.patcher.load_device:
+            print('Fooocus Expansion loaded by itself.')
+            model_management.load_model_gpu(self.patcher)
+
+        features = self.sample([(input_ids, seed, max_new_tokens) for _, _, seed, input_ids, max_new_tokens in rows])
         response = self.tokenizer.batch_decode(features, skip_special_tokens=True)
-        result = safe_str(response[0])
 
+        for (i, prompt, seed, _, _), text in zip(rows, response):
+            results[i] = self.remember(prompt, seed, safe_str(text))
+
+        return results
+
+    def remember(self, prompt, seed, result):
+        self.cache[(prompt, seed)] = result
+        while len(self.cache) > cache_size:
+            self.cache.popitem(last=False)
         return result
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def sample(self, rows):
+        # Top-k sampling like model.generate(do_sample=True, top_k=100), but for left padded rows of different
+        # lengths that each stop after their own max_new_tokens and draw from their own seeded generator.
+        device = self.patcher.load_device
+        pad_token_id = self.tokenizer.eos_token_id
+        eos_token_id = self.tokenizer.eos_token_id
+
+        prompt_length = max(len(input_ids) for input_ids, _, _ in rows)
+        input_ids = torch.tensor([[pad_token_id] * (prompt_length - len(x)) + x for x, _, _ in rows], device=device)
+        attention_mask = torch.tensor([[0] * (prompt_length - len(x)) + [1] * len(x) for x, _, _ in rows], device=device)
+        max_new_tokens = torch.tensor([n for _, _, n in rows], device=device)
+        generators = [torch.Generator(device=device).manual_seed(seed) for _, seed, _ in rows]
+
+        unfinished = torch.ones(len(rows), dtype=torch.long, device=device)
+        past_key_values = None
+        next_input_ids = input_ids
+
+        for step in range(int(max_new_tokens.max())):
+            position_ids = attention_mask.long().cumsum(-1) - 1
+            position_ids.masked_fill_(attention_mask == 0, 1)
+            outputs = self.model(input_ids=next_input_ids, attention_mask=attention_mask,
+                                 position_ids=position_ids[:, -next_input_ids.shape[1]:],
+                                 past_key_values=past_key_values, use_cache=True)
+            past_key_values = outputs.past_key_values
+
+            scores = self.logits_processor(input_ids, outputs.logits[:, -1, :].clone())
+            kth_scores = torch.topk(scores, min(top_k, scores.shape[-1]))[0][..., -1, None]
+            scores = scores.masked_fill(scores < kth_scores, -float('inf'))
+            probs = torch.nn.functional.softmax(scores, dim=-1)
+
+            next_tokens = torch.cat([torch.multinomial(probs[i:i + 1], num_samples=1, generator=generators[i])
+                                     for i in range(len(rows))]).squeeze(1)
+            next_tokens = next_tokens * unfinished + pad_token_id * (1 - unfinished)
+
+            input_ids = torch.cat([input_ids, next_tokens[:, None]], dim=-1)
+            attention_mask = torch.cat([attention_mask, torch.ones_like(next_tokens[:, None])], dim=-1)
+            next_input_ids = next_tokens[:, None]
+
+            unfinished = unfinished * (next_tokens != eos_token_id).long() * (step + 1 < max_new_tokens).long()
+            if unfinished.max() == 0:
+                break
+
+        return input_ids
@@ -1,13 +1,20 @@
+import hashlib
 import sys
+import threading
+from collections import OrderedDict
 
 import modules.config
 import numpy as np
-import torch
-from extras.GroundingDINO.util.inference import default_groundingdino
-from extras.sam.predictor import SamPredictor
-from rembg import remove, new_session
-from segment_anything import sam_model_registry
-from segment_anything.utils.amg import remove_small_regions
+
+# torch, GroundingDINO, SAM and rembg are imported on first use, SAMOptions is needed to build the UI long before that
+
+# SAM stays resident between calls, its weights are moved to and from the GPU by model_management.
+# Only the last used model type is kept, the image embeddings of the last few images are kept per model type.
+sam_predictor = None
+sam_predictor_type = None
+sam_embeddings = OrderedDict()
+sam_lock = threading.Lock()
+SAM_EMBEDDING_CACHE_SIZE = 4
 
 
 class SAMOptions:
@@ -32,10 +39,13 @@ class SAMOptions:
         self.model_type = model_type
 
 
-def optimize_masks(masks: torch.Tensor) -> torch.Tensor:
+def optimize_masks(masks: 'torch.Tensor') -> 'torch.Tensor':
     """
     removes small disconnected regions and holes
     """
+    import torch
+    from segment_anything.utils.amg import remove_small_regions
+
     fine_masks = []
     for mask in masks.to('cpu').numpy():  # masks: [num_masks, 1, h, w]
         fine_masks.append(remove_small_regions(mask[0], 400, mode="holes")[0])
@@ -43,6 +53,38 @@ def optimize_masks(masks: torch.Tensor) -> torch.Tensor:
     return torch.from_numpy(masks)
 
 
+def get_sam_predictor(model_type: str) -> 'SamPredictor':
+    global sam_predictor, sam_predictor_type
+    from extras.sam.predictor import SamPredictor
+    from segment_anything import sam_model_registry
+
+    if sam_predictor is None or sam_predictor_type != model_type:
+        sam_predictor = None
+        sam_embeddings.clear()
+        sam_checkpoint = modules.config.download_sam_model(model_type)
+        sam_predictor = SamPredictor(sam_model_registry[model_type](checkpoint=sam_checkpoint))
+        sam_predictor_type = model_type
+    return sam_predictor
+
+
+def set_sam_image(predictor: 'SamPredictor', image: np.ndarray):
+    """
+    set_image, reusing the embedding when the same image was set before, e.g. for another prompt
+    """
+    image = np.ascontiguousarray(image)
+    key = (image.shape, hashlib.sha1(image.data).hexdigest())
+    cached = sam_embeddings.get(key, None)
+    if cached is not None:
+        sam_embeddings.move_to_end(key)
+        predictor.set_features(*cached)
+        return
+
+    predictor.set_image(image)
+    sam_embeddings[key] = (predictor.features, predictor.original_size, predictor.input_size)
+    while len(sam_embeddings) > SAM_EMBEDDING_CACHE_SIZE:
+        sam_embeddings.popitem(last=False)
+
+
 def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=None,
                              sam_options: SAMOptions | None = SAMOptions) -> tuple[np.ndarray | None, int | None, int | None, int | None]:
     dino_detection_count = 0
@@ -59,6 +101,7 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
         image = image['image']
 
     if mask_model != 'sam' or sam_options is None:
+        from rembg import remove, new_session
         result = remove(
             image,
             session=new_session(mask_model, **extras),
@@ -68,6 +111,9 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
 
         return result, dino_detection_count, sam_detection_count, sam_detection_on_mask_count
 
+    import torch
+    from extras.GroundingDINO.util.inference import default_groundingdino
+
     detections, boxes, logits, phrases = default_groundingdino(
         image=image,
         caption=sam_options.dino_prompt,
@@ -80,23 +126,14 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
     boxes[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
     boxes[:, 2:] = boxes[:, 2:] + boxes[:, :2]
 
-    sam_checkpoint = modules.config.download_sam_model(sam_options.model_type)
-    sam = sam_model_registry[sam_options.model_type](checkpoint=sam_checkpoint)
-
-    sam_predictor = SamPredictor(sam)
     final_mask_tensor = torch.zeros((image.shape[0], image.shape[1]))
     dino_detection_count = boxes.size(0)
 
     if dino_detection_count > 0:
-        sam_predictor.set_image(image)
-
         if sam_options.dino_erode_or_dilate != 0:
-            for index in range(boxes.size(0)):
-                assert boxes.size(1) == 4
-                boxes[index][0] -= sam_options.dino_erode_or_dilate
-                boxes[index][1] -= sam_options.dino_erode_or_dilate
-                boxes[index][2] += sam_options.dino_erode_or_dilate
-                boxes[index][3] += sam_options.dino_erode_or_dilate
+            assert boxes.size(1) == 4
+            boxes[:, :2] -= sam_options.dino_erode_or_dilate
+            boxes[:, 2:] += sam_options.dino_erode_or_dilate
 
         if sam_options.dino_debug:
             from PIL import ImageDraw, Image
@@ -106,23 +143,28 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
                 draw.rectangle(box.tolist(), fill="white")
             return np.array(debug_dino_image), dino_detection_count, sam_detection_count, sam_detection_on_mask_count
 
-        transformed_boxes = sam_predictor.transform.apply_boxes_torch(boxes, image.shape[:2])
-        masks, _, _ = sam_predictor.predict_torch(
-            point_coords=None,
-            point_labels=None,
-            boxes=transformed_boxes,
-            multimask_output=False,
-        )
+        with sam_lock:
+            predictor = get_sam_predictor(sam_options.model_type)
+            set_sam_image(predictor, image)
+
+            # all boxes are prompted in one batch
+            transformed_boxes = predictor.transform.apply_boxes_torch(boxes, image.shape[:2])
+            masks, _, _ = predictor.predict_torch(
+                point_coords=None,
+                point_labels=None,
+                boxes=transformed_boxes,
+                multimask_output=False,
+            )
 
-        masks = optimize_masks(masks)
         sam_detection_count = len(masks)
         if sam_options.max_detections == 0:
             sam_options.max_detections = sys.maxsize
         sam_objects = min(len(logits), sam_options.max_detections)
-        for obj_ind in range(sam_objects):
-            mask_tensor = masks[obj_ind][0]
-            final_mask_tensor += mask_tensor
-            sam_detection_on_mask_count += 1
+
+        # only the masks that end up in the result need cleaning
+        masks = optimize_masks(masks[:sam_objects])
+        final_mask_tensor = masks[:, 0].any(dim=0)
+        sam_detection_on_mask_count = sam_objects
 
     final_mask_tensor = (final_mask_tensor > 0).to('cpu').numpy()
     mask_image = np.dstack((final_mask_tensor, final_mask_tensor, final_mask_tensor)) * 255
@@ -204,6 +204,9 @@ def preprocess(img, ip_adapter_path):
 def patch_model(model, tasks):
     new_model = model.clone()
 
+    # {(ip_index, task index, cond_or_uncond, device, dtype): (ip_k, ip_v)}, the same at every step
+    ip_kv_cache = {}
+
     def make_attn_patcher(ip_index):
         def patcher(n, context_attn2, value_attn2, extra_options):
             org_dtype = n.dtype
@@ -215,8 +218,15 @@ def patch_model(model, tasks):
             v = [value_attn2]
             b, _, _ = q.shape
 
-            for (cs, ucs), cn_stop, cn_weight in tasks:
+            for task_index, ((cs, ucs), cn_stop, cn_weight) in enumerate(tasks):
                 if current_step < cn_stop:
+                    key = (ip_index, task_index, tuple(cond_or_uncond), q.device, q.dtype)
+                    if key in ip_kv_cache:
+                        ip_k, ip_v = ip_kv_cache[key]
+                        k.append(ip_k)
+                        v.append(ip_v)
+                        continue
+
                     ip_k_c = cs[ip_index * 2].to(q)
                     ip_v_c = cs[ip_index * 2 + 1].to(q)
                     ip_k_uc = ucs[ip_index * 2].to(q)
@@ -242,6 +252,7 @@ def patch_model(model, tasks):
 
                     ip_k = ip_k * weight
                     ip_v = ip_v_offset + ip_v_mean * weight
+                    ip_kv_cache[key] = ip_k, ip_v
 
                     k.append(ip_k)
                     v.append(ip_v)
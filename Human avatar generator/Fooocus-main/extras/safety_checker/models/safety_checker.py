@@ -99,6 +99,22 @@ class StableDiffusionSafetyChecker(PreTrainedModel):
 
         return images, has_nsfw_concepts
 
+    @torch.no_grad()
+    def has_nsfw_concepts(self, clip_input):
+        """The verdicts of forward for a batch, without the per image loops and without touching any images."""
+        pooled_output = self.vision_model(clip_input)[1]  # pooled_output
+        image_embeds = self.visual_projection(pooled_output)
+
+        special_cos_dist = cosine_distance(image_embeds, self.special_care_embeds).float()
+        cos_dist = cosine_distance(image_embeds, self.concept_embeds).float()
+
+        # scores are rounded to 3 decimals like in forward, any special care concept raises the adjustment to 0.01
+        special_scores = torch.round((special_cos_dist - self.special_care_embeds_weights.float()) * 1000) / 1000
+        adjustment = torch.any(special_scores > 0, dim=1, keepdim=True) * 0.01
+
+        concept_scores = torch.round((cos_dist - self.concept_embeds_weights.float() + adjustment) * 1000) / 1000
+        return torch.any(concept_scores > 0, dim=1).cpu()
+
     @torch.no_grad()
     def forward_onnx(self, clip_input: torch.Tensor, images: torch.Tensor):
         pooled_output = self.vision_model(clip_input)[1]  # pooled_output
@@ -101,6 +101,23 @@ class SamPredictor:
         self.features = self.patcher.model.image_encoder(input_image)
         self.is_image_set = True
 
+    def set_features(
+        self,
+        features: torch.Tensor,
+        original_image_size: Tuple[int, ...],
+        input_size: Tuple[int, ...],
+    ) -> None:
+        """
+        Sets image embeddings previously calculated by set_image, so the
+        image encoder does not have to run again for the same image.
+        """
+        self.reset_image()
+
+        self.original_size = original_image_size
+        self.input_size = input_size
+        self.features = features
+        self.is_image_set = True
+
     def predict(
         self,
         point_coords: Optional[np.ndarray] = None,
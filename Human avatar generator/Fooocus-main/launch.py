@@ -8,6 +8,12 @@ root = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(root)
 os.chdir(root)
 
+from modules import startup_profiler
+
+# arguments are parsed only after the environment is prepared, this has to be known before
+if '--profile-startup' in sys.argv:
+    startup_profiler.enable()
+
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 os.environ["PYTORCH_MPS_HIGH_WATERMARK_RATIO"] = "0.0"
 if "GRADIO_SERVER_PORT" not in os.environ:
@@ -72,9 +78,11 @@ def ini_args():
     return args
 
 
-prepare_environment()
-build_launcher()
-args = ini_args()
+with startup_profiler.phase('prepare environment'):
+    prepare_environment()
+    build_launcher()
+with startup_profiler.phase('parse arguments'):
+    args = ini_args()
 
 if args.gpu_device_id is not None:
     os.environ['CUDA_VISIBLE_DEVICES'] = str(args.gpu_device_id)
@@ -84,8 +92,9 @@ if args.hf_mirror is not None:
     os.environ['HF_MIRROR'] = str(args.hf_mirror)
     print("Set hf_mirror to:", args.hf_mirror)
 
-from modules import config
-from modules.hash_cache import init_cache
+with startup_profiler.phase('load config'):
+    from modules import config
+    from modules.hash_cache import init_cache
 
 os.environ["U2NET_HOME"] = config.path_inpaint
 
@@ -142,11 +151,19 @@ def download_models(default_model, previous_default_models, checkpoint_downloads
     return default_model, checkpoint_downloads
 
 
-config.default_base_model_name, config.checkpoint_downloads = download_models(
-    config.default_base_model_name, config.previous_default_models, config.checkpoint_downloads,
-    config.embeddings_downloads, config.lora_downloads, config.vae_downloads)
+with startup_profiler.phase('download models'):
+    config.default_base_model_name, config.checkpoint_downloads = download_models(
+        config.default_base_model_name, config.previous_default_models, config.checkpoint_downloads,
+        config.embeddings_downloads, config.lora_downloads, config.vae_downloads)
 
-config.update_files()
-init_cache(config.model_filenames, config.paths_checkpoints, config.lora_filenames, config.paths_loras)
+with startup_profiler.phase('index model files'):
+    config.update_files(rebuild=args.rebuild_asset_index)
+    init_cache(config.model_filenames, config.paths_checkpoints, config.lora_filenames, config.paths_loras)
 
-from webui import *
+if args.headless or args.headless_batch is not None:
+    with startup_profiler.phase('import headless server'):
+        import modules.headless
+    startup_profiler.report()
+    modules.headless.main()
+else:
+    from webui import *
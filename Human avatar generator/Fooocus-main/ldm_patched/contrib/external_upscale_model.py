@@ -45,15 +45,21 @@ class ImageUpscaleWithModel:
 
         tile = 512
         overlap = 32
+        # several tiles per forward on GPUs, on CPU two batches in flight so accumulating one overlaps the next
+        tile_batch_size = 4 if device.type != 'cpu' else 1
+        workers = 2 if device.type == 'cpu' and (os.cpu_count() or 1) > 1 else 1
 
         oom = True
         while oom:
             try:
                 steps = in_img.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
                 pbar = ldm_patched.modules.utils.ProgressBar(steps)
-                s = ldm_patched.modules.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
+                s = ldm_patched.modules.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar, tile_batch_size=tile_batch_size, workers=workers)
                 oom = False
             except model_management.OOM_EXCEPTION as e:
+                if tile_batch_size > 1:
+                    tile_batch_size //= 2
+                    continue
                 tile //= 2
                 if tile < 128:
                     raise e
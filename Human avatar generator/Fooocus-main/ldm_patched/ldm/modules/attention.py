@@ -7,6 +7,7 @@ from typing import Optional, Any
 
 from .diffusionmodules.util import checkpoint, AlphaBlender, timestep_embedding
 from .sub_quadratic_attention import efficient_dot_product_attention
+from .context_kv_cache import context_kv_cache
 
 from ldm_patched.modules import model_management
 
@@ -381,12 +382,12 @@ class CrossAttention(nn.Module):
     def forward(self, x, context=None, value=None, mask=None):
         q = self.to_q(x)
         context = default(context, x)
-        k = self.to_k(context)
+        k = context_kv_cache.project(self.to_k, context)
         if value is not None:
-            v = self.to_v(value)
+            v = context_kv_cache.project(self.to_v, value)
             del value
         else:
-            v = self.to_v(context)
+            v = context_kv_cache.project(self.to_v, context)
 
         if mask is None:
             out = optimized_attention(q, k, v, self.heads)
@@ -532,8 +533,8 @@ class BasicTransformerBlock(nn.Module):
                 if value_attn2 is None:
                     value_attn2 = context_attn2
                 n = self.attn2.to_q(n)
-                context_attn2 = self.attn2.to_k(context_attn2)
-                value_attn2 = self.attn2.to_v(value_attn2)
+                context_attn2 = context_kv_cache.project(self.attn2.to_k, context_attn2)
+                value_attn2 = context_kv_cache.project(self.attn2.to_v, value_attn2)
                 n = attn2_replace_patch[block_attn2](n, context_attn2, value_attn2, extra_options)
                 n = self.attn2.to_out(n)
             else:
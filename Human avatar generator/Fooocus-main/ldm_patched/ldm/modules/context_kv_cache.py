@@ -0,0 +1,67 @@
+import torch
+
+
+class ContextKVCache:
+    """
+    K/V projections of the cross attention context, which stays the same over the steps of a sampling run.
+
+    set_context is called with the context of every UNet call. A context equal to one seen before reuses
+    the projections made from it, for the layers that get exactly that context tensor. Contexts changed on
+    the way, e.g. by attn2 patches, are projected as usual. clear() at the start and end of every sampling
+    run, the weights may change in between.
+    """
+
+    def __init__(self, max_contexts=4):
+        self.max_contexts = max_contexts
+        # [(context, {id(linear): projection})], most recently used last
+        self.entries = []
+        self.current = None
+        self.projections = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries = []
+        self.current = None
+        self.projections = None
+
+    def set_context(self, context):
+        self.current = context
+        self.projections = None
+        if context is None:
+            return
+
+        for i, (cached_context, projections) in enumerate(self.entries):
+            if cached_context.shape == context.shape and cached_context.dtype == context.dtype \
+                    and cached_context.device == context.device and torch.equal(cached_context, context):
+                self.entries.append(self.entries.pop(i))
+                self.projections = projections
+                return
+
+        self.projections = {}
+        self.entries.append((context, self.projections))
+        if len(self.entries) > self.max_contexts:
+            self.entries.pop(0)
+
+    def project(self, linear, x):
+        if self.projections is None or x is not self.current:
+            return linear(x)
+
+        key = id(linear)
+        y = self.projections.get(key, None)
+        if y is None:
+            self.misses += 1
+            y = self.projections[key] = linear(x)
+        else:
+            self.hits += 1
+        return y
+
+    def stats(self):
+        return {
+            'contexts': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+context_kv_cache = ContextKVCache()
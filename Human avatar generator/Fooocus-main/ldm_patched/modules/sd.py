@@ -428,7 +428,14 @@ def load_checkpoint(config_path=None, ckpt_path=None, output_vae=True, output_cl
     return (ldm_patched.modules.model_patcher.ModelPatcher(model, load_device=model_management.get_torch_device(), offload_device=offload_device), clip, vae)
 
 def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, vae_filename_param=None):
-    sd = ldm_patched.modules.utils.load_torch_file(ckpt_path)
+    # the weights are copied into the models, the file is unmapped once they are loaded
+    sd = ldm_patched.modules.utils.load_torch_file(ckpt_path, mapped=True)
+    try:
+        return load_state_dict_guess_config(sd, ckpt_path, output_vae, output_clip, output_clipvision, embedding_directory, output_model, vae_filename_param)
+    finally:
+        ldm_patched.modules.utils.close_state_dict(sd)
+
+def load_state_dict_guess_config(sd, ckpt_path, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, vae_filename_param=None):
     sd_keys = sd.keys()
     clip = None
     clipvision = None
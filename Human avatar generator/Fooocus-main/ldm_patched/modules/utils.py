@@ -1,25 +1,92 @@
 import torch
 import math
+import json
+import mmap
 import struct
+from concurrent.futures import ThreadPoolExecutor
 import ldm_patched.modules.checkpoint_pickle
 import safetensors.torch
 import numpy as np
 from PIL import Image
 
-def load_torch_file(ckpt, safe_load=False, device=None):
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+if hasattr(torch, "float8_e4m3fn"):
+    SAFETENSORS_DTYPES.update({"F8_E4M3": torch.float8_e4m3fn, "F8_E5M2": torch.float8_e5m2})
+
+class MappedStateDict(dict):
+    # State dict whose tensors are views of a memory mapped file.
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def close(self):
+        # Drops the tensors and the mapping once they are loaded into a model, which unmaps the file
+        # right away. Closing the mapping explicitly would break tensors of it still referenced
+        # elsewhere, those keep the file mapped until they are freed as well.
+        self.clear()
+        self.buffer = None
+
+def load_safetensors_mmap(ckpt):
+    # Tensors are views of a copy-on-write mapping of the file, so nothing is read
+    # until a tensor is actually touched and tensors that never are stay on disk.
+    with open(ckpt, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    sd = MappedStateDict(buffer)
+    for k, v in header.items():
+        if k == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[v["dtype"]]
+        begin, end = v["data_offsets"]
+        offset = data_start + begin
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if end == begin:
+            t = torch.empty(v["shape"], dtype=dtype)
+        elif offset % itemsize == 0:
+            t = torch.frombuffer(buffer, dtype=dtype, count=(end - begin) // itemsize, offset=offset).reshape(v["shape"])
+        else:
+            t = torch.frombuffer(bytearray(buffer[offset:data_start + end]), dtype=dtype).reshape(v["shape"])
+        sd[k] = t
+    return sd
+
+def close_state_dict(sd):
+    if isinstance(sd, MappedStateDict):
+        sd.close()
+
+def load_torch_file(ckpt, safe_load=False, device=None, mapped=False):
+    # mapped: memory map the file instead of reading it, pass the result to close_state_dict when done with it
     if device is None:
         device = torch.device("cpu")
     if ckpt.lower().endswith(".safetensors"):
-        sd = safetensors.torch.load_file(ckpt, device=device.type)
+        if mapped and device.type == "cpu":
+            sd = load_safetensors_mmap(ckpt)
+        else:
+            sd = safetensors.torch.load_file(ckpt, device=device.type)
     else:
         if safe_load:
             if not 'weights_only' in torch.load.__code__.co_varnames:
                 print("Warning torch.load doesn't support weights_only on this pytorch version, loading unsafely.")
                 safe_load = False
         if safe_load:
-            pl_sd = torch.load(ckpt, map_location=device, weights_only=True)
+            kwargs = dict(weights_only=True)
         else:
-            pl_sd = torch.load(ckpt, map_location=device, pickle_module=ldm_patched.modules.checkpoint_pickle)
+            kwargs = dict(pickle_module=ldm_patched.modules.checkpoint_pickle)
+        pl_sd = None
+        if mapped and 'mmap' in torch.load.__code__.co_varnames and device.type == "cpu":
+            # zip based checkpoints can be memory mapped as well, legacy ones can not
+            try:
+                pl_sd = torch.load(ckpt, map_location=device, mmap=True, **kwargs)
+            except RuntimeError:
+                pl_sd = None
+        if pl_sd is None:
+            pl_sd = torch.load(ckpt, map_location=device, **kwargs)
         if "global_step" in pl_sd:
             print(f"Global Step: {pl_sd['global_step']}")
         if "state_dict" in pl_sd:
@@ -404,32 +471,56 @@ def common_upscale(samples, width, height, upscale_method, crop):
 def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     return math.ceil((height / (tile_y - overlap))) * math.ceil((width / (tile_x - overlap)))
 
+def feather_window(length, feather):
+    # 1D weights of the feathered tile mask, the product of the ramps from both ends
+    window = torch.ones(length)
+    for t in range(feather):
+        window[t:1+t] *= ((1.0/feather) * (t + 1))
+        window[length - 1 - t: length - t] *= ((1.0/feather) * (t + 1))
+    return window
+
+def tiled_scale_tiles(shape, tile_x, tile_y, overlap):
+    return [(b, y, x) for b in range(shape[0]) for y in range(0, shape[2], tile_y - overlap) for x in range(0, shape[3], tile_x - overlap)]
+
 @torch.inference_mode()
-def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
-    output = torch.empty((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
-    for b in range(samples.shape[0]):
-        s = samples[b:b+1]
-        out = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
-        out_div = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
-        for y in range(0, s.shape[2], tile_y - overlap):
-            for x in range(0, s.shape[3], tile_x - overlap):
-                s_in = s[:,:,y:y+tile_y,x:x+tile_x]
-
-                ps = function(s_in).to(output_device)
-                mask = torch.ones_like(ps)
-                feather = round(overlap * upscale_amount)
-                for t in range(feather):
-                        mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
-                out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps * mask
-                out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
-                if pbar is not None:
-                    pbar.update(1)
-
-        output[b:b+1] = out/out_div
-    return output
+def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None, tile_batch_size = 1, workers = 1):
+    # Tiles of the same shape are run through function tile_batch_size at a time, and with
+    # workers > 1 the batches are run on a thread pool while this thread accumulates results.
+    out = torch.zeros((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
+    out_div = torch.zeros((samples.shape[0], 1, out.shape[2], out.shape[3]), device=output_device)
+    feather = round(overlap * upscale_amount)
+
+    groups = {}
+    for b, y, x in tiled_scale_tiles(samples.shape, tile_x, tile_y, overlap):
+        s_shape = samples[b:b+1,:,y:y+tile_y,x:x+tile_x].shape
+        groups.setdefault(s_shape, []).append((b, y, x))
+    batches = [tiles[i:i + tile_batch_size] for tiles in groups.values() for i in range(0, len(tiles), tile_batch_size)]
+
+    def run(tiles):
+        s_in = torch.cat([samples[b:b+1,:,y:y+tile_y,x:x+tile_x] for b, y, x in tiles])
+        return tiles, function(s_in).to(output_device)
+
+    masks = {}
+    def accumulate(tiles, ps):
+        if ps.shape[2:] not in masks:
+            masks[ps.shape[2:]] = (feather_window(ps.shape[2], feather)[:, None] * feather_window(ps.shape[3], feather)[None, :]).to(ps)
+        mask = masks[ps.shape[2:]]
+        for i, (b, y, x) in enumerate(tiles):
+            area = (slice(b, b+1), slice(None), slice(round(y*upscale_amount), round((y+tile_y)*upscale_amount)), slice(round(x*upscale_amount), round((x+tile_x)*upscale_amount)))
+            out[area].addcmul_(ps[i:i+1], mask)
+            out_div[area] += mask
+        if pbar is not None:
+            pbar.update(len(tiles))
+
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for tiles, ps in executor.map(run, batches):
+                accumulate(tiles, ps)
+    else:
+        for tiles in batches:
+            accumulate(*run(tiles))
+
+    return out.div_(out_div)
 
 PROGRESS_BAR_ENABLED = True
 def set_progress_bar_enabled(enabled):
@@ -80,8 +80,15 @@ def _bilateral_blur(
     sigma_space: tuple[float, float] | Tensor,
     border_type: str = 'reflect',
     color_distance_type: str = 'l1',
+    method: str = 'unfold',
 ) -> Tensor:
 
+    if method == 'shifted':
+        return _bilateral_blur_shifted(input, guidance, kernel_size, sigma_color, sigma_space, border_type,
+                                       color_distance_type)
+    if method != 'unfold':
+        raise ValueError("method only accepts unfold or shifted")
+
     if isinstance(sigma_color, Tensor):
         sigma_color = sigma_color.to(device=input.device, dtype=input.dtype).view(-1, 1, 1, 1, 1)
 
@@ -115,6 +122,57 @@ def _bilateral_blur(
     return out
 
 
+def _bilateral_blur_shifted(
+    input: Tensor,
+    guidance: Tensor | None,
+    kernel_size: tuple[int, int] | int,
+    sigma_color: float | Tensor,
+    sigma_space: tuple[float, float] | Tensor,
+    border_type: str = 'reflect',
+    color_distance_type: str = 'l1',
+) -> Tensor:
+    # Same result as the unfold version, but the kernel window is visited one offset at a time and
+    # accumulated into (B, C, H, W) buffers instead of materializing a (B, C, H, W, Ky x Kx) tensor.
+
+    if color_distance_type not in ('l1', 'l2'):
+        raise ValueError("color_distance_type only acceps l1 or l2")
+
+    if isinstance(sigma_color, Tensor):
+        sigma_color = sigma_color.to(device=input.device, dtype=input.dtype).view(-1, 1, 1, 1)
+
+    ky, kx = _unpack_2d_ks(kernel_size)
+    pad_y, pad_x = _compute_zero_padding(kernel_size)
+    H, W = input.shape[-2:]
+
+    padded_input = pad(input, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
+    if guidance is None:
+        guidance = input
+        padded_guidance = padded_input
+    else:
+        padded_guidance = pad(guidance, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
+
+    space_kernel = get_gaussian_kernel2d(kernel_size, sigma_space, device=input.device, dtype=input.dtype)
+    space_kernel = space_kernel.view(ky, kx).tolist()
+    color_scale = -0.5 / sigma_color**2
+
+    numerator = torch.zeros_like(input)
+    denominator = torch.zeros_like(input[:, :1])
+
+    for dy in range(ky):
+        for dx in range(kx):
+            diff = padded_guidance[:, :, dy:dy + H, dx:dx + W] - guidance
+            if color_distance_type == "l1":
+                color_distance_sq = diff.abs_().sum(1, keepdim=True).square_()
+            else:
+                color_distance_sq = diff.square_().sum(1, keepdim=True)
+            kernel = (color_scale * color_distance_sq).exp_().mul_(space_kernel[dy][dx])  # (B, 1, H, W)
+
+            numerator.addcmul_(padded_input[:, :, dy:dy + H, dx:dx + W], kernel)
+            denominator.add_(kernel)
+
+    return numerator / denominator
+
+
 def bilateral_blur(
     input: Tensor,
     kernel_size: tuple[int, int] | int = (13, 13),
@@ -126,7 +184,7 @@ def bilateral_blur(
     return _bilateral_blur(input, None, kernel_size, sigma_color, sigma_space, border_type, color_distance_type)
 
 
-def adaptive_anisotropic_filter(x, g=None):
+def adaptive_anisotropic_filter(x, g=None, method='unfold'):
     if g is None:
         g = x
     s, m = torch.std_mean(g, dim=(1, 2, 3), keepdim=True)
@@ -137,7 +195,8 @@ def adaptive_anisotropic_filter(x, g=None):
                         sigma_color=3.0,
                         sigma_space=3.0,
                         border_type='reflect',
-                        color_distance_type='l1')
+                        color_distance_type='l1',
+                        method=method)
     return y
 
 
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+
+asset_index_filename = 'asset_index.json'
+
+# a directory changed this recently may change again within the resolution of its mtime, it is listed again next time
+MTIME_SETTLE_NS = 2 * 10 ** 9
+
+
+class AssetIndex:
+    """Listings of the model, LoRA, VAE and wildcard folders, persisted between launches.
+
+    Each directory is only listed again when its mtime changed, so refreshing an unchanged
+    tree costs one stat per directory. Files are found by name without probing every folder.
+    Some mounts do not update the mtime of a directory when files are added, rebuild() lists
+    every directory again. Directories not walked since the last save are not saved again.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        # {directory: {'mtime_ns', 'files': [name, sorted case insensitive], 'dirs': [name of subdirectory to walk]}}
+        self.directories = {}
+        # {folder: {relative path: resolved absolute path or None until first looked up}}
+        self.folder_files = {}
+        # directories listed or reused since the last save
+        self.visited = set()
+        self.lock = threading.RLock()
+        self.loaded = filename is None
+        self.dirty = False
+        self.listed = 0
+        self.reused = 0
+
+    def load(self):
+        self.loaded = True
+        try:
+            if os.path.exists(self.filename):
+                with open(self.filename, 'rt', encoding='utf-8') as fp:
+                    self.directories = json.load(fp)
+        except Exception as e:
+            print(f'[Asset Index] Loading failed: {e}')
+
+    def rebuild(self):
+        """Drop all listings, every directory is listed again when next walked.
+        """
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            self.directories = {}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            stale = [path for path in self.directories if path not in self.visited]
+            for path in stale:
+                del self.directories[path]
+            self.visited = set()
+            if stale:
+                self.dirty = True
+            if self.filename is None or not self.dirty:
+                return
+            self.dirty = False
+            directories = dict(self.directories)
+
+        try:
+            with open(self.filename + '.tmp', 'wt', encoding='utf-8') as fp:
+                json.dump(directories, fp)
+            os.replace(self.filename + '.tmp', self.filename)
+        except Exception as e:
+            print(f'[Asset Index] Saving failed: {e}')
+
+    def list_directory(self, path):
+        """Files and subdirectories of path the way os.walk sees them, None if it can not be listed.
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        self.visited.add(path)
+        listing = self.directories.get(path, None)
+        if listing is not None and listing['mtime_ns'] == mtime_ns:
+            self.reused += 1
+            return listing
+
+        files, dirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry.name)
+                        continue
+                    try:
+                        is_symlink = entry.is_symlink()
+                    except OSError:
+                        is_symlink = False
+                    if not is_symlink:
+                        dirs.append(entry.name)
+        except OSError:
+            self.visited.discard(path)
+            return None
+
+        settled = time.time_ns() - mtime_ns > MTIME_SETTLE_NS
+        listing = {'mtime_ns': mtime_ns if settled else None, 'files': sorted(files, key=lambda s: s.casefold()),
+                   'dirs': dirs}
+        self.directories[path] = listing
+        self.dirty = True
+        self.listed += 1
+        return listing
+
+    def walk(self, path, relative_path, result):
+        # bottom-up like os.walk(topdown=False)
+        listing = self.list_directory(path)
+        if listing is None:
+            return
+        for name in listing['dirs']:
+            self.walk(os.path.join(path, name), os.path.join(relative_path, name), result)
+        result.append((relative_path, listing['files']))
+
+    def get_files_from_folder(self, folder_path, extensions=None, name_filter=None):
+        """Same as extra_utils.get_files_from_folder, from the index.
+        """
+        if not os.path.isdir(folder_path):
+            raise ValueError("Folder path is not a valid directory.")
+
+        with self.lock:
+            if not self.loaded:
+                self.load()
+
+            listings = []
+            self.walk(folder_path, '', listings)
+
+            folder_files = {}
+            filenames = []
+            for relative_path, files in listings:
+                for filename in files:
+                    path = os.path.join(relative_path, filename)
+                    folder_files[path] = None
+                    name, file_extension = os.path.splitext(filename)
+                    if (extensions is None or file_extension.lower() in extensions) and (name_filter is None or name_filter in name):
+                        filenames.append(path)
+
+            previous = self.folder_files.get(folder_path, {})
+            self.folder_files[folder_path] = {k: previous.get(k, None) for k in folder_files}
+
+        return filenames
+
+    def find_file(self, name, folders):
+        """Resolved path of name in the first of folders listing it, None if that can not be told from the index.
+        """
+        with self.lock:
+            for folder in folders:
+                files = self.folder_files.get(folder, None)
+                if files is None:
+                    return None
+                if name in files:
+                    if files[name] is None:
+                        files[name] = os.path.abspath(os.path.realpath(os.path.join(folder, name)))
+                    return files[name]
+        return None
+
+    def stats(self):
+        return {
+            'directories': len(self.directories),
+            'listed': self.listed,
+            'reused': self.reused,
+        }
+
+
+asset_index = AssetIndex(asset_index_filename)
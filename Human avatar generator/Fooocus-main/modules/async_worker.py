@@ -1,10 +1,16 @@
 import threading
 
+import args_manager
 from extras.inpaint_mask import generate_mask_from_image, SAMOptions
-from modules.patch import PatchSettings, patch_settings, patch_all
+from modules.task_queue import TaskQueue, YieldList
 import modules.config
 
-patch_all()
+# read once, the worker thread started at the end of this module must agree with the import
+lazy_load = args_manager.args.lazy_load
+
+if not lazy_load:
+    from modules.patch import patch_all
+    patch_all()
 
 
 class AsyncTask:
@@ -15,12 +21,17 @@ class AsyncTask:
         import args_manager
 
         self.args = args.copy()
-        self.yields = []
+        self.yields = YieldList()
         self.results = []
         self.last_stop = False
         self.processing = False
+        self.priority = 0
+        self.user = None
+        self.queue_position = None
+        self.preview_throttle = None
 
         self.performance_loras = []
+        self.image_batch_size = modules.config.default_image_batch_size
 
         if len(args) == 0:
             return
@@ -158,7 +169,7 @@ class AsyncTask:
         self.images_to_enhance_count = 0
         self.enhance_stats = {}
 
-async_tasks = []
+async_tasks = TaskQueue()
 
 
 class EarlyReturnException(BaseException):
@@ -168,6 +179,12 @@ class EarlyReturnException(BaseException):
 def worker():
     global async_tasks
 
+    if lazy_load:
+        # torch, ldm_patched and the models are only loaded once there is something to generate
+        async_tasks.wait()
+        from modules.patch import patch_all
+        patch_all()
+
     import os
     import traceback
     import math
@@ -180,9 +197,11 @@ def worker():
     import cv2
     import modules.default_pipeline as pipeline
     import modules.core as core
+    import modules.hash_cache
     import modules.flags as flags
     import modules.patch
     import ldm_patched.modules.model_management
+    from modules.patch import PatchSettings, patch_settings
     import extras.preprocessors as preprocessors
     import modules.inpaint_worker as inpaint_worker
     import modules.constants as constants
@@ -192,7 +211,8 @@ def worker():
 
     from extras.censor import default_censor
     from modules.sdxl_styles import apply_style, get_random_style, fooocus_expansion, apply_arrays, random_style_name
-    from modules.private_logger import log
+    from modules.private_logger import log, wait_for_images
+    from modules.preview import PreviewThrottle
     from extras.expansion import safe_str
     from modules.util import (remove_empty_str, HWC3, resize_image, get_image_shape_ceil, set_image_shape_ceil,
                               get_shape_ceil, resample_image, erode_or_dilate, parse_lora_references_from_prompt,
@@ -239,6 +259,7 @@ def worker():
         if len(async_task.results) < 2:
             return
 
+        wait_for_images(async_task.results)
         for img in async_task.results:
             if isinstance(img, str) and os.path.exists(img):
                 img = cv2.imread(img)
@@ -281,6 +302,8 @@ def worker():
                      denoising_strength, final_scheduler_name, goals, initial_latent, steps, switch, positive_cond,
                      negative_cond, task, loras, tiled, use_expansion, width, height, base_progress, preparation_steps,
                      total_count, show_intermediate_results, persist_image=True):
+        # task may also be a list of tasks sampled together, see get_task_batches
+        batch = task if isinstance(task, list) else [task]
         if async_task.last_stop is not False:
             ldm_patched.modules.model_management.interrupt_current_processing()
         if 'cn' in goals:
@@ -299,7 +322,7 @@ def worker():
             switch=switch,
             width=width,
             height=height,
-            image_seed=task['task_seed'],
+            image_seed=[t['task_seed'] for t in batch] if len(batch) > 1 else batch[0]['task_seed'],
             callback=callback,
             sampler_name=async_task.sampler_name,
             scheduler_name=final_scheduler_name,
@@ -308,22 +331,48 @@ def worker():
             tiled=tiled,
             cfg_scale=async_task.cfg_scale,
             refiner_swap_method=async_task.refiner_swap_method,
-            disable_preview=async_task.disable_preview
+            disable_preview=async_task.disable_preview,
+            preview_throttle=async_task.preview_throttle
         )
         del positive_cond, negative_cond  # Save memory
         if inpaint_worker.current_task is not None:
             imgs = [inpaint_worker.current_task.post_process(x) for x in imgs]
-        current_progress = int(base_progress + (100 - preparation_steps) / float(all_steps) * steps)
+        current_progress = int(base_progress + (100 - preparation_steps) / float(all_steps) * steps * len(batch))
         if modules.config.default_black_out_nsfw or async_task.black_out_nsfw:
             progressbar(async_task, current_progress, 'Checking for NSFW content ...')
             imgs = default_censor(imgs)
-        progressbar(async_task, current_progress, f'Saving image {current_task_id + 1}/{total_count} to system ...')
-        img_paths = save_and_log(async_task, height, imgs, task, use_expansion, width, loras, persist_image)
+        if len(batch) > 1:
+            progressbar(async_task, current_progress, f'Saving images {current_task_id + 1}-{current_task_id + len(batch)}/{total_count} to system ...')
+        else:
+            progressbar(async_task, current_progress, f'Saving image {current_task_id + 1}/{total_count} to system ...')
+        img_paths = []
+        for img, t in zip(imgs, batch):
+            img_paths += save_and_log(async_task, height, [img], t, use_expansion, width, loras, persist_image)
         yield_result(async_task, img_paths, current_progress, async_task.black_out_nsfw, False,
                      do_not_show_finished_images=not show_intermediate_results or async_task.disable_intermediate_results)
 
         return imgs, img_paths, current_progress
 
+    def get_task_batches(async_task, goals, tasks):
+        """Group consecutive tasks that can be sampled as one batch.
+
+        Only plain text-to-image tasks with a sampler from flags.batch_compatible_samplers are
+        grouped, so every image still depends on its own seed only.
+        """
+        if async_task.image_batch_size <= 1 or len(goals) > 0 \
+                or async_task.sampler_name not in flags.batch_compatible_samplers:
+            return [[task] for task in tasks]
+
+        batches = []
+        for task in tasks:
+            if len(batches) > 0 and len(batches[-1]) < async_task.image_batch_size \
+                    and pipeline.can_concat_conds([t['c'] for t in batches[-1] + [task]]) \
+                    and pipeline.can_concat_conds([t['uc'] for t in batches[-1] + [task]]):
+                batches[-1].append(task)
+            else:
+                batches.append([task])
+        return batches
+
     def apply_patch_settings(async_task):
         patch_settings[pid] = PatchSettings(
             async_task.sharpness,
@@ -331,7 +380,10 @@ def worker():
             async_task.adm_scaler_positive,
             async_task.adm_scaler_negative,
             async_task.controlnet_softness,
-            async_task.adaptive_cfg
+            async_task.adaptive_cfg,
+            modules.config.default_sharpness_filter,
+            modules.config.deep_cache_interval if async_task.performance_selection == Performance.DEEP_CACHE else 0,
+            modules.config.deep_cache_shallow_blocks
         )
 
     def save_and_log(async_task, height, imgs, task, use_expansion, width, loras, persist_image=True) -> list:
@@ -575,8 +627,6 @@ def worker():
         if advance_progress:
             current_progress += 1
         progressbar(async_task, current_progress, f'Upscaling image from {str((W, H))} ...')
-        uov_input_image = perform_upscale(uov_input_image)
-        print(f'Image upscaled.')
         if '1.5x' in uov_method:
             f = 1.5
         elif '2x' in uov_method:
@@ -584,6 +634,8 @@ def worker():
         else:
             f = 1.0
         shape_ceil = get_shape_ceil(H * f, W * f)
+        uov_input_image = perform_upscale(uov_input_image, scale=max(f, 1024 / get_shape_ceil(H, W)))
+        print(f'Image upscaled.')
         if shape_ceil < 1024:
             print(f'[Upscale] Image is resized because it is too small.')
             uov_input_image = set_image_shape_ceil(uov_input_image, 1024)
@@ -663,6 +715,8 @@ def worker():
                                     loras=loras, base_model_additional_loras=base_model_additional_loras,
                                     use_synthetic_refiner=use_synthetic_refiner, vae_name=async_task.vae_name)
         pipeline.set_clip_skip(async_task.clip_skip)
+        if async_task.save_metadata_to_images:
+            modules.hash_cache.request_model_hashes(async_task.base_model_name, async_task.refiner_model_name, loras)
         if advance_progress:
             current_progress += 1
         progressbar(async_task, current_progress, 'Processing prompts ...')
@@ -732,26 +786,33 @@ def worker():
         if use_expansion:
             if advance_progress:
                 current_progress += 1
-            for i, t in enumerate(tasks):
-
-                progressbar(async_task, current_progress, f'Preparing Fooocus text #{i + 1} ...')
-                expansion = pipeline.final_expansion(t['task_prompt'], t['task_seed'])
+            progressbar(async_task, current_progress, f'Preparing Fooocus text of {len(tasks)} tasks ...')
+            expansions = pipeline.final_expansion.expand_batch([t['task_prompt'] for t in tasks],
+                                                               [t['task_seed'] for t in tasks])
+            for t, expansion in zip(tasks, expansions):
                 print(f'[Prompt Expansion] {expansion}')
                 t['expansion'] = expansion
                 t['positive'] = copy.deepcopy(t['positive']) + [expansion]  # Deep copy.
         if advance_progress:
             current_progress += 1
-        for i, t in enumerate(tasks):
-            progressbar(async_task, current_progress, f'Encoding positive #{i + 1} ...')
-            t['c'] = pipeline.clip_encode(texts=t['positive'], pool_top_k=t['positive_top_k'])
+        progressbar(async_task, current_progress, f'Encoding prompts of {len(tasks)} tasks ...')
+        # positive and negative texts of every task are encoded together, the cond of each task is then
+        # assembled with its own pool_top_k as before
+        use_negative = abs(float(async_task.cfg_scale) - 1.0) >= 1e-4
+        texts_list = [t['positive'] for t in tasks]
+        pool_top_k_list = [t['positive_top_k'] for t in tasks]
+        if use_negative:
+            texts_list += [t['negative'] for t in tasks]
+            pool_top_k_list += [t['negative_top_k'] for t in tasks]
+        conds = pipeline.clip_encode_batch(texts_list, pool_top_k_list)
         if advance_progress:
             current_progress += 1
         for i, t in enumerate(tasks):
-            if abs(float(async_task.cfg_scale) - 1.0) < 1e-4:
-                t['uc'] = pipeline.clone_cond(t['c'])
-            else:
-                progressbar(async_task, current_progress, f'Encoding negative #{i + 1} ...')
-                t['uc'] = pipeline.clip_encode(texts=t['negative'], pool_top_k=t['negative_top_k'])
+            t['c'] = conds[i]
+            t['uc'] = conds[len(tasks) + i] if use_negative else pipeline.clone_cond(t['c'])
+        stats = pipeline.cond_cache.stats()
+        print(f'[CLIP Cache] {stats["entries"]} entries, {stats["size_mb"]:.1f} MB, '
+              f'hit rate {stats["hit_rate"]:.1%}')
         return tasks, use_expansion, loras, current_progress
 
     def apply_freeu(async_task):
@@ -1266,33 +1327,68 @@ def worker():
 
         preparation_steps = current_progress
         total_count = async_task.image_number
+        current_batch_size = 1
+
+        last_progress = [current_progress, 'Sampling ...']
 
         def callback(step, x0, x, total_steps, y):
             if step == 0:
                 async_task.callback_steps = 0
-            async_task.callback_steps += (100 - preparation_steps) / float(all_steps)
-            async_task.yields.append(['preview', (
-                int(current_progress + async_task.callback_steps),
-                f'Sampling step {step + 1}/{total_steps}, image {current_task_id + 1}/{total_count} ...', y)])
+            async_task.callback_steps += (100 - preparation_steps) / float(all_steps) * current_batch_size
+            if current_batch_size > 1:
+                image_text = f'images {current_task_id + 1}-{current_task_id + current_batch_size}/{total_count}'
+            else:
+                image_text = f'image {current_task_id + 1}/{total_count}'
+            last_progress[:] = [int(current_progress + async_task.callback_steps),
+                                f'Sampling step {step + 1}/{total_steps}, {image_text} ...']
+            if y is None and not preview_consumer_ready():
+                # a text only preview would get the queued preview image skipped
+                return
+            async_task.yields.append(['preview', (*last_progress, y)])
+
+        def deliver_preview(y):
+            # previews rendered in the background arrive with the progress of the step sampled meanwhile
+            async_task.yields.append(['preview', (*last_progress, y)])
+
+        def preview_consumer_ready():
+            # a preview image still waiting in yields means the consumer has not caught up
+            return not any(flag == 'preview' and product[2] is not None for flag, product in list(async_task.yields))
+
+        async_task.preview_throttle = PreviewThrottle(deliver_preview,
+                                                      min_interval=modules.config.preview_min_interval,
+                                                      every_n_steps=modules.config.preview_every_n_steps,
+                                                      asynchronous=modules.config.preview_async,
+                                                      consumer_ready=preview_consumer_ready)
 
         show_intermediate_results = len(tasks) > 1 or async_task.should_enhance
         persist_image = not async_task.should_enhance or not async_task.save_final_enhanced_image_only
 
-        for current_task_id, task in enumerate(tasks):
-            progressbar(async_task, current_progress, f'Preparing task {current_task_id + 1}/{async_task.image_number} ...')
+        next_task_id = 0
+        for batch in get_task_batches(async_task, goals, tasks):
+            current_task_id, current_batch_size = next_task_id, len(batch)
+            next_task_id += current_batch_size
+            if current_batch_size > 1:
+                progressbar(async_task, current_progress, f'Preparing tasks {current_task_id + 1}-{current_task_id + current_batch_size}/{async_task.image_number} ...')
+                positive_cond = pipeline.concat_conds([t['c'] for t in batch])
+                negative_cond = pipeline.concat_conds([t['uc'] for t in batch])
+                task = batch
+            else:
+                progressbar(async_task, current_progress, f'Preparing task {current_task_id + 1}/{async_task.image_number} ...')
+                task = batch[0]
+                positive_cond, negative_cond = task['c'], task['uc']
             execution_start_time = time.perf_counter()
 
             try:
                 imgs, img_paths, current_progress = process_task(all_steps, async_task, callback, controlnet_canny_path,
                                                                  controlnet_cpds_path, current_task_id,
                                                                  denoising_strength, final_scheduler_name, goals,
-                                                                 initial_latent, async_task.steps, switch, task['c'],
-                                                                 task['uc'], task, loras, tiled, use_expansion, width,
+                                                                 initial_latent, async_task.steps, switch, positive_cond,
+                                                                 negative_cond, task, loras, tiled, use_expansion, width,
                                                                  height, current_progress, preparation_steps,
                                                                  async_task.image_number, show_intermediate_results,
                                                                  persist_image)
 
-                current_progress = int(preparation_steps + (100 - preparation_steps) / float(all_steps) * async_task.steps * (current_task_id + 1))
+                current_progress = int(preparation_steps + (100 - preparation_steps) / float(all_steps) * async_task.steps * (current_task_id + current_batch_size))
                 images_to_enhance += imgs
 
             except ldm_patched.modules.model_management.InterruptProcessingException:
@@ -1304,10 +1400,14 @@ def worker():
                     print('User stopped')
                     break
 
-            del task['c'], task['uc']  # Save memory
+            for t in batch:
+                del t['c'], t['uc']  # Save memory
+            del positive_cond, negative_cond
             execution_time = time.perf_counter() - execution_start_time
             print(f'Generating and saving time: {execution_time:.2f} seconds')
 
+        current_batch_size = 1
+
         if not async_task.should_enhance:
             print(f'[Enhance] Skipping, preconditions aren\'t met')
             stop_processing(async_task, processing_start_time)
@@ -1463,22 +1563,23 @@ def worker():
         return
 
     while True:
-        time.sleep(0.01)
-        if len(async_tasks) > 0:
-            task = async_tasks.pop(0)
-
-            try:
-                handler(task)
-                if task.generate_image_grid:
-                    build_image_wall(task)
-                task.yields.append(['finish', task.results])
-                pipeline.prepare_text_encoder(async_call=True)
-            except:
-                traceback.print_exc()
-                task.yields.append(['finish', task.results])
-            finally:
-                if pid in modules.patch.patch_settings:
-                    del modules.patch.patch_settings[pid]
+        task = async_tasks.get()
+        metrics = async_tasks.metrics()
+        print(f'[Queue] Starting task, {metrics["depth"]} waiting, '
+              f'mean wait {metrics["mean_wait_time"]:.2f} seconds')
+
+        try:
+            handler(task)
+            if task.generate_image_grid:
+                build_image_wall(task)
+            task.yields.append(['finish', task.results])
+            pipeline.prepare_text_encoder(async_call=True)
+        except:
+            traceback.print_exc()
+            task.yields.append(['finish', task.results])
+        finally:
+            if pid in modules.patch.patch_settings:
+                del modules.patch.patch_settings[pid]
     pass
 
 
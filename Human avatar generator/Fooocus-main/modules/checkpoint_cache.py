@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+def model_bytes(model):
+    """Size of the weights of a core.StableDiffusionModel.
+    """
+    modules = [model.unet.model if model.unet is not None else None,
+               model.clip.cond_stage_model if model.clip is not None else None,
+               model.vae.first_stage_model if model.vae is not None else None,
+               model.clip_vision.model if model.clip_vision is not None else None]
+    return sum(t.nelement() * t.element_size() for m in modules if m is not None for t in m.state_dict().values())
+
+
+class CheckpointCache:
+    """LRU of loaded checkpoints, capped both by count and by the total size of their weights.
+
+    The model that was put last is never evicted, even when it alone exceeds the budget.
+    """
+
+    def __init__(self, max_bytes, max_count):
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, model, size):
+        with self.lock:
+            if key in self.entries or self.max_count == 0:
+                return
+            self.entries[key] = (model, size)
+            self.size += size
+            while len(self.entries) > 1 and (self.size > self.max_bytes or len(self.entries) > self.max_count):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'size_mb': self.size / 2 ** 20,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
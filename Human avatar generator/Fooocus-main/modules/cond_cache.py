@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import safetensors.torch
+import torch
+
+
+def model_fingerprint(filename):
+    """Cheap stable id of a checkpoint file, hashing its name, size and modification time instead of its content.
+    """
+    if filename is None or not os.path.exists(filename):
+        return str(filename)
+    stat = os.stat(filename)
+    key = f'{os.path.basename(filename)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _nbytes(result):
+    return sum(x.numel() * x.element_size() for x in result if isinstance(x, torch.Tensor))
+
+
+class CondCache:
+    """LRU cache of CLIP (cond, pooled) results.
+
+    Entries are keyed by (model, LoRAs, clip skip, text) so they stay valid across
+    model switches, and the total tensor size is capped at max_bytes. With a path,
+    every entry is also written to disk and read back on a later miss, which keeps
+    the cache warm across restarts. Files are written by a background thread, and
+    the least recently used files are deleted beyond max_disk_bytes.
+    """
+
+    def __init__(self, max_bytes, path=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        # {filename: size in bytes}, least recently used first
+        self.disk_files = OrderedDict()
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.executor = None
+
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cond_cache')
+            files = []
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.safetensors') and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime_ns, entry.path, stat.st_size))
+            for _, filename, size in sorted(files):
+                self.disk_files[filename] = size
+                self.disk_size += size
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key, None)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = self._load(key)
+        with self.lock:
+            if result is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        if result is not None:
+            self._insert(key, result)
+        return result
+
+    def put(self, key, result):
+        self._insert(key, result)
+        if self.executor is not None:
+            self.executor.submit(self._save, key, result)
+
+    def flush(self):
+        """Wait until all entries put so far are written to disk.
+        """
+        if self.executor is not None:
+            self.executor.submit(lambda: None).result()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'size_mb': self.size / 2 ** 20,
+                'disk_size_mb': self.disk_size / 2 ** 20,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+                'hit_rate': (self.hits + self.disk_hits) / total if total > 0 else 0.0,
+            }
+
+    def _insert(self, key, result):
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = result
+            self.size += _nbytes(result)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= _nbytes(evicted)
+                self.evictions += 1
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.safetensors')
+
+    def _load(self, key):
+        if self.path is None:
+            return None
+        filename = self._file(key)
+        with self.lock:
+            if filename not in self.disk_files:
+                return None
+            self.disk_files.move_to_end(filename)
+        try:
+            tensors = safetensors.torch.load_file(filename)
+            # the mtime orders the files by last use after a restart
+            os.utime(filename)
+            return tensors['cond'], tensors.get('pooled', None)
+        except Exception as e:
+            print(f'[CLIP Cache] Failed to load {filename}: {e}')
+            return None
+
+    def _save(self, key, result):
+        filename = self._file(key)
+        cond, pooled = result
+        tensors = {'cond': cond.contiguous()}
+        if pooled is not None:
+            tensors['pooled'] = pooled.contiguous()
+        try:
+            safetensors.torch.save_file(tensors, filename + '.tmp')
+            os.replace(filename + '.tmp', filename)
+            size = os.path.getsize(filename)
+        except Exception as e:
+            print(f'[CLIP Cache] Failed to save entry: {e}')
+            return
+
+        evicted = []
+        with self.lock:
+            self.disk_size += size - self.disk_files.pop(filename, 0)
+            self.disk_files[filename] = size
+            while self.max_disk_bytes is not None and self.disk_size > self.max_disk_bytes and len(self.disk_files) > 1:
+                evicted_filename, evicted_size = self.disk_files.popitem(last=False)
+                self.disk_size -= evicted_size
+                self.disk_evictions += 1
+                evicted.append(evicted_filename)
+
+        for evicted_filename in evicted:
+            try:
+                os.remove(evicted_filename)
+            except OSError:
+                pass
@@ -2,6 +2,7 @@ import os
 import json
 import math
 import numbers
+import psutil
 
 import args_manager
 import tempfile
@@ -9,7 +10,8 @@ import modules.flags
 import modules.sdxl_styles
 
 from modules.model_loader import load_file_from_url
-from modules.extra_utils import makedirs_with_log, get_files_from_folder, try_eval_env_var
+from modules.asset_index import asset_index
+from modules.extra_utils import makedirs_with_log, try_eval_env_var
 from modules.flags import OutputFormat, Performance, MetadataScheme
 
 
@@ -201,6 +203,7 @@ path_fooocus_expansion = get_dir_or_set_default('path_fooocus_expansion', '../mo
 path_wildcards = get_dir_or_set_default('path_wildcards', '../wildcards/')
 path_safety_checker = get_dir_or_set_default('path_safety_checker', '../models/safety_checker/')
 path_sam = get_dir_or_set_default('path_sam', '../models/sam/')
+path_clip_cond_cache = get_dir_or_set_default('path_clip_cond_cache', '../models/clip_cond_cache/')
 path_outputs = get_path_output()
 
 
@@ -451,6 +454,115 @@ default_image_number = get_config_item_or_set_default(
     validator=lambda x: isinstance(x, int) and 1 <= x <= default_max_image_number,
     expected_type=int
 )
+default_image_batch_size = get_config_item_or_set_default(
+    key='default_image_batch_size',
+    default_value=1,
+    validator=lambda x: isinstance(x, int) and 1 <= x <= default_max_image_number,
+    expected_type=int
+)
+clip_cond_cache_max_mb = get_config_item_or_set_default(
+    key='clip_cond_cache_max_mb',
+    default_value=256,
+    validator=lambda x: isinstance(x, int) and x >= 0,
+    expected_type=int
+)
+clip_cond_cache_persist = get_config_item_or_set_default(
+    key='clip_cond_cache_persist',
+    default_value=False,
+    validator=lambda x: isinstance(x, bool),
+    expected_type=bool
+)
+clip_cond_cache_disk_max_mb = get_config_item_or_set_default(
+    key='clip_cond_cache_disk_max_mb',
+    default_value=1024,
+    validator=lambda x: isinstance(x, int) and x >= 0,
+    expected_type=int
+)
+lora_cache_max_mb = get_config_item_or_set_default(
+    key='lora_cache_max_mb',
+    default_value=1024,
+    validator=lambda x: isinstance(x, int) and x >= 0,
+    expected_type=int
+)
+lora_delta_cache_max_mb = get_config_item_or_set_default(
+    key='lora_delta_cache_max_mb',
+    default_value=2048,
+    validator=lambda x: isinstance(x, int) and x >= 0,
+    expected_type=int
+)
+checkpoint_cache_max_count = get_config_item_or_set_default(
+    key='checkpoint_cache_max_count',
+    default_value=2,
+    validator=lambda x: isinstance(x, int) and x >= 0,
+    expected_type=int
+)
+checkpoint_cache_max_mb = get_config_item_or_set_default(
+    key='checkpoint_cache_max_mb',
+    # a quarter of the RAM, which only keeps a second SDXL checkpoint on machines with 64 GB or more
+    default_value=psutil.virtual_memory().total // 4 // 2 ** 20,
+    validator=lambda x: isinstance(x, int) and x >= 0,
+    expected_type=int
+)
+upscale_model_2x = get_config_item_or_set_default(
+    key='upscale_model_2x',
+    default_value='None',
+    validator=lambda x: isinstance(x, str),
+    expected_type=str
+)
+upscaler_reduced_scale = get_config_item_or_set_default(
+    key='upscaler_reduced_scale',
+    default_value=False,
+    validator=lambda x: isinstance(x, bool),
+    expected_type=bool
+)
+upscaler_cpu_bf16 = get_config_item_or_set_default(
+    key='upscaler_cpu_bf16',
+    default_value=False,
+    validator=lambda x: isinstance(x, bool),
+    expected_type=bool
+)
+upscaler_compile = get_config_item_or_set_default(
+    key='upscaler_compile',
+    default_value=False,
+    validator=lambda x: isinstance(x, bool),
+    expected_type=bool
+)
+preview_min_interval = get_config_item_or_set_default(
+    key='preview_min_interval',
+    default_value=0.1,
+    validator=lambda x: isinstance(x, numbers.Number) and x >= 0,
+    expected_type=numbers.Number
+)
+preview_every_n_steps = get_config_item_or_set_default(
+    key='preview_every_n_steps',
+    default_value=1,
+    validator=lambda x: isinstance(x, int) and x >= 1,
+    expected_type=int
+)
+preview_async = get_config_item_or_set_default(
+    key='preview_async',
+    default_value=True,
+    validator=lambda x: isinstance(x, bool),
+    expected_type=bool
+)
+deep_cache_interval = get_config_item_or_set_default(
+    key='deep_cache_interval',
+    default_value=3,
+    validator=lambda x: isinstance(x, int) and x >= 1,
+    expected_type=int
+)
+deep_cache_shallow_blocks = get_config_item_or_set_default(
+    key='deep_cache_shallow_blocks',
+    default_value=1,
+    validator=lambda x: isinstance(x, int) and x >= 1,
+    expected_type=int
+)
+default_sharpness_filter = get_config_item_or_set_default(
+    key='default_sharpness_filter',
+    default_value='shifted',
+    validator=lambda x: x in modules.flags.sharpness_filter_list,
+    expected_type=str
+)
 checkpoint_downloads = get_config_item_or_set_default(
     key='checkpoint_downloads',
     default_value={},
@@ -805,18 +917,21 @@ def get_model_filenames(folder_paths, extensions=None, name_filter=None):
     if not isinstance(folder_paths, list):
         folder_paths = [folder_paths]
     for folder in folder_paths:
-        files += get_files_from_folder(folder, extensions, name_filter)
+        files += asset_index.get_files_from_folder(folder, extensions, name_filter)
 
     return files
 
 
-def update_files():
+def update_files(rebuild=False):
     global model_filenames, lora_filenames, vae_filenames, wildcard_filenames, available_presets
+    if rebuild:
+        asset_index.rebuild()
     model_filenames = get_model_filenames(paths_checkpoints)
     lora_filenames = get_model_filenames(paths_loras)
     vae_filenames = get_model_filenames(path_vae)
-    wildcard_filenames = get_files_from_folder(path_wildcards, ['.txt'])
+    wildcard_filenames = asset_index.get_files_from_folder(path_wildcards, ['.txt'])
     available_presets = get_presets()
+    asset_index.save()
     return
 
 
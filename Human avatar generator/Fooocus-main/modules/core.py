@@ -11,6 +11,7 @@ import ldm_patched.modules.controlnet
 import modules.sample_hijack
 import ldm_patched.modules.samplers
 import ldm_patched.modules.latent_formats
+import ldm_patched.ldm.modules.context_kv_cache
 
 from ldm_patched.modules.sd import load_checkpoint_guess_config
 from ldm_patched.contrib.external import VAEDecode, EmptyLatentImage, VAEEncode, VAEEncodeTiled, VAEDecodeTiled, \
@@ -18,6 +19,8 @@ from ldm_patched.contrib.external import VAEDecode, EmptyLatentImage, VAEEncode,
 from ldm_patched.contrib.external_freelunch import FreeU_V2
 from ldm_patched.modules.sample import prepare_mask
 from modules.lora import match_lora
+from modules.lora_cache import TensorLRU, merged_deltas, merged_deltas_nbytes
+from modules.cond_cache import model_fingerprint
 from modules.util import get_file_from_folder_list
 from ldm_patched.modules.lora import model_lora_keys_unet, model_lora_keys_clip
 from modules.config import path_embeddings
@@ -33,6 +36,11 @@ opFreeU = FreeU_V2()
 opModelSamplingDiscrete = ModelSamplingDiscrete()
 opModelSamplingContinuousEDM = ModelSamplingContinuousEDM()
 
+# Parsed LoRA files matched against a model, keyed by (LoRA file, model file).
+lora_file_cache = TensorLRU(max_bytes=modules.config.lora_cache_max_mb * 2 ** 20)
+# Fully merged UNet/CLIP weight deltas, keyed by (model file, LoRA files and weights).
+lora_delta_cache = TensorLRU(max_bytes=modules.config.lora_delta_cache_max_mb * 2 ** 20)
+
 
 class StableDiffusionModel:
     def __init__(self, unet=None, vae=None, clip=None, clip_vision=None, filename=None, vae_filename=None):
@@ -92,10 +100,58 @@ class StableDiffusionModel:
         self.unet_with_lora = self.unet.clone() if self.unet is not None else None
         self.clip_with_lora = self.clip.clone() if self.clip is not None else None
 
+        if len(loras_to_load) == 0:
+            return
+
+        model_key = model_fingerprint(self.filename)
+        delta_key = (model_key, tuple((model_fingerprint(f), w) for f, w in loras_to_load))
+        patches = lora_delta_cache.get(delta_key)
+
+        if patches is not None:
+            print(f'Reused merged LoRA weights for model [{self.filename}].')
+        else:
+            patches = self.match_loras(loras_to_load, model_key)
+
+            # dense deltas are far bigger than the low-rank patches, only worth building when they can be cached
+            dense_bytes = merged_deltas_nbytes(self.unet, patches['unet'])
+            if self.clip is not None:
+                dense_bytes += merged_deltas_nbytes(self.clip.patcher, patches['clip'])
+
+            if 0 < dense_bytes <= lora_delta_cache.max_bytes:
+                # deltas must be taken against the original weights, not the ones of a LoRA set still patched in
+                ldm_patched.modules.model_management.unload_model_clones(self.unet)
+                if self.clip is not None:
+                    ldm_patched.modules.model_management.unload_model_clones(self.clip.patcher)
+                patches = {
+                    'unet': merged_deltas(self.unet, patches['unet'], self.unet.load_device),
+                    'clip': merged_deltas(self.clip.patcher, patches['clip'], self.clip.patcher.load_device)
+                    if self.clip is not None else {}
+                }
+                lora_delta_cache.put(delta_key, patches)
+
+        for patcher, component_patches in [(self.unet_with_lora, patches['unet']),
+                                           (self.clip_with_lora.patcher if self.clip_with_lora is not None else None,
+                                            patches['clip'])]:
+            if patcher is None:
+                continue
+            for key, key_patches in component_patches.items():
+                patcher.patches[key] = patcher.patches.get(key, []) + key_patches
+
+    def match_loras(self, loras_to_load, model_key):
+        patches = {'unet': {}, 'clip': {}}
+
         for lora_filename, weight in loras_to_load:
-            lora_unmatch = ldm_patched.modules.utils.load_torch_file(lora_filename, safe_load=False)
-            lora_unet, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_unet)
-            lora_clip, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_clip)
+            cache_key = (model_fingerprint(lora_filename), model_key)
+            matched = lora_file_cache.get(cache_key)
+
+            if matched is None:
+                lora_unmatch = ldm_patched.modules.utils.load_torch_file(lora_filename, safe_load=False)
+                lora_unet, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_unet)
+                lora_clip, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_clip)
+                matched = (lora_unet, lora_clip, lora_unmatch)
+                lora_file_cache.put(cache_key, matched)
+
+            lora_unet, lora_clip, lora_unmatch = matched
 
             if len(lora_unmatch) > 12:
                 # model mismatch
@@ -105,21 +161,23 @@ class StableDiffusionModel:
                 print(f'Loaded LoRA [{lora_filename}] for model [{self.filename}] '
                       f'with unmatched keys {list(lora_unmatch.keys())}')
 
-            if self.unet_with_lora is not None and len(lora_unet) > 0:
-                loaded_keys = self.unet_with_lora.add_patches(lora_unet, weight)
-                print(f'Loaded LoRA [{lora_filename}] for UNet [{self.filename}] '
+            for name, title, patcher, lora in [
+                ('unet', 'UNet', self.unet_with_lora, lora_unet),
+                ('clip', 'CLIP', self.clip_with_lora.patcher if self.clip_with_lora is not None else None, lora_clip)
+            ]:
+                if patcher is None or len(lora) == 0:
+                    continue
+                # same filtering as ModelPatcher.add_patches, collected so the set can be merged once
+                loaded_keys = {k for k in lora if k in patcher.model_keys}
+                for k in loaded_keys:
+                    patches[name].setdefault(k, []).append((weight, lora[k], 1.0))
+                print(f'Loaded LoRA [{lora_filename}] for {title} [{self.filename}] '
                       f'with {len(loaded_keys)} keys at weight {weight}.')
-                for item in lora_unet:
+                for item in lora:
                     if item not in loaded_keys:
-                        print("UNet LoRA key skipped: ", item)
+                        print(f'{title} LoRA key skipped: ', item)
 
-            if self.clip_with_lora is not None and len(lora_clip) > 0:
-                loaded_keys = self.clip_with_lora.add_patches(lora_clip, weight)
-                print(f'Loaded LoRA [{lora_filename}] for CLIP [{self.filename}] '
-                      f'with {len(loaded_keys)} keys at weight {weight}.')
-                for item in lora_clip:
-                    if item not in loaded_keys:
-                        print("CLIP LoRA key skipped: ", item)
+        return patches
 
 
 @torch.no_grad()
@@ -265,7 +323,8 @@ def get_previewer(model):
 def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sampler_name='dpmpp_2m_sde_gpu',
              scheduler='karras', denoise=1.0, disable_noise=False, start_step=None, last_step=None,
              force_full_denoise=False, callback_function=None, refiner=None, refiner_switch=-1,
-             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, disable_preview=False):
+             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, disable_preview=False,
+             preview_throttle=None):
 
     if sigmas is not None:
         sigmas = sigmas.clone().to(ldm_patched.modules.model_management.get_torch_device())
@@ -274,6 +333,10 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
 
     if disable_noise:
         noise = torch.zeros(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, device="cpu")
+    elif isinstance(seed, list):
+        # One seed per image, so every image gets exactly the noise it would get when sampled alone.
+        noise = torch.cat([ldm_patched.modules.sample.prepare_noise(latent_image[i:i + 1], s)
+                           for i, s in enumerate(seed)])
     else:
         batch_inds = latent["batch_index"] if "batch_index" in latent else None
         noise = ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
@@ -297,7 +360,10 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
         ldm_patched.modules.model_management.throw_exception_if_processing_interrupted()
         y = None
         if previewer is not None and not disable_preview:
-            y = previewer(x0, previewer_start + step, previewer_end)
+            if preview_throttle is None:
+                y = previewer(x0, previewer_start + step, previewer_end)
+            elif preview_throttle(previewer_start + step, previewer_end):
+                y = preview_throttle.render(previewer, x0, previewer_start + step, previewer_end)
         if callback_function is not None:
             callback_function(previewer_start + step, x0, x, previewer_end, y)
 
@@ -305,6 +371,7 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
     modules.sample_hijack.current_refiner = refiner
     modules.sample_hijack.refiner_switch_step = refiner_switch
     ldm_patched.modules.samplers.sample = modules.sample_hijack.sample_hacked
+    ldm_patched.ldm.modules.context_kv_cache.context_kv_cache.clear()
 
     try:
         samples = ldm_patched.modules.sample.sample(model,
@@ -315,12 +382,17 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
                                                     last_step=last_step,
                                                     force_full_denoise=force_full_denoise, noise_mask=noise_mask,
                                                     callback=callback,
-                                                    disable_pbar=disable_pbar, seed=seed, sigmas=sigmas)
+                                                    disable_pbar=disable_pbar,
+                                                    seed=seed[0] if isinstance(seed, list) else seed,
+                                                    sigmas=sigmas)
 
         out = latent.copy()
         out["samples"] = samples
     finally:
         modules.sample_hijack.current_refiner = None
+        ldm_patched.ldm.modules.context_kv_cache.context_kv_cache.clear()
+        if preview_throttle is not None:
+            preview_throttle.flush()
 
     return out
 
@@ -0,0 +1,50 @@
+class DeepCache:
+    """Reuse of the deep UNet features between sampling steps, after DeepCache.
+
+    The high level features of the UNet change slowly from one step to the next. Every interval
+    steps the UNet runs in full and the input of its last shallow_blocks output blocks is kept,
+    in between only the first shallow_blocks input blocks and the last shallow_blocks output
+    blocks run, on the kept features and the fresh skip connections.
+
+    Steps are told apart by their timestep. A timestep higher than the last one starts a new
+    sampling run and drops the kept features. Model calls within a step (cond and uncond apart,
+    a base and a refiner model) are kept apart by their order in the step, model and shape.
+    """
+
+    def __init__(self, interval=3, shallow_blocks=1):
+        self.interval = max(1, int(interval))
+        self.shallow_blocks = max(1, int(shallow_blocks))
+        self.features = {}
+        self.last_timestep = None
+        self.step = 0
+        self.call = 0
+        self.hits = 0
+        self.misses = 0
+
+    def begin(self, model, timestep, shape):
+        """Key of this model call, and whether it may reuse the features kept under that key.
+        """
+        if timestep != self.last_timestep:
+            if self.last_timestep is None or timestep > self.last_timestep:
+                self.features.clear()
+                self.step = 0
+            else:
+                self.step += 1
+            self.last_timestep = timestep
+            self.call = 0
+        else:
+            self.call += 1
+
+        key = (id(model), self.call, tuple(shape))
+        reuse = self.step % self.interval != 0 and key in self.features
+        if reuse:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return key, reuse
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -1,5 +1,7 @@
 import modules.core as core
 import os
+import copy
+import math
 import torch
 import modules.patch
 import modules.config
@@ -12,6 +14,10 @@ from extras.expansion import FooocusExpansion
 
 from ldm_patched.modules.model_base import SDXL, SDXLRefiner
 from modules.sample_hijack import clip_separate
+from modules.cond_cache import CondCache, model_fingerprint
+from modules.checkpoint_cache import CheckpointCache, model_bytes
+from modules.patch_clip import encode_token_weights_batched
+from ldm_patched.modules.sdxl_clip import SDXLClipModel
 from modules.util import get_file_from_folder_list, get_enabled_loras
 
 
@@ -27,6 +33,13 @@ final_refiner_vae = None
 
 loaded_ControlNets = {}
 
+cond_cache = CondCache(max_bytes=modules.config.clip_cond_cache_max_mb * 2 ** 20,
+                       path=modules.config.path_clip_cond_cache if modules.config.clip_cond_cache_persist else None,
+                       max_disk_bytes=modules.config.clip_cond_cache_disk_max_mb * 2 ** 20)
+cond_cache_model_key = None
+checkpoint_cache = CheckpointCache(max_bytes=modules.config.checkpoint_cache_max_mb * 2 ** 20,
+                                   max_count=modules.config.checkpoint_cache_max_count)
+
 
 @torch.no_grad()
 @torch.inference_mode()
@@ -57,6 +70,20 @@ def assert_model_integrity():
     return True
 
 
+@torch.no_grad()
+@torch.inference_mode()
+def load_model_cached(filename, vae_filename=None):
+    key = (filename, model_fingerprint(filename), vae_filename)
+    model = checkpoint_cache.get(key)
+    if model is not None:
+        print(f'Model reused from RAM cache: {filename}')
+        return model
+
+    model = core.load_model(filename, vae_filename)
+    checkpoint_cache.put(key, model, model_bytes(model))
+    return model
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def refresh_base_model(name, vae_name=None):
@@ -71,7 +98,7 @@ def refresh_base_model(name, vae_name=None):
     if model_base.filename == filename and model_base.vae_filename == vae_filename:
         return
 
-    model_base = core.load_model(filename, vae_filename)
+    model_base = load_model_cached(filename, vae_filename)
     print(f'Base model loaded: {model_base.filename}')
     print(f'VAE loaded: {model_base.vae_filename}')
     return
@@ -93,7 +120,9 @@ def refresh_refiner_model(name):
         print(f'Refiner unloaded.')
         return
 
-    model_refiner = core.load_model(filename)
+    # a shallow copy, the cached model keeps its clip and vae for when it is used as base model again
+    model_refiner = copy.copy(load_model_cached(filename))
+    model_refiner.visited_loras = ''
     print(f'Refiner model loaded: {model_refiner.filename}')
 
     if isinstance(model_refiner.unet.model, SDXL):
@@ -144,18 +173,48 @@ def refresh_loras(loras, base_model_additional_loras=None):
 
 @torch.no_grad()
 @torch.inference_mode()
-def clip_encode_single(clip, text, verbose=False):
-    cached = clip.fcs_cond_cache.get(text, None)
-    if cached is not None:
-        if verbose:
-            print(f'[CLIP Cached] {text}')
-        return cached
-    tokens = clip.tokenize(text)
-    result = clip.encode_from_tokens(tokens, return_pooled=True)
-    clip.fcs_cond_cache[text] = result
-    if verbose:
-        print(f'[CLIP Encoded] {text}')
-    return result
+def clip_encode_texts(clip, texts):
+    """Encode all uncached texts in as few forward passes as possible and return {text: (cond, pooled)}.
+    """
+    results = {}
+    missing = []
+    for text in texts:
+        if text in results or text in missing:
+            continue
+        cached = cond_cache.get((cond_cache_model_key, clip.layer_idx, text))
+        if cached is not None:
+            results[text] = cached
+        else:
+            missing.append(text)
+
+    if len(missing) == 0:
+        return results
+
+    model = clip.cond_stage_model
+    if not isinstance(model, SDXLClipModel) or len(missing) == 1:
+        for text in missing:
+            result = clip.encode_from_tokens(clip.tokenize(text), return_pooled=True)
+            cond_cache.put((cond_cache_model_key, clip.layer_idx, text), result)
+            results[text] = result
+        return results
+
+    if clip.layer_idx is not None:
+        model.clip_layer(clip.layer_idx)
+    else:
+        model.reset_clip_layer()
+    clip.load_model()
+
+    tokens = [clip.tokenize(text) for text in missing]
+    g = encode_token_weights_batched(model.clip_g, [t['g'] for t in tokens])
+    l = encode_token_weights_batched(model.clip_l, [t['l'] for t in tokens])
+
+    for text, (g_out, g_pooled), (l_out, _) in zip(missing, g, l):
+        result = torch.cat([l_out, g_out], dim=-1), g_pooled
+        cond_cache.put((cond_cache_model_key, clip.layer_idx, text), result)
+        results[text] = result
+
+    print(f'[CLIP Encoded] {len(missing)} texts in one batch')
+    return results
 
 
 @torch.no_grad()
@@ -189,16 +248,73 @@ def clip_encode(texts, pool_top_k=1):
     if len(texts) == 0:
         return None
 
-    cond_list = []
-    pooled_acc = 0
+    return clip_encode_batch([texts], [pool_top_k])[0]
 
-    for i, text in enumerate(texts):
-        cond, pooled = clip_encode_single(final_clip, text)
-        cond_list.append(cond)
-        if i < pool_top_k:
-            pooled_acc += pooled
 
-    return [[torch.cat(cond_list, dim=1), {"pooled_output": pooled_acc}]]
+@torch.no_grad()
+@torch.inference_mode()
+def clip_encode_batch(texts_list, pool_top_k_list):
+    """clip_encode for several prompts at once, encoding the texts of all of them together.
+    """
+    global final_clip
+
+    if final_clip is None:
+        return [None] * len(texts_list)
+
+    encoded = clip_encode_texts(final_clip, [text for texts in texts_list if isinstance(texts, list) for text in texts])
+
+    results = []
+    for texts, pool_top_k in zip(texts_list, pool_top_k_list):
+        if not isinstance(texts, list) or len(texts) == 0:
+            results.append(None)
+            continue
+
+        cond_list = []
+        pooled_acc = 0
+
+        for i, text in enumerate(texts):
+            cond, pooled = encoded[text]
+            cond_list.append(cond)
+            if i < pool_top_k:
+                pooled_acc += pooled
+
+        results.append([[torch.cat(cond_list, dim=1), {"pooled_output": pooled_acc}]])
+
+    return results
+
+
+def _token_repeats(conds):
+    lengths = [cond[0][0].shape[1] for cond in conds]
+    lcm = 1
+    for length in lengths:
+        lcm = lcm * length // math.gcd(lcm, length)
+    return [lcm // length for length in lengths]
+
+
+def can_concat_conds(conds):
+    if len(conds) < 2:
+        return True
+    if any(len(cond) != 1 or set(cond[0][1].keys()) != {'pooled_output'} for cond in conds):
+        return False
+    # Same bound as CONDCrossAttn.can_concat: repeating tokens too often slows down cross attention.
+    return max(_token_repeats(conds)) <= 4
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def concat_conds(conds):
+    """Stack the conds of several prompts into one batch.
+
+    Longer prompts have more 77-token chunks, so shorter ones are repeated up to the
+    least common multiple of the lengths, which leaves cross attention unchanged.
+    """
+    if len(conds) == 1:
+        return conds[0]
+
+    repeats = _token_repeats(conds)
+    c = torch.cat([cond[0][0].repeat(1, r, 1) for cond, r in zip(conds, repeats)], dim=0)
+    pooled = torch.cat([cond[0][1]['pooled_output'] for cond in conds], dim=0)
+    return [[c, {'pooled_output': pooled}]]
 
 
 @torch.no_grad()
@@ -212,12 +328,6 @@ def set_clip_skip(clip_skip: int):
     final_clip.clip_layer(-abs(clip_skip))
     return
 
-@torch.no_grad()
-@torch.inference_mode()
-def clear_all_caches():
-    final_clip.fcs_cond_cache = {}
-
-
 @torch.no_grad()
 @torch.inference_mode()
 def prepare_text_encoder(async_call=True):
@@ -233,7 +343,8 @@ def prepare_text_encoder(async_call=True):
 @torch.inference_mode()
 def refresh_everything(refiner_model_name, base_model_name, loras,
                        base_model_additional_loras=None, use_synthetic_refiner=False, vae_name=None):
-    global final_unet, final_clip, final_vae, final_refiner_unet, final_refiner_vae, final_expansion
+    global final_unet, final_clip, final_vae, final_refiner_unet, final_refiner_vae, final_expansion, \
+        cond_cache_model_key
 
     final_unet = None
     final_clip = None
@@ -259,11 +370,12 @@ def refresh_everything(refiner_model_name, base_model_name, loras,
     final_refiner_unet = model_refiner.unet_with_lora
     final_refiner_vae = model_refiner.vae
 
+    cond_cache_model_key = (model_fingerprint(model_base.filename), model_base.visited_loras)
+
     if final_expansion is None:
         final_expansion = FooocusExpansion()
 
     prepare_text_encoder(async_call=True)
-    clear_all_caches()
     return
 
 
@@ -333,7 +445,7 @@ def get_candidate_vae(steps, switch, denoise=1.0, refiner_swap_method='joint'):
 
 @torch.no_grad()
 @torch.inference_mode()
-def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', disable_preview=False):
+def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', disable_preview=False, preview_throttle=None):
     target_unet, target_vae, target_refiner_unet, target_refiner_vae, target_clip \
         = final_unet, final_vae, final_refiner_unet, final_refiner_vae, final_clip
 
@@ -359,7 +471,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
     print(f'[Sampler] refiner_swap_method = {refiner_swap_method}')
 
     if latent is None:
-        initial_latent = core.generate_empty_latent(width=width, height=height, batch_size=1)
+        batch_size = len(image_seed) if isinstance(image_seed, list) else 1
+        initial_latent = core.generate_empty_latent(width=width, height=height, batch_size=batch_size)
     else:
         initial_latent = latent
 
@@ -392,7 +505,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             refiner_switch=switch,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_throttle=preview_throttle
         )
         decoded_latent = core.decode_vae(vae=target_vae, latent_image=sampled_latent, tiled=tiled)
 
@@ -411,7 +525,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_throttle=preview_throttle
         )
         print('Refiner swapped by changing ksampler. Noise preserved.')
 
@@ -434,7 +549,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=switch,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_throttle=preview_throttle
         )
 
         target_model = target_refiner_vae
@@ -462,7 +578,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_throttle=preview_throttle
         )
         print('Fooocus VAE-based swap.')
 
@@ -492,7 +609,7 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             negative=clip_separate(negative_cond, target_model=target_model.model, target_clip=target_clip),
             latent=sampled_latent,
             steps=len_sigmas, start_step=0, last_step=len_sigmas, disable_noise=False, force_full_denoise=True,
-            seed=image_seed+1,
+            seed=[s + 1 for s in image_seed] if isinstance(image_seed, list) else image_seed + 1,
             denoise=denoise,
             callback_function=callback,
             cfg=cfg_scale,
@@ -502,7 +619,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             previewer_end=steps,
             sigmas=sigmas,
             noise_mean=noise_mean,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_throttle=preview_throttle
         )
 
         target_model = target_refiner_vae
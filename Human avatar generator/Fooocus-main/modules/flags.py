@@ -58,7 +58,14 @@ KSAMPLER_NAMES = list(KSAMPLER.keys())
 SCHEDULER_NAMES = ["normal", "karras", "exponential", "sgm_uniform", "simple", "ddim_uniform", "lcm", "turbo", "align_your_steps", "tcd", "edm_playground_v2.5"]
 SAMPLER_NAMES = KSAMPLER_NAMES + list(SAMPLER_EXTRA.keys())
 
+# Samplers whose randomness only comes from the initial noise or the per-seed Brownian tree.
+# Images using these can be sampled in one batch without changing their results.
+batch_compatible_samplers = ["euler", "heun", "heunpp2", "dpm_2", "lms", "dpm_fast", "dpmpp_sde", "dpmpp_sde_gpu",
+                             "dpmpp_2m", "dpmpp_2m_sde", "dpmpp_2m_sde_gpu", "dpmpp_3m_sde", "dpmpp_3m_sde_gpu",
+                             "ddim", "uni_pc", "uni_pc_bh2"]
+
 sampler_list = SAMPLER_NAMES
+sharpness_filter_list = ['shifted', 'unfold']
 scheduler_list = SCHEDULER_NAMES
 
 clip_skip_max = 12
@@ -131,6 +138,7 @@ class OutputFormat(Enum):
 class PerformanceLoRA(Enum):
     QUALITY = None
     SPEED = None
+    DEEP_CACHE = None
     EXTREME_SPEED = 'sdxl_lcm_lora.safetensors'
     LIGHTNING = 'sdxl_lightning_4step_lora.safetensors'
     HYPER_SD = 'sdxl_hyper_sd_4step_lora.safetensors'
@@ -139,6 +147,7 @@ class PerformanceLoRA(Enum):
 class Steps(IntEnum):
     QUALITY = 60
     SPEED = 30
+    DEEP_CACHE = 30
     EXTREME_SPEED = 8
     LIGHTNING = 4
     HYPER_SD = 4
@@ -151,6 +160,7 @@ class Steps(IntEnum):
 class StepsUOV(IntEnum):
     QUALITY = 36
     SPEED = 18
+    DEEP_CACHE = 18
     EXTREME_SPEED = 8
     LIGHTNING = 4
     HYPER_SD = 4
@@ -159,6 +169,7 @@ class StepsUOV(IntEnum):
 class Performance(Enum):
     QUALITY = 'Quality'
     SPEED = 'Speed'
+    DEEP_CACHE = 'Deep Cache'
     EXTREME_SPEED = 'Extreme Speed'
     LIGHTNING = 'Lightning'
     HYPER_SD = 'Hyper-SD'
@@ -173,6 +184,7 @@ class Performance(Enum):
 
     @classmethod
     def by_steps(cls, steps: int | str):
+        # performances sharing their steps are aliases in Steps, e.g. 30 steps are always Speed and never Deep Cache
         return cls[Steps(int(steps)).name]
 
     @classmethod
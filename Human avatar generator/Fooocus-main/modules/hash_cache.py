@@ -1,25 +1,139 @@
+import hashlib
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from multiprocessing import cpu_count
 
 import args_manager
+import modules.config
 from modules.util import sha256, HASH_SHA256_LENGTH, get_file_from_folder_list
 
 hash_cache_filename = 'hash_cache.txt'
+
+# {path: {'sha256', 'size', 'mtime_ns', 'inode', 'partial'}}, entries of the former {path: sha256} format
+# only have 'sha256' until their file is hashed again
 hash_cache = {}
+hash_cache_lock = threading.Lock()
+pending_hashes = {}
+hash_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hash_cache')
 
+PARTIAL_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_stat(filepath):
+    stat = os.stat(filepath)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+
+def partial_hash(filepath, size):
+    """Hash of the size, first and last MB of a file, a cheap identity check for files whose stat changed.
+    """
+    hash_sha256 = hashlib.sha256(str(size).encode('utf-8'))
+    with open(filepath, 'rb') as f:
+        hash_sha256.update(f.read(PARTIAL_HASH_BLOCK_SIZE))
+        if size > PARTIAL_HASH_BLOCK_SIZE:
+            f.seek(max(PARTIAL_HASH_BLOCK_SIZE, size - PARTIAL_HASH_BLOCK_SIZE))
+            hash_sha256.update(f.read(PARTIAL_HASH_BLOCK_SIZE))
+    return hash_sha256.hexdigest()[:16]
 
-def sha256_from_cache(filepath):
-    global hash_cache
-    if filepath not in hash_cache:
-        print(f"[Cache] Calculating sha256 for {filepath}")
-        hash_value = sha256(filepath)
-        print(f"[Cache] sha256 for {filepath}: {hash_value}")
-        hash_cache[filepath] = hash_value
-        save_cache_to_file(filepath, hash_value)
 
-    return hash_cache[filepath]
+def lookup_hash(filepath):
+    """sha256 of filepath if the index has it for the file as it is now, None otherwise. Never reads the whole file.
+    """
+    with hash_cache_lock:
+        entry = hash_cache.get(filepath, None)
+    if entry is None:
+        return None
+
+    try:
+        stat = file_stat(filepath)
+    except OSError:
+        return None
+
+    if all(entry.get(k, None) == v for k, v in stat.items()):
+        return entry['sha256']
+
+    # entries of the former format can not be checked, their file may have been replaced since
+    if 'size' not in entry or 'partial' not in entry:
+        return None
+
+    # stat changed (copied or touched): same size and partial hash is most likely the same file
+    if entry['size'] != stat['size']:
+        return None
+    partial = partial_hash(filepath, stat['size'])
+    if entry['partial'] != partial:
+        return None
+
+    if entry.get('mtime_ns', None) != stat['mtime_ns']:
+        # modified in place, possibly in the middle: keep the known hash until the whole file is hashed again
+        request_hash(filepath, rehash=True)
+        return entry['sha256']
+
+    entry = dict(stat, partial=partial, sha256=entry['sha256'])
+    with hash_cache_lock:
+        hash_cache[filepath] = entry
+    save_cache_to_file(filepath, entry)
+    return entry['sha256']
+
+
+def hash_file(filepath, rehash=False):
+    if not rehash:
+        hash_value = lookup_hash(filepath)
+        if hash_value is not None:
+            return hash_value
+
+    print(f"[Cache] Calculating sha256 for {filepath}")
+    stat = file_stat(filepath)
+    entry = dict(stat, partial=partial_hash(filepath, stat['size']), sha256=sha256(filepath))
+    print(f"[Cache] sha256 for {filepath}: {entry['sha256']}")
+
+    with hash_cache_lock:
+        hash_cache[filepath] = entry
+    save_cache_to_file(filepath, entry)
+    return entry['sha256']
+
+
+def request_hash(filepath, rehash=False):
+    """Hash filepath in the background unless that is already under way, returns the future of its sha256.
+    """
+    with hash_cache_lock:
+        future = pending_hashes.get(filepath, None)
+        if future is None or future.done():
+            future = hash_executor.submit(hash_file, filepath, rehash)
+            pending_hashes[filepath] = future
+    return future
+
+
+def request_model_hashes(base_model_name, refiner_model_name, loras):
+    """Start hashing the models of a task early, so the hashes are ready once its images are saved.
+    """
+    names = [(base_model_name, modules.config.paths_checkpoints), (refiner_model_name, modules.config.paths_checkpoints)]
+    names += [(lora_name, modules.config.paths_loras) for lora_name, _ in loras]
+    for name, paths in names:
+        if name in ['', 'None']:
+            continue
+        filepath = get_file_from_folder_list(name, paths)
+        if lookup_hash(filepath) is None and os.path.isfile(filepath):
+            request_hash(filepath)
+
+
+def sha256_future(filepath):
+    """Future of the sha256 of filepath, already done if the index has it. An unknown file is hashed
+    in the background, so the caller can wait for it where waiting does not hold up sampling.
+    """
+    hash_value = lookup_hash(filepath)
+    if hash_value is None:
+        print(f"[Cache] sha256 for {filepath} is not known yet, calculating in background")
+        return request_hash(filepath)
+
+    future = Future()
+    future.set_result(hash_value)
+    return future
+
+
+def sha256_from_cache(filepath):
+    return sha256_future(filepath).result()
 
 
 def load_cache_from_file():
@@ -30,29 +144,31 @@ def load_cache_from_file():
             with open(hash_cache_filename, 'rt', encoding='utf-8') as fp:
                 for line in fp:
                     entry = json.loads(line)
-                    for filepath, hash_value in entry.items():
-                        if not os.path.exists(filepath) or not isinstance(hash_value, str) and len(hash_value) != HASH_SHA256_LENGTH:
+                    for filepath, value in entry.items():
+                        if isinstance(value, str):
+                            value = {'sha256': value}
+                        if not isinstance(value, dict) or not isinstance(value.get('sha256', None), str) \
+                                or len(value['sha256']) != HASH_SHA256_LENGTH:
                             print(f'[Cache] Skipping invalid cache entry: {filepath}')
                             continue
-                        hash_cache[filepath] = hash_value
+                        hash_cache[filepath] = value
     except Exception as e:
         print(f'[Cache] Loading failed: {e}')
 
 
-def save_cache_to_file(filename=None, hash_value=None):
-    global hash_cache
-
-    if filename is not None and hash_value is not None:
-        items = [(filename, hash_value)]
+def save_cache_to_file(filename=None, entry=None):
+    if filename is not None and entry is not None:
+        items = [(filename, entry)]
         mode = 'at'
     else:
-        items = sorted(hash_cache.items())
+        with hash_cache_lock:
+            items = sorted((k, v) for k, v in hash_cache.items() if os.path.exists(k))
         mode = 'wt'
 
     try:
-        with open(hash_cache_filename, mode, encoding='utf-8') as fp:
-            for filepath, hash_value in items:
-                json.dump({filepath: hash_value}, fp)
+        with hash_cache_lock, open(hash_cache_filename, mode, encoding='utf-8') as fp:
+            for filepath, entry in items:
+                json.dump({filepath: entry}, fp)
                 fp.write('\n')
     except Exception as e:
         print(f'[Cache] Saving failed: {e}')
@@ -65,14 +181,14 @@ def init_cache(model_filenames, paths_checkpoints, lora_filenames, paths_loras):
         max_workers = args_manager.args.rebuild_hash_cache if args_manager.args.rebuild_hash_cache > 0 else cpu_count()
         rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers)
 
-    # write cache to file again for sorting and cleanup of invalid cache entries
-    save_cache_to_file()
+    # write cache to file again for sorting and cleanup of entries of deleted files, off the startup path
+    hash_executor.submit(save_cache_to_file)
 
 
 def rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers=cpu_count()):
     def thread(filename, paths):
         filepath = get_file_from_folder_list(filename, paths)
-        sha256_from_cache(filepath)
+        hash_file(filepath)
 
     print('[Cache] Rebuilding hash cache')
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -0,0 +1,263 @@
+import json
+import random
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import args_manager
+import modules.config
+import modules.constants as constants
+import modules.flags as flags
+import modules.async_worker as worker
+from modules.private_logger import wait_for_images
+
+
+def default_job():
+    """Named defaults for every AsyncTask argument a text-to-image job can set.
+
+    These mirror the initial values of the web UI controls, except that previews are
+    disabled since nobody is watching them.
+    """
+    config = modules.config
+    return {
+        'generate_image_grid': False,
+        'prompt': '',
+        'negative_prompt': config.default_prompt_negative,
+        'style_selections': list(config.default_styles),
+        'performance_selection': config.default_performance,
+        'aspect_ratios_selection': config.default_aspect_ratio,
+        'image_number': config.default_image_number,
+        'output_format': config.default_output_format,
+        'seed': None,
+        'read_wildcards_in_order': False,
+        'sharpness': config.default_sample_sharpness,
+        'cfg_scale': config.default_cfg_scale,
+        'base_model_name': config.default_base_model_name,
+        'refiner_model_name': config.default_refiner_model_name,
+        'refiner_switch': config.default_refiner_switch,
+        'loras': [list(lora) for lora in config.default_loras],
+        'disable_preview': True,
+        'disable_intermediate_results': False,
+        'disable_seed_increment': False,
+        'black_out_nsfw': config.default_black_out_nsfw,
+        'adm_scaler_positive': 1.5,
+        'adm_scaler_negative': 0.8,
+        'adm_scaler_end': 0.3,
+        'adaptive_cfg': config.default_cfg_tsnr,
+        'clip_skip': config.default_clip_skip,
+        'sampler_name': config.default_sampler,
+        'scheduler_name': config.default_scheduler,
+        'vae_name': config.default_vae,
+        'overwrite_step': config.default_overwrite_step,
+        'overwrite_switch': config.default_overwrite_switch,
+        'overwrite_width': -1,
+        'overwrite_height': -1,
+        'refiner_swap_method': flags.refiner_swap_method,
+        'freeu_enabled': False,
+        'freeu_b1': 1.01,
+        'freeu_b2': 1.02,
+        'freeu_s1': 0.99,
+        'freeu_s2': 0.95,
+        'save_metadata_to_images': config.default_save_metadata_to_images,
+        'metadata_scheme': config.default_metadata_scheme,
+        'priority': 0,
+        'user': None,
+    }
+
+
+def build_task(job):
+    """Build an AsyncTask from a job dict, in the positional order webui.py passes its controls.
+
+    Image inputs (variation, upscale, inpaint, image prompts, enhance) are left disabled.
+    """
+    unknown = set(job.keys()) - set(default_job().keys()) - {'id'}
+    if len(unknown) > 0:
+        raise ValueError(f'Unknown job parameters: {", ".join(sorted(unknown))}')
+
+    p = default_job()
+    p.update(job)
+
+    if p['seed'] is None:
+        p['seed'] = random.randint(constants.MIN_SEED, constants.MAX_SEED)
+    if '×' not in p['aspect_ratios_selection']:
+        p['aspect_ratios_selection'] = modules.config.add_ratio(p['aspect_ratios_selection'])
+
+    loras = [lora if len(lora) == 3 else [True] + list(lora) for lora in p['loras']]
+    loras = loras[:modules.config.default_max_lora_number]
+    loras += [[False, 'None', 1.0]] * (modules.config.default_max_lora_number - len(loras))
+
+    args = [p['generate_image_grid'], p['prompt'], p['negative_prompt'], p['style_selections'],
+            p['performance_selection'], p['aspect_ratios_selection'], p['image_number'], p['output_format'],
+            str(p['seed']), p['read_wildcards_in_order'], p['sharpness'], p['cfg_scale']]
+    args += [p['base_model_name'], p['refiner_model_name'], p['refiner_switch']]
+    for enabled, filename, weight in loras:
+        args += [enabled, filename, weight]
+    args += [False, 'uov']
+    args += [flags.disabled, None]
+    args += [[], None, '', None]
+    args += [p['disable_preview'], p['disable_intermediate_results'], p['disable_seed_increment'], p['black_out_nsfw']]
+    args += [p['adm_scaler_positive'], p['adm_scaler_negative'], p['adm_scaler_end'], p['adaptive_cfg'], p['clip_skip']]
+    args += [p['sampler_name'], p['scheduler_name'], p['vae_name']]
+    args += [p['overwrite_step'], p['overwrite_switch'], p['overwrite_width'], p['overwrite_height'], -1]
+    args += [modules.config.default_overwrite_upscale, False, False]
+    args += [False, False, 64, 128]
+    args += [p['refiner_swap_method'], 0.25]
+    args += [p['freeu_enabled'], p['freeu_b1'], p['freeu_b2'], p['freeu_s1'], p['freeu_s2']]
+    args += [False, False, modules.config.default_inpaint_engine_version, 1.0, 0.618, False, False, 0]
+
+    if not args_manager.args.disable_image_log:
+        args += [modules.config.default_save_only_final_enhanced_image]
+
+    if not args_manager.args.disable_metadata:
+        args += [p['save_metadata_to_images'], p['metadata_scheme']]
+
+    for image_count in range(1, modules.config.default_controlnet_image_count + 1):
+        args += [None, modules.config.default_ip_stop_ats[image_count],
+                 modules.config.default_ip_weights[image_count], modules.config.default_ip_types[image_count]]
+
+    args += [False, 0, False, None, False, flags.disabled, modules.config.default_enhance_uov_processing_order,
+             modules.config.default_enhance_uov_prompt_type]
+    for _ in range(modules.config.default_enhance_tabs):
+        args += [False] + [None] * 15
+
+    task = worker.AsyncTask(args=args)
+    task.priority = p['priority']
+    task.user = p['user']
+    return task
+
+
+def stop_task(task):
+    """Same as the Stop button: interrupt the task if it is running, else drop it from the queue.
+    """
+    task.last_stop = 'stop'
+    if task.processing:
+        import ldm_patched.modules.model_management as model_management
+        model_management.interrupt_current_processing()
+    else:
+        worker.async_tasks.cancel(task)
+
+
+def run_tasks(jobs, on_event):
+    """Queue every job at once, then stream the events of each task to on_event(job_id, event).
+
+    The worker picks up the next task as soon as one finishes, so throughput never
+    depends on how fast the events are consumed. If on_event raises, e.g. because the
+    client went away, the tasks not finished yet are stopped.
+    """
+    tasks = []
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            on_event(index, {'event': 'error', 'message': 'A job must be a JSON object.'})
+            continue
+        job_id = job.get('id', index)
+        job = {k: v for k, v in job.items() if k != 'id'}
+        try:
+            tasks.append((job_id, build_task(job)))
+        except Exception as e:
+            on_event(job_id, {'event': 'error', 'message': str(e)})
+
+    for _, task in tasks:
+        worker.async_tasks.put(task)
+
+    remaining = list(tasks)
+    try:
+        while len(remaining) > 0:
+            job_id, task = remaining[0]
+            finished = False
+            while not finished:
+                task.yields.wait()
+                flag, product = task.yields.pop(0)
+                if flag == 'preview':
+                    percentage, title, _ = product
+                    on_event(job_id, {'event': 'progress', 'percentage': percentage, 'title': title})
+                if flag in ['results', 'finish']:
+                    wait_for_images(product)
+                if flag == 'results':
+                    on_event(job_id, {'event': 'results', 'images': [x for x in product if isinstance(x, str)]})
+                if flag == 'finish':
+                    remaining.pop(0)
+                    finished = True
+                    on_event(job_id, {'event': 'finish', 'images': [x for x in product if isinstance(x, str)]})
+    finally:
+        for _, task in remaining:
+            stop_task(task)
+
+
+def read_jobs(text):
+    text = text.strip()
+    if text.startswith('['):
+        return json.loads(text)
+    if text.startswith('{') and '\n' in text:
+        try:
+            return [json.loads(text)]
+        except ValueError:
+            pass
+    return [json.loads(line) for line in text.splitlines() if line.strip() != '']
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/queue':
+            self.send_error(404)
+            return
+        self.send_json(worker.async_tasks.metrics())
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            jobs = read_jobs(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        if isinstance(jobs, dict):
+            jobs = [jobs]
+        for job in jobs:
+            if isinstance(job, dict):
+                job.setdefault('user', self.client_address[0])
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+
+        lock = threading.Lock()
+
+        def on_event(job_id, event):
+            with lock:
+                self.wfile.write((json.dumps(dict(id=job_id, **event)) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+        run_tasks(jobs, on_event)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def print_event(job_id, event):
+    print('[Headless] ' + json.dumps(dict(id=job_id, **event)), flush=True)
+
+
+def main():
+    args = args_manager.args
+
+    if args.headless_batch is not None:
+        if args.headless_batch == '-':
+            text = sys.stdin.read()
+        else:
+            with open(args.headless_batch, 'r', encoding='utf-8') as f:
+                text = f.read()
+        run_tasks(read_jobs(text), print_event)
+        return
+
+    port = args.port if args.port is not None else 7866
+    server = ThreadingHTTPServer((args.listen, port), APIHandler)
+    print(f'Headless API running on http://{args.listen}:{port} (POST /generate, GET /queue)')
+    server.serve_forever()
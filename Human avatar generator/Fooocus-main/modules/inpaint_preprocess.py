@@ -0,0 +1,172 @@
+import math
+from bisect import bisect_left, bisect_right
+
+import cv2
+import numpy as np
+from PIL import Image, ImageFilter
+
+# (box blur radius, repeats) of fooocus_fill, from coarse to fine
+FILL_PASSES = [(512, 2), (256, 2), (128, 4), (64, 4), (33, 8), (15, 8), (5, 16), (3, 16)]
+# passes with at least this radius run on an image downscaled until the radius is PYRAMID_RADIUS
+PYRAMID_MIN_RADIUS = 64
+PYRAMID_RADIUS = 32
+
+
+def box_blur(x, k):
+    x = Image.fromarray(x)
+    x = x.filter(ImageFilter.BoxBlur(k))
+    return np.array(x)
+
+
+def max_filter_opencv(x, ksize=3):
+    # Use OpenCV maximum filter
+    # Make sure the input type is int16
+    return cv2.dilate(x, np.ones((ksize, ksize), dtype=np.int16))
+
+
+def morphological_open(x):
+    """
+    256 on the mask, falling by 8 per pixel of chessboard distance to it, clipped to 0..255.
+    The same as 32 rounds of a 3x3 max filter minus 8, in one distance transform.
+    """
+    outside = (x <= 127).astype(np.uint8)
+    distance = np.minimum(cv2.distanceTransform(outside, cv2.DIST_C, 3), 33)
+    return np.clip(256 - 8 * distance, 0, 255).astype(np.uint8)
+
+
+def up255(x, t=0):
+    y = np.zeros_like(x).astype(np.uint8)
+    y[x > t] = 255
+    return y
+
+
+def imsave(x, path):
+    x = Image.fromarray(x)
+    x.save(path)
+
+
+def regulate_abcd(x, a, b, c, d):
+    H, W = x.shape[:2]
+    if a < 0:
+        a = 0
+    if a > H:
+        a = H
+    if b < 0:
+        b = 0
+    if b > H:
+        b = H
+    if c < 0:
+        c = 0
+    if c > W:
+        c = W
+    if d < 0:
+        d = 0
+    if d > W:
+        d = W
+    return int(a), int(b), int(c), int(d)
+
+
+def compute_initial_abcd(x):
+    indices = np.where(x)
+    a = np.min(indices[0])
+    b = np.max(indices[0])
+    c = np.min(indices[1])
+    d = np.max(indices[1])
+    abp = (b + a) // 2
+    abm = (b - a) // 2
+    cdp = (d + c) // 2
+    cdm = (d - c) // 2
+    l = int(max(abm, cdm) * 1.15)
+    a = abp - l
+    b = abp + l + 1
+    c = cdp - l
+    d = cdp + l + 1
+    a, b, c, d = regulate_abcd(x, a, b, c, d)
+    return a, b, c, d
+
+
+def solve_abcd(x, a, b, c, d, k):
+    """
+    Grows the box until it covers k of the height and of the width of x, one pixel per side and step,
+    always on the shorter side (the width on ties) and never past the borders of x.
+
+    Sizes of either side only increase, so the steps are a merge of the two sequences of sizes
+    and the number of steps of each side follows from a few binary searches.
+    """
+    k = float(k)
+    assert 0.0 <= k <= 1.0
+
+    H, W = x.shape[:2]
+    if k == 1.0:
+        return 0, H, 0, W
+
+    a, b, c, d = regulate_abcd(x, a, b, c, d)
+
+    def height(n):
+        return min(H, b + n) - max(0, a - n)
+
+    def width(n):
+        return min(W, d + n) - max(0, c - n)
+
+    # a side at its full size is not grown anymore, it sorts after everything
+    full_h, full_w = max(a, H - b), max(c, W - d)
+    steps_h, steps_w = range(full_h + 1), range(full_w + 1)
+
+    def order_h(n):
+        return height(n) if n < full_h else math.inf
+
+    def order_w(n):
+        return width(n) if n < full_w else math.inf
+
+    # steps each side needs on its own
+    need_h = bisect_left(steps_h, H * k, key=height)
+    need_w = bisect_left(steps_w, W * k, key=width)
+
+    # the growing stops right after the last needed step of one side, the other side then has taken all its steps
+    # up to that size, the width taking ties
+    n_h, n_w = need_h, need_w
+    width_steps_before_last_h = bisect_right(steps_w, height(need_h - 1), key=order_w) if need_h > 0 else -1
+    if width_steps_before_last_h >= need_w:
+        n_w = width_steps_before_last_h
+    elif need_w > 0:
+        n_h = bisect_left(steps_h, width(need_w - 1), key=order_h)
+
+    return regulate_abcd(x, a - n_h, b + n_h, c - n_w, d + n_w)
+
+
+def fooocus_fill(image, mask):
+    """
+    Fills where mask >= 127 by diffusing the surrounding colors into it, with box blurs from coarse to fine.
+
+    The coarse passes run on a downscaled image. The others only blur the part of the image within their radius
+    of the filled area, which gives the same pixels as blurring all of it.
+    """
+    current_image = image.copy()
+    fill = mask >= 127
+    if not fill.any():
+        return current_image
+
+    H, W = fill.shape
+    fill_3 = fill[:, :, None]
+    rows, cols = np.where(fill.any(axis=1))[0], np.where(fill.any(axis=0))[0]
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+    for k, repeats in FILL_PASSES:
+        if k >= PYRAMID_MIN_RADIUS:
+            f = k // PYRAMID_RADIUS
+            size = (max(1, W // f), max(1, H // f))
+            small_image = cv2.resize(current_image, size, interpolation=cv2.INTER_AREA)
+            small_raw = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            small_keep = (cv2.resize(fill.astype(np.float32), size, interpolation=cv2.INTER_AREA) == 0)[:, :, None]
+            for _ in range(repeats):
+                small_image = box_blur(small_image, k // f)
+                np.copyto(small_image, small_raw, where=small_keep)
+            np.copyto(current_image, cv2.resize(small_image, (W, H), interpolation=cv2.INTER_LINEAR), where=fill_3)
+            continue
+
+        a, b, c, d = regulate_abcd(fill, top - k, bottom + k, left - k, right + k)
+        crop, crop_fill = current_image[a:b, c:d], fill_3[a:b, c:d]
+        for _ in range(repeats):
+            np.copyto(crop, box_blur(crop, k), where=crop_fill)
+
+    return current_image
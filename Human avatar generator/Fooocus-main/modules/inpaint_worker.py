@@ -1,10 +1,10 @@
 import torch
 import numpy as np
 
-from PIL import Image, ImageFilter
 from modules.util import resample_image, set_image_shape_ceil, get_image_shape_ceil
 from modules.upscaler import perform_upscale
-import cv2
+from modules.inpaint_preprocess import box_blur, max_filter_opencv, morphological_open, up255, imsave, \
+    regulate_abcd, compute_initial_abcd, solve_abcd, fooocus_fill
 
 
 inpaint_head_model = None
@@ -23,130 +23,6 @@ class InpaintHead(torch.nn.Module):
 current_task = None
 
 
-def box_blur(x, k):
-    x = Image.fromarray(x)
-    x = x.filter(ImageFilter.BoxBlur(k))
-    return np.array(x)
-
-
-def max_filter_opencv(x, ksize=3):
-    # Use OpenCV maximum filter
-    # Make sure the input type is int16
-    return cv2.dilate(x, np.ones((ksize, ksize), dtype=np.int16))
-
-
-def morphological_open(x):
-    # Convert array to int16 type via threshold operation
-    x_int16 = np.zeros_like(x, dtype=np.int16)
-    x_int16[x > 127] = 256
-
-    for i in range(32):
-        # Use int16 type to avoid overflow
-        maxed = max_filter_opencv(x_int16, ksize=3) - 8
-        x_int16 = np.maximum(maxed, x_int16)
-
-    # Clip negative values to 0 and convert back to uint8 type
-    x_uint8 = np.clip(x_int16, 0, 255).astype(np.uint8)
-    return x_uint8
-
-
-def up255(x, t=0):
-    y = np.zeros_like(x).astype(np.uint8)
-    y[x > t] = 255
-    return y
-
-
-def imsave(x, path):
-    x = Image.fromarray(x)
-    x.save(path)
-
-
-def regulate_abcd(x, a, b, c, d):
-    H, W = x.shape[:2]
-    if a < 0:
-        a = 0
-    if a > H:
-        a = H
-    if b < 0:
-        b = 0
-    if b > H:
-        b = H
-    if c < 0:
-        c = 0
-    if c > W:
-        c = W
-    if d < 0:
-        d = 0
-    if d > W:
-        d = W
-    return int(a), int(b), int(c), int(d)
-
-
-def compute_initial_abcd(x):
-    indices = np.where(x)
-    a = np.min(indices[0])
-    b = np.max(indices[0])
-    c = np.min(indices[1])
-    d = np.max(indices[1])
-    abp = (b + a) // 2
-    abm = (b - a) // 2
-    cdp = (d + c) // 2
-    cdm = (d - c) // 2
-    l = int(max(abm, cdm) * 1.15)
-    a = abp - l
-    b = abp + l + 1
-    c = cdp - l
-    d = cdp + l + 1
-    a, b, c, d = regulate_abcd(x, a, b, c, d)
-    return a, b, c, d
-
-
-def solve_abcd(x, a, b, c, d, k):
-    k = float(k)
-    assert 0.0 <= k <= 1.0
-
-    H, W = x.shape[:2]
-    if k == 1.0:
-        return 0, H, 0, W
-    while True:
-        if b - a >= H * k and d - c >= W * k:
-            break
-
-        add_h = (b - a) < (d - c)
-        add_w = not add_h
-
-        if b - a == H:
-            add_w = True
-
-        if d - c == W:
-            add_h = True
-
-        if add_h:
-            a -= 1
-            b += 1
-
-        if add_w:
-            c -= 1
-            d += 1
-
-        a, b, c, d = regulate_abcd(x, a, b, c, d)
-    return a, b, c, d
-
-
-def fooocus_fill(image, mask):
-    current_image = image.copy()
-    raw_image = image.copy()
-    area = np.where(mask < 127)
-    store = raw_image[area]
-
-    for k, repeats in [(512, 2), (256, 2), (128, 4), (64, 4), (33, 8), (15, 8), (5, 16), (3, 16)]:
-        for _ in range(repeats):
-            current_image = box_blur(current_image, k)
-            current_image[area] = store
-
-    return current_image
-
-
 class InpaintWorker:
     def __init__(self, image, mask, use_fill=True, k=0.618):
         a, b, c, d = compute_initial_abcd(mask > 0)
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+import torch
+
+
+def _nbytes(x):
+    if isinstance(x, torch.Tensor):
+        return x.numel() * x.element_size()
+    if isinstance(x, dict):
+        return sum(_nbytes(v) for v in x.values())
+    if isinstance(x, (list, tuple)):
+        return sum(_nbytes(v) for v in x)
+    return 0
+
+
+class TensorLRU:
+    """LRU of arbitrary nested tensor structures, capped by their total tensor size.
+
+    Tensors shared between entries are counted once per entry, so the cap errs on
+    the side of evicting too early.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key, None)
+            if result is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        with self.lock:
+            if key in self.entries or size > self.max_bytes:
+                return
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted, _ = self.entries.popitem(last=False)
+                self.size -= self.sizes.pop(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'size_mb': self.size / 2 ** 20,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total > 0 else 0.0,
+        }
+
+
+def merged_deltas_nbytes(patcher, patches):
+    """Size merged_deltas would take for patches, from the shapes of the weights they patch.
+    """
+    model_sd = patcher.model_state_dict()
+    return sum(model_sd[key].numel() * 4 for key in patches if key in model_sd)
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def merged_deltas(patcher, patches, device):
+    """Fully merged weight deltas of patches ({key: [patch, ...]}) for the model of patcher.
+
+    Every key gets a single plain "diff" patch in return, which patch_model applies
+    with one in-place add instead of recomputing every LoRA product. Deltas are kept
+    in fp32 so the patched weights are rounded once, as when merging the LoRAs directly.
+    """
+    model_sd = patcher.model_state_dict()
+    deltas = {}
+    for key, key_patches in patches.items():
+        if key not in model_sd:
+            continue
+        weight = model_sd[key]
+        original = weight.to(device=device, dtype=torch.float32, copy=True)
+        merged = patcher.calculate_weight(key_patches, original.clone(), key)
+        deltas[key] = [(1.0, ((merged - original).to(device=patcher.offload_device),), 1.0)]
+        del original, merged
+    return deltas
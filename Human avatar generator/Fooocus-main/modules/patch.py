@@ -7,6 +7,7 @@ import ldm_patched.ldm.modules.diffusionmodules.openaimodel
 import ldm_patched.modules.model_management
 import modules.anisotropic as anisotropic
 import ldm_patched.ldm.modules.attention
+import ldm_patched.ldm.modules.context_kv_cache
 import ldm_patched.k_diffusion.sampling
 import ldm_patched.modules.sd1_clip
 import modules.inpaint_worker as inpaint_worker
@@ -26,6 +27,7 @@ from ldm_patched.k_diffusion.sampling import BatchedBrownianTree
 from ldm_patched.ldm.modules.diffusionmodules.openaimodel import forward_timestep_embed, apply_control
 from modules.patch_precision import patch_all_precision
 from modules.patch_clip import patch_all_clip
+from modules.deep_cache import DeepCache
 
 
 class PatchSettings:
@@ -35,15 +37,20 @@ class PatchSettings:
                  positive_adm_scale=1.5,
                  negative_adm_scale=0.8,
                  controlnet_softness=0.25,
-                 adaptive_cfg=7.0):
+                 adaptive_cfg=7.0,
+                 sharpness_filter='shifted',
+                 deep_cache_interval=0,
+                 deep_cache_shallow_blocks=1):
         self.sharpness = sharpness
         self.adm_scaler_end = adm_scaler_end
         self.positive_adm_scale = positive_adm_scale
         self.negative_adm_scale = negative_adm_scale
         self.controlnet_softness = controlnet_softness
         self.adaptive_cfg = adaptive_cfg
+        self.sharpness_filter = sharpness_filter
         self.global_diffusion_progress = 0
         self.eps_record = None
+        self.deep_cache = DeepCache(deep_cache_interval, deep_cache_shallow_blocks) if deep_cache_interval > 1 else None
 
 
 patch_settings = {}
@@ -241,8 +248,12 @@ def patched_sampling_function(model, x, timestep, uncond, cond, cond_scale, mode
 
     alpha = 0.001 * patch_settings[pid].sharpness * patch_settings[pid].global_diffusion_progress
 
-    positive_eps_degraded = anisotropic.adaptive_anisotropic_filter(x=positive_eps, g=positive_x0)
-    positive_eps_degraded_weighted = positive_eps_degraded * alpha + positive_eps * (1.0 - alpha)
+    if alpha > 0:
+        positive_eps_degraded = anisotropic.adaptive_anisotropic_filter(x=positive_eps, g=positive_x0,
+                                                                        method=patch_settings[pid].sharpness_filter)
+        positive_eps_degraded_weighted = positive_eps_degraded * alpha + positive_eps * (1.0 - alpha)
+    else:
+        positive_eps_degraded_weighted = positive_eps
 
     final_eps = compute_cfg(uncond=negative_eps, cond=positive_eps_degraded_weighted,
                             cfg_scale=cond_scale, t=patch_settings[pid].global_diffusion_progress)
@@ -377,6 +388,17 @@ def patched_unet_forward(self, x, timesteps=None, context=None, y=None, control=
     self.current_step = 1.0 - timesteps.to(x) / 999.0
     patch_settings[os.getpid()].global_diffusion_progress = float(self.current_step.detach().cpu().numpy().tolist()[0])
 
+    deep_cache = patch_settings[os.getpid()].deep_cache
+    # controlnets add to every block, their residuals can not be skipped
+    if control is not None:
+        deep_cache = None
+    cache_key, reuse_deep_features = None, False
+    if deep_cache is not None:
+        shallow_blocks = min(deep_cache.shallow_blocks, len(self.output_blocks))
+        cache_key, reuse_deep_features = deep_cache.begin(self, float(timesteps[0]), x.shape)
+
+    ldm_patched.ldm.modules.context_kv_cache.context_kv_cache.set_context(context)
+
     y = timed_adm(y, timesteps)
 
     transformer_options["original_shape"] = list(x.shape)
@@ -400,6 +422,8 @@ def patched_unet_forward(self, x, timesteps=None, context=None, y=None, control=
 
     h = x
     for id, module in enumerate(self.input_blocks):
+        if reuse_deep_features and id >= shallow_blocks:
+            break
         transformer_options["block"] = ("input", id)
         h = forward_timestep_embed(module, h, emb, context, transformer_options, time_context=time_context, num_video_frames=num_video_frames, image_only_indicator=image_only_indicator)
         h = apply_control(h, control, 'input')
@@ -414,11 +438,20 @@ def patched_unet_forward(self, x, timesteps=None, context=None, y=None, control=
             for p in patch:
                 h = p(h, transformer_options)
 
-    transformer_options["block"] = ("middle", 0)
-    h = forward_timestep_embed(self.middle_block, h, emb, context, transformer_options, time_context=time_context, num_video_frames=num_video_frames, image_only_indicator=image_only_indicator)
-    h = apply_control(h, control, 'middle')
+    if reuse_deep_features:
+        h = deep_cache.features[cache_key]
+        first_output_block = len(self.output_blocks) - shallow_blocks
+    else:
+        transformer_options["block"] = ("middle", 0)
+        h = forward_timestep_embed(self.middle_block, h, emb, context, transformer_options, time_context=time_context, num_video_frames=num_video_frames, image_only_indicator=image_only_indicator)
+        h = apply_control(h, control, 'middle')
+        first_output_block = 0
 
     for id, module in enumerate(self.output_blocks):
+        if id < first_output_block:
+            continue
+        if cache_key is not None and not reuse_deep_features and id == len(self.output_blocks) - shallow_blocks:
+            deep_cache.features[cache_key] = h
         transformer_options["block"] = ("output", id)
         hsp = hs.pop()
         hsp = apply_control(hsp, control, 'output')
@@ -62,6 +62,66 @@ def patched_encode_token_weights(self, token_weight_pairs):
     return torch.cat(output, dim=-2).to(ldm_patched.modules.model_management.intermediate_device()), first_pooled
 
 
+def encode_token_weights_batched(self, token_weight_pairs_list, max_batch_size=64):
+    # Same as patched_encode_token_weights for every entry of token_weight_pairs_list, but the sections
+    # of all prompts go through the transformer together, max_batch_size sequences at a time.
+    to_encode = list()
+    spans = list()
+    weighted = list()
+    max_token_len = 0
+    for token_weight_pairs in token_weight_pairs_list:
+        has_weights = False
+        start = len(to_encode)
+        for x in token_weight_pairs:
+            tokens = list(map(lambda a: a[0], x))
+            max_token_len = max(len(tokens), max_token_len)
+            has_weights = has_weights or not all(map(lambda a: a[1] == 1.0, x))
+            to_encode.append(tokens)
+        spans.append((start, len(to_encode)))
+        weighted.append(has_weights or len(token_weight_pairs) == 0)
+
+    if any(weighted):
+        to_encode.append(ldm_patched.modules.sd1_clip.gen_empty_tokens(self.special_tokens, max_token_len))
+
+    outs, pooleds = [], []
+    for i in range(0, len(to_encode), max_batch_size):
+        out, pooled = self.encode(to_encode[i:i + max_batch_size])
+        outs.append(out)
+        pooleds.append(pooled)
+    out = torch.cat(outs, dim=0)
+    pooled = torch.cat(pooleds, dim=0) if pooleds[0] is not None else None
+    z_empty = out[-1]
+
+    results = []
+    for token_weight_pairs, (start, end), has_weights in zip(token_weight_pairs_list, spans, weighted):
+        first_pooled = None
+        if pooled is not None:
+            first_pooled = pooled[start:start + 1] if end > start else pooled[-1:]
+            first_pooled = first_pooled.to(ldm_patched.modules.model_management.intermediate_device())
+
+        if end == start:
+            results.append((out[-1:].to(ldm_patched.modules.model_management.intermediate_device()), first_pooled))
+            continue
+
+        output = []
+        for k in range(start, end):
+            z = out[k:k + 1]
+            if has_weights:
+                original_mean = z.mean()
+                for i in range(len(z)):
+                    for j in range(len(z[i])):
+                        weight = token_weight_pairs[k - start][j][1]
+                        if weight != 1.0:
+                            z[i][j] = (z[i][j] - z_empty[j]) * weight + z_empty[j]
+                new_mean = z.mean()
+                z = z * (original_mean / new_mean)
+            output.append(z)
+        results.append((torch.cat(output, dim=-2).to(ldm_patched.modules.model_management.intermediate_device()),
+                        first_pooled))
+
+    return results
+
+
 def patched_SDClipModel__init__(self, max_length=77, freeze=True, layer="last", layer_idx=None,
                                 textmodel_json_config=None, dtype=None, special_tokens=None,
                                 layer_norm_hidden_state=True, **kwargs):
@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview')
+
+
+class PreviewThrottle:
+    """Decides which sampling steps get a live preview, and renders them.
+
+    A step is previewed at most every every_n_steps steps and every min_interval seconds,
+    and only if consumer_ready() says the last preview has been shown, since a newer one
+    would replace it unseen anyway. With asynchronous, the preview is rendered on a
+    background thread and handed to deliver(image) from there, so the sampler only pays
+    for a copy of the latent.
+    """
+
+    def __init__(self, deliver, min_interval=0.0, every_n_steps=1, asynchronous=False, consumer_ready=None):
+        self.deliver = deliver
+        self.min_interval = min_interval
+        self.every_n_steps = max(1, every_n_steps)
+        self.asynchronous = asynchronous
+        self.consumer_ready = consumer_ready
+        self.last_time = None
+        self.pending = None
+
+    def __call__(self, step, total_steps):
+        if step % self.every_n_steps != 0:
+            return False
+        if self.pending is not None and not self.pending.done():
+            return False
+        if self.consumer_ready is not None and not self.consumer_ready():
+            return False
+        now = time.perf_counter()
+        if self.last_time is not None and now - self.last_time < self.min_interval:
+            return False
+        self.last_time = now
+        return True
+
+    def render(self, previewer, x0, step, total_steps):
+        """The preview image when rendered synchronously, None when it will be delivered later.
+        """
+        if not self.asynchronous:
+            return previewer(x0, step, total_steps)
+
+        x0 = x0.clone()
+        self.pending = preview_executor.submit(lambda: self.deliver(previewer(x0, step, total_steps)))
+        return None
+
+    def flush(self):
+        # previews of a finished sampling run must not arrive after its results
+        if self.pending is not None:
+            wait([self.pending])
+            self.pending = None
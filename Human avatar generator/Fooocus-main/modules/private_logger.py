@@ -1,8 +1,10 @@
 import os
+import threading
 import args_manager
 import modules.config
 import json
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
@@ -10,7 +12,10 @@ from modules.flags import OutputFormat
 from modules.meta_parser import MetadataParser, get_exif
 from modules.util import generate_temp_filename
 
-log_cache = {}
+log_lock = threading.Lock()
+log_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='private_logger')
+pending_images = {}
+html_logs_checked = set()
 
 
 def get_current_html_path(output_format=None):
@@ -21,13 +26,32 @@ def get_current_html_path(output_format=None):
     return html_name
 
 
-def log(img, metadata, metadata_parser: MetadataParser | None = None, output_format=None, task=None, persist_image=True) -> str:
-    path_outputs = modules.config.temp_path if args_manager.args.disable_image_log or not persist_image else modules.config.path_outputs
-    output_format = output_format if output_format else modules.config.default_output_format
-    date_string, local_temp_filename, only_name = generate_temp_filename(folder=path_outputs, extension=output_format)
-    os.makedirs(os.path.dirname(local_temp_filename), exist_ok=True)
+def wait_for_images(paths):
+    """Block until the images log() returned these paths for are written. Other entries are ignored.
+    """
+    for path in paths:
+        if not isinstance(path, str):
+            continue
+        with log_lock:
+            future = pending_images.get(path, None)
+        if future is not None:
+            wait([future])
+
+
+def image_saved(path, future):
+    with log_lock:
+        pending_images.pop(path, None)
+    if future.exception() is not None:
+        print(f'[Private Log] Failed to save {path}: {future.exception()}')
+
+
+def save_image(img, local_temp_filename, output_format, metadata, metadata_parser):
+    parsed_parameters = ''
+    if metadata_parser is not None:
+        # the metadata must not carry hashes of models still being hashed
+        metadata_parser.resolve_hashes()
+        parsed_parameters = metadata_parser.to_string(metadata)
 
-    parsed_parameters = metadata_parser.to_string(metadata.copy()) if metadata_parser is not None else ''
     image = Image.fromarray(img)
 
     if output_format == OutputFormat.PNG.value:
@@ -45,6 +69,23 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     else:
         image.save(local_temp_filename)
 
+
+def log(img, metadata, metadata_parser: MetadataParser | None = None, output_format=None, task=None, persist_image=True) -> str:
+    """Save img and add it to the log of its day.
+
+    Encoding and writing the image happens on a background thread, the path is returned right
+    away. Pass it to wait_for_images before reading the file.
+    """
+    path_outputs = modules.config.temp_path if args_manager.args.disable_image_log or not persist_image else modules.config.path_outputs
+    output_format = output_format if output_format else modules.config.default_output_format
+    date_string, local_temp_filename, only_name = generate_temp_filename(folder=path_outputs, extension=output_format)
+    os.makedirs(os.path.dirname(local_temp_filename), exist_ok=True)
+
+    future = log_executor.submit(save_image, img, local_temp_filename, output_format, metadata.copy(), metadata_parser)
+    with log_lock:
+        pending_images[local_temp_filename] = future
+    future.add_done_callback(lambda f: image_saved(local_temp_filename, f))
+
     if args_manager.args.disable_image_log:
         return local_temp_filename
 
@@ -91,18 +132,9 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
         </script>"""
     )
 
-    begin_part = f"<!DOCTYPE html><html><head><title>Fooocus Log {date_string}</title>{css_styles}</head><body>{js}<p>Fooocus Log {date_string} (private)</p>\n<p>Metadata is embedded if enabled in the config or developer debug mode. You can find the information for each image in line Metadata Scheme.</p><!--fooocus-log-split-->\n\n"
-    end_part = f'\n<!--fooocus-log-split--></body></html>'
-
-    middle_part = log_cache.get(html_name, "")
-
-    if middle_part == "":
-        if os.path.exists(html_name):
-            existing_split = open(html_name, 'r', encoding='utf-8').read().split('<!--fooocus-log-split-->')
-            if len(existing_split) == 3:
-                middle_part = existing_split[1]
-            else:
-                middle_part = existing_split[0]
+    # The log is append-only: items are appended to an open container that shows them in reverse order,
+    # newest first, so each image costs a constant sized write instead of rewriting the whole day.
+    begin_part = f"<!DOCTYPE html><html><head><title>Fooocus Log {date_string}</title>{css_styles}</head><body>{js}<p>Fooocus Log {date_string} (private)</p>\n<p>Metadata is embedded if enabled in the config or developer debug mode. You can find the information for each image in line Metadata Scheme.</p><!--fooocus-log-append-->\n<div style=\"display: flex; flex-direction: column-reverse;\">\n\n"
 
     div_name = only_name.replace('.', '_')
     item = f"<div id=\"{div_name}\" class=\"image-container\"><hr><table><tr>\n"
@@ -125,13 +157,35 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     item += "</td>"
     item += "</tr></table></div>\n\n"
 
-    middle_part = item + middle_part
+    entry = {'name': only_name, 'metadata': [[label, key, value] for label, key, value in metadata]}
+    if task is not None and 'positive' in task and 'negative' in task:
+        entry.update(positive=task['positive'], negative=task['negative'])
+
+    with log_lock:
+        if html_name not in html_logs_checked:
+            if not os.path.exists(html_name):
+                with open(html_name, 'w', encoding='utf-8') as f:
+                    f.write(begin_part)
+            else:
+                with open(html_name, 'r', encoding='utf-8') as f:
+                    if '<!--fooocus-log-append-->' not in f.read(4096 * 4):
+                        upgrade_html_log(html_name, begin_part)
+            html_logs_checked.add(html_name)
 
-    with open(html_name, 'w', encoding='utf-8') as f:
-        f.write(begin_part + middle_part + end_part)
+        with open(html_name, 'a', encoding='utf-8') as f:
+            f.write(item)
+        with open(os.path.join(os.path.dirname(html_name), 'log.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
 
     print(f'Image generated with private log at: {html_name}')
 
-    log_cache[html_name] = middle_part
-
     return local_temp_filename
+
+
+def upgrade_html_log(html_name, begin_part):
+    # a log in the former rewritten format becomes the oldest item of the append-only one
+    with open(html_name, 'r', encoding='utf-8') as f:
+        existing_split = f.read().split('<!--fooocus-log-split-->')
+    middle_part = existing_split[1] if len(existing_split) == 3 else existing_split[0]
+    with open(html_name, 'w', encoding='utf-8') as f:
+        f.write(begin_part + f'<div>{middle_part}</div>\n\n')
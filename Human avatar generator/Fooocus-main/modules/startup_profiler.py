@@ -0,0 +1,108 @@
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# [(name, seconds)] of the launch phases, in order
+phases = []
+# {module: [cumulative seconds, self seconds]} of every module imported while enabled
+imports = {}
+enabled = False
+start_time = time.perf_counter()
+last_phase_end = start_time
+
+original_import = builtins.__import__
+import_stack = []
+
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if threading.current_thread() is not threading.main_thread():
+        return original_import(name, globals, locals, fromlist, level)
+
+    try:
+        fullname = importlib.util.resolve_name('.' * level + name, globals.get('__package__', None)) if level > 0 else name
+    except (ImportError, AttributeError, ValueError):
+        fullname = name
+    if fullname in sys.modules:
+        return original_import(name, globals, locals, fromlist, level)
+
+    # only the main thread is timed, the import stack is that of the launch
+    import_stack.append(0.0)
+    t = time.perf_counter()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - t
+        children = import_stack.pop()
+        if import_stack:
+            import_stack[-1] += elapsed
+        entry = imports.setdefault(fullname, [0.0, 0.0])
+        entry[0] += elapsed
+        entry[1] += elapsed - children
+
+
+def enable():
+    """Time every module imported on the main thread until the report, and report phases at the end of the launch.
+    """
+    global enabled
+    if not enabled:
+        enabled = True
+        builtins.__import__ = timed_import
+
+
+def stop_import_timing():
+    """Put the original import back, the imports after the launch are not timed.
+    """
+    if builtins.__import__ is timed_import:
+        builtins.__import__ = original_import
+
+
+@contextmanager
+def phase(name):
+    global last_phase_end
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        last_phase_end = time.perf_counter()
+        phases.append((name, last_phase_end - t))
+
+
+def mark(name):
+    """Record everything since the end of the last phase as the phase name.
+    """
+    global last_phase_end
+    now = time.perf_counter()
+    phases.append((name, now - last_phase_end))
+    last_phase_end = now
+
+
+def report(top=25):
+    if not enabled:
+        return
+    stop_import_timing()
+
+    print(f'[Startup] Ready after {time.perf_counter() - start_time:.2f} seconds')
+    for name, seconds in phases:
+        print(f'[Startup] {seconds:8.3f} s  {name}')
+
+    print('[Startup] Slowest imports (cumulative s, self s):')
+    for name, (cumulative, self_time) in sorted(imports.items(), key=lambda x: -x[1][1])[:top]:
+        print(f'[Startup] {cumulative:8.3f} {self_time:8.3f}  {name}')
+
+
+def report_when(condition, name, poll_interval=0.05):
+    """Time the phase until condition() is true, e.g. a server coming up in a call that never returns, then report.
+    """
+    if not enabled:
+        return
+
+    def wait():
+        with phase(name):
+            while not condition():
+                time.sleep(poll_interval)
+        report()
+
+    threading.Thread(target=wait, daemon=True).start()
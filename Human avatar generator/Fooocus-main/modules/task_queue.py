@@ -0,0 +1,145 @@
+import copy
+import itertools
+import threading
+import time
+
+
+class YieldList(list):
+    """The yields list of an AsyncTask.
+
+    Still a plain list for the ['flag', product] protocol, but appending wakes up
+    consumers blocked in wait() instead of making them poll.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.condition = threading.Condition()
+
+    def append(self, item):
+        with self.condition:
+            super().append(item)
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self) > 0, timeout=timeout)
+
+    def __deepcopy__(self, memo):
+        # gr.State deep copies its initial AsyncTask for every session, locks can not be copied
+        return YieldList(copy.deepcopy(list(self), memo))
+
+
+class TaskQueue:
+    """Blocking scheduler for AsyncTasks.
+
+    Higher priority tasks run first. Among equal priorities the user that has been
+    served the least runs next, and a user's own tasks run in submission order.
+    Queued tasks can be cancelled, and every waiting task is told its position
+    through its yields whenever the queue changes.
+
+    append, pop and len are kept so code written against the former async_tasks
+    list keeps working.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = []
+        self.served = {}
+        self.counter = itertools.count()
+        self.stats = {'enqueued': 0, 'started': 0, 'cancelled': 0, 'max_depth': 0,
+                      'total_wait_time': 0.0, 'max_wait_time': 0.0}
+
+    def put(self, task, priority=None, user=None):
+        priority = getattr(task, 'priority', 0) if priority is None else priority
+        user = getattr(task, 'user', None) if user is None else user
+
+        with self.condition:
+            if user not in self.served or all(u != user for _, _, u, _, _ in self.pending):
+                # a user coming back starts level with the users already waiting, not with a head start
+                waiting = [self.served.get(u, 0) for _, _, u, _, _ in self.pending]
+                self.served[user] = max([self.served.get(user, 0)] + ([min(waiting)] if waiting else []))
+
+            self.pending.append((priority, next(self.counter), user, time.perf_counter(), task))
+            self.stats['enqueued'] += 1
+            self.stats['max_depth'] = max(self.stats['max_depth'], len(self.pending))
+            self._publish_positions()
+            self.condition.notify()
+
+    append = put
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.pending) > 0, timeout=timeout):
+                return None
+            return self._take()
+
+    def wait(self, timeout=None):
+        """Block until a task is queued, without taking it."""
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.pending) > 0, timeout=timeout)
+
+    def pop(self, index=0):
+        assert index == 0, 'Only the next task can be popped.'
+        with self.condition:
+            if len(self.pending) == 0:
+                raise IndexError('pop from empty task queue')
+            return self._take()
+
+    def cancel(self, task):
+        with self.condition:
+            for entry in self.pending:
+                if entry[-1] is task:
+                    self.pending.remove(entry)
+                    break
+            else:
+                return False
+            self.stats['cancelled'] += 1
+            self._publish_positions()
+
+        task.yields.append(['finish', task.results])
+        return True
+
+    def position(self, task):
+        with self.condition:
+            for i, entry in enumerate(self._ordered()):
+                if entry[-1] is task:
+                    return i + 1
+        return None
+
+    def metrics(self):
+        with self.condition:
+            depth_per_user = {}
+            for _, _, user, _, _ in self.pending:
+                depth_per_user[user] = depth_per_user.get(user, 0) + 1
+            started = max(self.stats['started'], 1)
+            return dict(self.stats, depth=len(self.pending), depth_per_user=depth_per_user,
+                        mean_wait_time=self.stats['total_wait_time'] / started)
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+    def _ordered(self):
+        return sorted(self.pending, key=lambda e: (-e[0], self.served.get(e[2], 0), e[1]))
+
+    def _take(self):
+        entry = self._ordered()[0]
+        self.pending.remove(entry)
+        _, _, user, enqueue_time, task = entry
+
+        wait_time = time.perf_counter() - enqueue_time
+        self.served[user] = self.served.get(user, 0) + 1
+        self.stats['started'] += 1
+        self.stats['total_wait_time'] += wait_time
+        self.stats['max_wait_time'] = max(self.stats['max_wait_time'], wait_time)
+        self._publish_positions()
+        return task
+
+    def _publish_positions(self):
+        total = len(self.pending)
+        for i, entry in enumerate(self._ordered()):
+            task = entry[-1]
+            if getattr(task, 'queue_position', None) == (i + 1, total):
+                continue
+            task.queue_position = (i + 1, total)
+            task.yields.append(['preview', (1, f'Waiting in queue, position {i + 1}/{total} ...', None)])
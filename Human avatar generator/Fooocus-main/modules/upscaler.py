@@ -1,30 +1,95 @@
+import os
 from collections import OrderedDict
 
+import modules.config
 import modules.core as core
 import torch
+import ldm_patched.modules.utils
 from ldm_patched.contrib.external_upscale_model import ImageUpscaleWithModel
+from ldm_patched.modules import model_management
+from ldm_patched.pfn import model_loading
 from ldm_patched.pfn.architecture.RRDB import RRDBNet as ESRGAN
-from modules.config import downloading_upscale_model
+from modules.util import resample_image
 
 opImageUpscaleWithModel = ImageUpscaleWithModel()
-model = None
+models = {}
 
 
-def perform_upscale(img):
-    global model
+class UpscaleModel(torch.nn.Module):
+    """Wraps an upscale network so tiles are fed in the dtype and memory format it was prepared for.
 
-    print(f'Upscaling image with shape {str(img.shape)} ...')
+    On CPU the network runs channels-last, in bfloat16 if upscaler_cpu_bf16 is set and
+    through torch.compile if upscaler_compile is set. Outputs are always float32.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.scale = model.scale
+        self.dtype = torch.float32
+        self.memory_format = torch.contiguous_format
+        self.forward_function = model
+
+    def prepare(self, device):
+        if device.type != 'cpu' or self.memory_format == torch.channels_last:
+            return
+        self.memory_format = torch.channels_last
+        if modules.config.upscaler_cpu_bf16:
+            self.dtype = torch.bfloat16
+        self.model.to(dtype=self.dtype, memory_format=self.memory_format)
+        if modules.config.upscaler_compile:
+            self.forward_function = torch.compile(self.model, dynamic=True)
+
+    def forward(self, x):
+        x = x.to(dtype=self.dtype, memory_format=self.memory_format)
+        return self.forward_function(x).float()
 
-    if model is None:
-        model_filename = downloading_upscale_model()
+
+def load_upscale_model(model_filename, fooocus_format=False):
+    if model_filename in models:
+        return models[model_filename]
+
+    if fooocus_format:
         sd = torch.load(model_filename, weights_only=True)
         sdo = OrderedDict()
         for k, v in sd.items():
             sdo[k.replace('residual_block_', 'RDB')] = v
         del sd
         model = ESRGAN(sdo)
-        model.cpu()
-        model.eval()
+    else:
+        model = model_loading.load_state_dict(ldm_patched.modules.utils.load_torch_file(model_filename, safe_load=True))
+
+    model.cpu()
+    model.eval()
+    model = UpscaleModel(model)
+    model.prepare(model_management.get_torch_device())
+    models[model_filename] = model
+    return model
+
+
+def get_upscale_model(scale):
+    """The Fooocus 4x network, or the configured 2x network when that is enough for scale.
+    """
+    if scale <= 2 and modules.config.upscale_model_2x not in ['', 'None']:
+        model_filename = os.path.join(modules.config.path_upscale_models, modules.config.upscale_model_2x)
+        if os.path.exists(model_filename):
+            return load_upscale_model(model_filename)
+        print(f'[Upscale] 2x model {model_filename} not found, using the 4x model.')
+
+    return load_upscale_model(modules.config.downloading_upscale_model(), fooocus_format=True)
+
+
+def perform_upscale(img, scale=4.0):
+    """Super-resolve img. The result is at least scale times larger, up to the native factor of the network used.
+    """
+    print(f'Upscaling image with shape {str(img.shape)} ...')
+
+    model = get_upscale_model(scale)
+
+    if modules.config.upscaler_reduced_scale and scale < model.scale:
+        # shrink first, so the network output already has the requested size instead of being resampled down
+        H, W, C = img.shape
+        img = resample_image(img, width=round(W * scale / model.scale), height=round(H * scale / model.scale))
 
     img = core.numpy_to_pytorch(img)
     img = opImageUpscaleWithModel.upscale(model, img)[0]
@@ -16,6 +16,7 @@ from PIL import Image
 
 import modules.config
 import modules.sdxl_styles
+from modules.asset_index import asset_index
 from modules.flags import Performance
 
 LANCZOS = (Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.LANCZOS)
@@ -373,6 +374,10 @@ def get_file_from_folder_list(name, folders):
     if not isinstance(folders, list):
         folders = [folders]
 
+    filename = asset_index.find_file(name, folders)
+    if filename is not None and os.path.isfile(filename):
+        return filename
+
     for folder in folders:
         filename = os.path.abspath(os.path.realpath(os.path.join(folder, name)))
         if os.path.isfile(filename):
@@ -465,28 +470,74 @@ def cleanup_prompt(prompt):
     return cleaned_prompt[:-2]
 
 
+WILDCARD_PATTERN = re.compile(r'__([\w-]+)__')
+
+# (wildcard_filenames, path_wildcards) the index was built from, and {name: filename} with the first file of each name
+wildcard_index_source = None
+wildcard_index = {}
+# {filepath: (mtime_ns, words)}
+wildcard_words = {}
+
+
+def get_wildcard_words(name) -> list | None:
+    """Non-empty lines of the wildcard file called name, read again only when the file changed. None if missing or empty.
+    """
+    global wildcard_index_source, wildcard_index
+
+    source = (modules.config.wildcard_filenames, modules.config.path_wildcards)
+    if wildcard_index_source is None or wildcard_index_source[0] is not source[0] or wildcard_index_source[1] != source[1]:
+        wildcard_index = {}
+        for filename in modules.config.wildcard_filenames:
+            wildcard_index.setdefault(os.path.splitext(os.path.basename(filename))[0], filename)
+        wildcard_index_source = source
+
+    if name not in wildcard_index:
+        return None
+
+    filepath = os.path.join(modules.config.path_wildcards, wildcard_index[name])
+    try:
+        mtime_ns = os.stat(filepath).st_mtime_ns
+        cached = wildcard_words.get(filepath, None)
+        if cached is None or cached[0] != mtime_ns:
+            with open(filepath, encoding='utf-8') as f:
+                words = [x for x in f.read().splitlines() if x != '']
+            cached = (mtime_ns, words)
+            wildcard_words[filepath] = cached
+    except OSError:
+        return None
+
+    return cached[1] if len(cached[1]) > 0 else None
+
+
 def apply_wildcards(wildcard_text, rng, i, read_wildcards_in_order) -> str:
     for _ in range(modules.config.wildcards_max_bfs_depth):
-        placeholders = re.findall(r'__([\w-]+)__', wildcard_text)
+        placeholders = WILDCARD_PATTERN.findall(wildcard_text)
         if len(placeholders) == 0:
             return wildcard_text
 
         print(f'[Wildcards] processing: {wildcard_text}')
+        # (placeholder, replacement, count), words are drawn from rng in the order of the placeholders
+        replacements = []
         for placeholder in placeholders:
-            try:
-                matches = [x for x in modules.config.wildcard_filenames if os.path.splitext(os.path.basename(x))[0] == placeholder]
-                words = open(os.path.join(modules.config.path_wildcards, matches[0]), encoding='utf-8').read().splitlines()
-                words = [x for x in words if x != '']
-                assert len(words) > 0
-                if read_wildcards_in_order:
-                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', words[i % len(words)], 1)
-                else:
-                    wildcard_text = wildcard_text.replace(f'__{placeholder}__', rng.choice(words), 1)
-            except:
+            words = get_wildcard_words(placeholder)
+            if words is None:
                 print(f'[Wildcards] Warning: {placeholder}.txt missing or empty. '
                       f'Using "{placeholder}" as a normal word.')
-                wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
-            print(f'[Wildcards] {wildcard_text}')
+                replacements.append((placeholder, placeholder, -1))
+            elif read_wildcards_in_order:
+                replacements.append((placeholder, words[i % len(words)], 1))
+            else:
+                replacements.append((placeholder, rng.choice(words), 1))
+
+        if any('_' in replacement for _, replacement, _ in replacements):
+            # a replacement may contain placeholders itself, which replacing the first occurrence of a later
+            # placeholder can pick up before the original one, keep that order of replacing
+            for placeholder, replacement, count in replacements:
+                wildcard_text = wildcard_text.replace(f'__{placeholder}__', replacement, count)
+        else:
+            replacement_iterator = iter(replacements)
+            wildcard_text = WILDCARD_PATTERN.sub(lambda _: next(replacement_iterator)[1], wildcard_text)
+        print(f'[Wildcards] {wildcard_text}')
 
     print(f'[Wildcards] BFS stack overflow. Current text: {wildcard_text}')
     return wildcard_text
@@ -0,0 +1,38 @@
+import unittest
+
+import torch
+
+from modules import anisotropic
+
+
+class TestAnisotropic(unittest.TestCase):
+    def test_shifted_matches_unfold(self):
+        torch.manual_seed(0)
+        test_cases = [
+            {"shape": (1, 4, 32, 32), "kernel_size": (13, 13), "color_distance_type": "l1", "guided": True},
+            {"shape": (2, 4, 17, 23), "kernel_size": (5, 7), "color_distance_type": "l2", "guided": True},
+            {"shape": (1, 3, 16, 16), "kernel_size": 9, "color_distance_type": "l1", "guided": False},
+        ]
+
+        for test in test_cases:
+            x = torch.randn(test["shape"], dtype=torch.float64)
+            g = torch.randn(test["shape"], dtype=torch.float64) if test["guided"] else None
+            args = (x, g, test["kernel_size"], 3.0, 3.0, 'reflect', test["color_distance_type"])
+
+            expected = anisotropic._bilateral_blur(*args, method='unfold')
+            actual = anisotropic._bilateral_blur(*args, method='shifted')
+            torch.testing.assert_close(actual, expected, rtol=1e-12, atol=1e-12)
+
+    def test_adaptive_anisotropic_filter_methods_agree(self):
+        torch.manual_seed(0)
+        x = torch.randn(2, 4, 64, 64)
+        g = torch.randn(2, 4, 64, 64)
+
+        expected = anisotropic.adaptive_anisotropic_filter(x, g, method='unfold')
+        actual = anisotropic.adaptive_anisotropic_filter(x, g, method='shifted')
+        torch.testing.assert_close(actual, expected, rtol=1e-5, atol=1e-5)
+
+    def test_unknown_method(self):
+        x = torch.randn(1, 4, 8, 8)
+        with self.assertRaises(ValueError):
+            anisotropic.adaptive_anisotropic_filter(x, method='grid')
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from modules.asset_index import AssetIndex
+from modules.extra_utils import get_files_from_folder
+
+
+class TestAssetIndex(unittest.TestCase):
+    def test_matches_os_walk_and_reuses_listings(self):
+        with tempfile.TemporaryDirectory() as path, tempfile.TemporaryDirectory() as index_path:
+            for filename in ['b.safetensors', 'A.ckpt', 'notes.txt', 'sdxl/z.safetensors', 'sdxl/deep/y.pth',
+                             'sd15/x.safetensors', 'sd15/x_lora.safetensors']:
+                os.makedirs(os.path.dirname(os.path.join(path, filename)), exist_ok=True)
+                open(os.path.join(path, filename), 'w').close()
+            for directory in ['', 'sdxl', 'sdxl/deep', 'sd15']:
+                os.utime(os.path.join(path, directory), ns=(0, 0))
+
+            index = AssetIndex(os.path.join(index_path, 'index.json'))
+            extensions = ['.ckpt', '.safetensors', '.pth']
+            for args in [(None, None), (extensions, None), (extensions, 'lora')]:
+                self.assertEqual(get_files_from_folder(path, *args), index.get_files_from_folder(path, *args))
+            self.assertEqual(index.stats()['listed'], 4)
+
+            self.assertEqual(index.find_file(os.path.join('sdxl', 'z.safetensors'), [path]),
+                             os.path.abspath(os.path.realpath(os.path.join(path, 'sdxl', 'z.safetensors'))))
+            self.assertIsNone(index.find_file('missing.safetensors', [path]))
+            self.assertIsNone(index.find_file('A.ckpt', [os.path.join(path, 'unlisted')]))
+
+            # only the changed directory is listed again, also by a new index loaded from disk
+            index.save()
+            open(os.path.join(path, 'sd15', 'w.safetensors'), 'w').close()
+            os.utime(os.path.join(path, 'sd15'), ns=(10 ** 9, 10 ** 9))
+            reloaded = AssetIndex(os.path.join(index_path, 'index.json'))
+            self.assertEqual(get_files_from_folder(path, extensions), reloaded.get_files_from_folder(path, extensions))
+            self.assertEqual(reloaded.stats()['listed'], 1)
+
+            with self.assertRaises(ValueError):
+                index.get_files_from_folder(os.path.join(path, 'missing'))
+
+    def test_rebuild_and_prune(self):
+        with tempfile.TemporaryDirectory() as path, tempfile.TemporaryDirectory() as index_path:
+            os.makedirs(os.path.join(path, 'sdxl'))
+            open(os.path.join(path, 'sdxl', 'a.safetensors'), 'w').close()
+            os.utime(os.path.join(path, 'sdxl'), ns=(0, 0))
+            os.utime(path, ns=(0, 0))
+
+            index = AssetIndex(os.path.join(index_path, 'index.json'))
+            index.get_files_from_folder(path)
+            index.save()
+
+            # a mount that keeps the mtime of a directory when a file is added
+            open(os.path.join(path, 'sdxl', 'b.safetensors'), 'w').close()
+            os.utime(os.path.join(path, 'sdxl'), ns=(0, 0))
+            reloaded = AssetIndex(os.path.join(index_path, 'index.json'))
+            self.assertEqual(reloaded.get_files_from_folder(path), [os.path.join('sdxl', 'a.safetensors')])
+            reloaded.rebuild()
+            self.assertEqual(reloaded.get_files_from_folder(path), get_files_from_folder(path))
+            reloaded.save()
+
+            # the removed directory is dropped from the saved index
+            os.remove(os.path.join(path, 'sdxl', 'a.safetensors'))
+            os.remove(os.path.join(path, 'sdxl', 'b.safetensors'))
+            os.rmdir(os.path.join(path, 'sdxl'))
+            reloaded.get_files_from_folder(path)
+            reloaded.save()
+            saved = AssetIndex(os.path.join(index_path, 'index.json'))
+            saved.load()
+            self.assertEqual(list(saved.directories), [path])
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import safetensors.torch
+import torch
+
+from ldm_patched.modules.utils import load_torch_file, close_state_dict
+from modules.checkpoint_cache import CheckpointCache
+
+
+class TestCheckpointCache(unittest.TestCase):
+    def test_eviction_by_count_and_size(self):
+        cache = CheckpointCache(max_bytes=100, max_count=2)
+
+        cache.put('a', 'model a', 40)
+        cache.put('b', 'model b', 40)
+        self.assertEqual(cache.get('a'), 'model a')
+        cache.put('c', 'model c', 10)
+        self.assertIsNone(cache.get('b'))
+
+        cache.put('d', 'model d', 95)
+        self.assertEqual(cache.get('d'), 'model d')
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.stats()['evictions'], 3)
+
+        disabled = CheckpointCache(max_bytes=100, max_count=0)
+        disabled.put('a', 'model a', 1)
+        self.assertIsNone(disabled.get('a'))
+
+    def test_mmap_safetensors(self):
+        sd = {
+            'weight': torch.randn(3, 5),
+            'half': torch.randn(7).half(),
+            'bf16': torch.randn(2, 2).bfloat16(),
+            'index': torch.randint(0, 5, (4,)),
+            'empty': torch.zeros(0),
+        }
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'model.safetensors')
+            safetensors.torch.save_file(sd, filename)
+
+            loaded = load_torch_file(filename, mapped=True)
+            for k, v in sd.items():
+                self.assertEqual(loaded[k].dtype, v.dtype)
+                self.assertTrue(torch.equal(loaded[k], v))
+
+            # the mapping is copy-on-write, writes never reach the file
+            loaded['weight'] += 1
+            self.assertTrue(torch.equal(safetensors.torch.load_file(filename)['weight'], sd['weight']))
+
+            close_state_dict(loaded)
+            self.assertEqual(len(loaded), 0)
+            self.assertIsNone(loaded.buffer)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import torch
+
+from modules.cond_cache import CondCache
+
+
+def make_result(value):
+    return torch.full((1, 77, 8), float(value)), torch.full((1, 4), float(value))
+
+
+class TestCondCache(unittest.TestCase):
+    def test_lru_eviction_and_stats(self):
+        entry_bytes = (77 * 8 + 4) * 4
+        cache = CondCache(max_bytes=2 * entry_bytes)
+
+        cache.put(('model', None, 'a'), make_result(1))
+        cache.put(('model', None, 'b'), make_result(2))
+        self.assertIsNotNone(cache.get(('model', None, 'a')))
+        cache.put(('model', None, 'c'), make_result(3))
+
+        self.assertIsNone(cache.get(('model', None, 'b')))
+        self.assertIsNotNone(cache.get(('model', None, 'a')))
+        self.assertIsNone(cache.get(('model', -2, 'a')))
+
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses'], stats['evictions']), (2, 2, 2, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as path:
+            key = ('model', ('lora', 0.5), -2, 'a photo of a cat')
+            cond, pooled = make_result(7)
+            writer = CondCache(max_bytes=2 ** 20, path=path)
+            writer.put(key, (cond, pooled))
+            writer.flush()
+
+            cache = CondCache(max_bytes=2 ** 20, path=path)
+            loaded_cond, loaded_pooled = cache.get(key)
+            self.assertTrue(torch.equal(loaded_cond, cond))
+            self.assertTrue(torch.equal(loaded_pooled, pooled))
+            self.assertEqual(cache.stats()['disk_hits'], 1)
+            self.assertIsNotNone(cache.get(key))
+            self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_disk_size_bound(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = CondCache(max_bytes=2 ** 20, path=path)
+            cache.put(('model', None, 'a'), make_result(1))
+            cache.flush()
+            file_bytes = cache.disk_size
+
+            cache = CondCache(max_bytes=2 ** 20, path=path, max_disk_bytes=2 * file_bytes)
+            self.assertEqual(cache.disk_size, file_bytes)
+            cache.put(('model', None, 'b'), make_result(2))
+            cache.put(('model', None, 'c'), make_result(3))
+            cache.flush()
+
+            # the oldest file is deleted, the others are read back by a new cache
+            self.assertEqual(len(os.listdir(path)), 2)
+            self.assertEqual(cache.stats()['disk_evictions'], 1)
+            cache = CondCache(max_bytes=2 ** 20, path=path)
+            self.assertIsNone(cache.get(('model', None, 'a')))
+            self.assertIsNotNone(cache.get(('model', None, 'c')))
+            self.assertEqual(cache.stats()['disk_hits'], 1)
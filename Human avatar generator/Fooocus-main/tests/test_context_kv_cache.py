@@ -0,0 +1,42 @@
+import unittest
+
+import torch
+
+from ldm_patched.ldm.modules.context_kv_cache import ContextKVCache
+
+
+class TestContextKVCache(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.linear = torch.nn.Linear(16, 32, bias=False)
+        self.context = torch.randn(2, 77, 16)
+
+    def test_equal_context_reuses_projection(self):
+        cache = ContextKVCache()
+        cache.set_context(self.context)
+        first = cache.project(self.linear, self.context)
+
+        # every step brings a new tensor with the same content
+        context = self.context.clone()
+        cache.set_context(context)
+        self.assertIs(cache.project(self.linear, context), first)
+        self.assertTrue(torch.equal(first, self.linear(self.context)))
+        self.assertEqual(cache.stats(), {'contexts': 1, 'hits': 1, 'misses': 1})
+
+    def test_changed_context_is_projected_again(self):
+        cache = ContextKVCache(max_contexts=1)
+        cache.set_context(self.context)
+        cache.project(self.linear, self.context)
+
+        context = self.context + 1.0
+        cache.set_context(context)
+        self.assertTrue(torch.equal(cache.project(self.linear, context), self.linear(context)))
+
+        # a tensor other than the context of the UNet call, e.g. from an attn2 patch, is not cached
+        other = self.context.clone()
+        self.assertTrue(torch.equal(cache.project(self.linear, other), self.linear(other)))
+        self.assertEqual(cache.stats(), {'contexts': 1, 'hits': 0, 'misses': 2})
+
+        cache.clear()
+        self.assertTrue(torch.equal(cache.project(self.linear, context), self.linear(context)))
+        self.assertEqual(cache.stats()['contexts'], 0)
@@ -0,0 +1,40 @@
+import unittest
+
+from modules.deep_cache import DeepCache
+
+
+class TestDeepCache(unittest.TestCase):
+    def run_steps(self, deep_cache, timesteps, model='unet', shape=(2, 4, 128, 128)):
+        reused = []
+        for timestep in timesteps:
+            key, reuse = deep_cache.begin(model, timestep, shape)
+            if not reuse:
+                deep_cache.features[key] = 'features'
+            reused.append(reuse)
+        return reused
+
+    def test_refresh_interval(self):
+        deep_cache = DeepCache(interval=3)
+
+        reused = self.run_steps(deep_cache, [999.0, 900.0, 800.0, 700.0, 600.0, 500.0, 400.0])
+        self.assertEqual(reused, [False, True, True, False, True, True, False])
+        self.assertEqual(deep_cache.stats(), {'hits': 4, 'misses': 3})
+
+    def test_new_run_drops_features(self):
+        deep_cache = DeepCache(interval=3)
+        self.run_steps(deep_cache, [999.0, 900.0])
+
+        self.assertEqual(self.run_steps(deep_cache, [950.0, 900.0]), [False, True])
+        self.assertEqual(len(deep_cache.features), 1)
+
+    def test_calls_within_a_step(self):
+        deep_cache = DeepCache(interval=2)
+        first = deep_cache.begin('unet', 999.0, (1, 4, 64, 64))
+        second = deep_cache.begin('unet', 999.0, (1, 4, 64, 64))
+        self.assertNotEqual(first[0], second[0])
+
+        deep_cache.features[first[0]] = 'cond'
+        self.assertEqual(deep_cache.begin('unet', 900.0, (1, 4, 64, 64)), (first[0], True))
+        # another shape or model has nothing kept yet and runs in full
+        self.assertFalse(deep_cache.begin('unet', 900.0, (2, 4, 64, 64))[1])
+        self.assertFalse(deep_cache.begin('refiner', 800.0, (1, 4, 64, 64))[1])
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import modules.config
+import modules.hash_cache as hash_cache
+from modules.util import sha256
+
+
+class TestHashCache(unittest.TestCase):
+    def test_request_model_hashes(self):
+        with tempfile.TemporaryDirectory() as path:
+            checkpoints, loras = os.path.join(path, 'checkpoints'), os.path.join(path, 'loras')
+            os.makedirs(checkpoints)
+            os.makedirs(loras)
+            for filename, content in [(os.path.join(checkpoints, 'base.safetensors'), b'base'),
+                                      (os.path.join(loras, 'host.safetensors'), b'lora')]:
+                with open(filename, 'wb') as f:
+                    f.write(content)
+
+            with mock.patch.object(modules.config, 'paths_checkpoints', [checkpoints]), \
+                    mock.patch.object(modules.config, 'paths_loras', [loras]), \
+                    mock.patch.object(hash_cache, 'hash_cache', {}), \
+                    mock.patch.object(hash_cache, 'pending_hashes', {}), \
+                    mock.patch.object(hash_cache, 'hash_cache_filename', os.path.join(path, 'hash_cache.txt')):
+                # the call process_prompt makes for a task that saves metadata
+                hash_cache.request_model_hashes('base.safetensors', 'None',
+                                                [('host.safetensors', 0.5), ('missing.safetensors', 1.0)])
+
+                filepaths = [os.path.realpath(os.path.join(checkpoints, 'base.safetensors')),
+                             os.path.realpath(os.path.join(loras, 'host.safetensors'))]
+                self.assertEqual(sorted(hash_cache.pending_hashes), sorted(filepaths))
+                for filepath in filepaths:
+                    self.assertEqual(hash_cache.pending_hashes[filepath].result(), sha256(filepath))
+                    self.assertEqual(hash_cache.lookup_hash(filepath), sha256(filepath))
@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+import args_manager
+import modules.config
+from modules.flags import MetadataScheme, Performance
+
+# building tasks does not need the sampling backend, the worker only loads it with the first task
+with mock.patch.object(args_manager.args, 'lazy_load', True):
+    import modules.headless as headless
+
+
+class TestHeadless(unittest.TestCase):
+    def test_build_task_argument_order(self):
+        task = headless.build_task({
+            'prompt': 'portrait of a podcast host',
+            'negative_prompt': 'blurry',
+            'performance_selection': Performance.QUALITY.value,
+            'aspect_ratios_selection': '896*1152',
+            'image_number': 3,
+            'seed': 42,
+            'loras': [['host.safetensors', 0.7]],
+            'sampler_name': 'euler',
+            'scheduler_name': 'karras',
+            'clip_skip': 1,
+            'freeu_enabled': True,
+            'freeu_s2': 0.5,
+            'metadata_scheme': MetadataScheme.A1111.value,
+            'priority': 2,
+        })
+
+        self.assertEqual((task.prompt, task.negative_prompt), ('portrait of a podcast host', 'blurry'))
+        self.assertEqual(task.performance_selection, Performance.QUALITY)
+        self.assertEqual(task.aspect_ratios_selection, modules.config.add_ratio('896*1152'))
+        self.assertEqual((task.image_number, task.seed), (3, 42))
+        self.assertEqual(task.loras, [('host.safetensors', 0.7)])
+        self.assertEqual((task.sampler_name, task.scheduler_name, task.clip_skip), ('euler', 'karras', 1))
+        self.assertEqual((task.freeu_enabled, task.freeu_s2), (True, 0.5))
+        self.assertFalse(task.input_image_checkbox)
+        self.assertEqual(task.cn_tasks, {k: [] for k in task.cn_tasks})
+        self.assertEqual(len(task.enhance_ctrls), 0)
+        if not args_manager.args.disable_metadata:
+            self.assertEqual(task.metadata_scheme, MetadataScheme.A1111)
+        self.assertEqual(task.priority, 2)
+
+    def test_unknown_and_invalid_jobs(self):
+        with self.assertRaises(ValueError):
+            headless.build_task({'prompt': 'a', 'promt': 'b'})
+
+        events = []
+        headless.run_tasks(['not a job', {'id': 'x', 'steps': 3}], lambda job_id, event: events.append((job_id, event)))
+        self.assertEqual([(job_id, event['event']) for job_id, event in events], [(0, 'error'), ('x', 'error')])
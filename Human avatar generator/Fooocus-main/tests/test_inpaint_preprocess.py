@@ -0,0 +1,60 @@
+import random
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+import modules.inpaint_preprocess as preprocess
+
+
+class TestInpaintPreprocess(unittest.TestCase):
+    def test_solve_abcd_matches_growing_step_by_step(self):
+        def grow(x, a, b, c, d, k):
+            H, W = x.shape[:2]
+            while not (b - a >= H * k and d - c >= W * k):
+                add_h = (b - a) < (d - c) or d - c == W
+                add_w = not (b - a) < (d - c) or b - a == H
+                a, b = (a - 1, b + 1) if add_h else (a, b)
+                c, d = (c - 1, d + 1) if add_w else (c, d)
+                a, b, c, d = preprocess.regulate_abcd(x, a, b, c, d)
+            return a, b, c, d
+
+        rng = random.Random(0)
+        for _ in range(2000):
+            H, W = rng.randint(1, 60), rng.randint(1, 60)
+            a, c = rng.randint(0, H), rng.randint(0, W)
+            b, d = rng.randint(a, H), rng.randint(c, W)
+            k = rng.choice([0.0, 0.5, 0.618, 0.99, rng.random()])
+            x = np.zeros((H, W))
+            self.assertEqual(grow(x, a, b, c, d, k), preprocess.solve_abcd(x, a, b, c, d, k))
+
+    def test_morphological_open_matches_max_filters(self):
+        rng = np.random.default_rng(0)
+        for mask in [np.zeros((40, 50), np.uint8), (rng.random((120, 90)) > 0.998).astype(np.uint8) * 255]:
+            expected = np.zeros_like(mask, dtype=np.int16)
+            expected[mask > 127] = 256
+            for _ in range(32):
+                expected = np.maximum(cv2.dilate(expected, np.ones((3, 3), np.int16)) - 8, expected)
+            expected = np.clip(expected, 0, 255).astype(np.uint8)
+            np.testing.assert_array_equal(expected, preprocess.morphological_open(mask))
+
+    def test_fill_passes_on_crops_are_exact(self):
+        rng = np.random.default_rng(0)
+        image = (rng.random((120, 160, 3)) * 255).astype(np.uint8)
+        mask = np.zeros((120, 160), np.uint8)
+        mask[40:70, 50:90] = 255
+        mask[5:10, 5:10] = 255
+
+        passes = [(33, 2), (5, 3), (3, 2)]
+        expected = image.copy()
+        for k, repeats in passes:
+            for _ in range(repeats):
+                expected = preprocess.box_blur(expected, k)
+                expected[mask < 127] = image[mask < 127]
+
+        with mock.patch.object(preprocess, 'FILL_PASSES', passes):
+            np.testing.assert_array_equal(expected, preprocess.fooocus_fill(image, mask))
+
+        filled = preprocess.fooocus_fill(image, mask)
+        np.testing.assert_array_equal(filled[mask < 127], image[mask < 127])
@@ -0,0 +1,62 @@
+import unittest
+
+import torch
+
+from modules.lora_cache import TensorLRU, merged_deltas, merged_deltas_nbytes
+
+
+class FakePatcher:
+    # the part of ModelPatcher merged_deltas relies on, with LoRA patches as (up, down) only
+    def __init__(self, model):
+        self.model = model
+        self.offload_device = torch.device('cpu')
+
+    def model_state_dict(self):
+        return self.model.state_dict()
+
+    def calculate_weight(self, patches, weight, key):
+        for strength, (patch_type, (up, down)), _ in patches:
+            weight += strength * torch.mm(up, down)
+        return weight
+
+
+class TestLoraCache(unittest.TestCase):
+    def test_lru_counts_nested_tensors(self):
+        entry = {'unet': {'a': [(1.0, (torch.zeros(16),), 1.0)]}, 'clip': {}}
+        cache = TensorLRU(max_bytes=2 * 16 * 4)
+
+        cache.put('x', entry)
+        cache.put('y', entry)
+        self.assertIsNotNone(cache.get('x'))
+        cache.put('z', entry)
+
+        self.assertIsNone(cache.get('y'))
+        self.assertIsNotNone(cache.get('x'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        cache.put('big', torch.zeros(1000))
+        self.assertIsNone(cache.get('big'))
+
+    def test_merged_deltas(self):
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Linear(8, 6), torch.nn.Linear(6, 4)).half()
+        original = {k: v.clone() for k, v in model.state_dict().items()}
+        patcher = FakePatcher(model)
+
+        patches = {
+            '0.weight': [(0.7, ('lora', (torch.randn(6, 2), torch.randn(2, 8))), 1.0),
+                         (0.3, ('lora', (torch.randn(6, 3), torch.randn(3, 8))), 1.0)],
+            '1.weight': [(1.0, ('lora', (torch.randn(4, 2), torch.randn(2, 6))), 1.0)],
+            'missing.weight': [(1.0, ('lora', (torch.randn(4, 2), torch.randn(2, 6))), 1.0)],
+        }
+        deltas = merged_deltas(patcher, patches, torch.device('cpu'))
+        self.assertEqual(merged_deltas_nbytes(patcher, patches), (6 * 8 + 4 * 6) * 4)
+
+        self.assertEqual(set(deltas.keys()), {'0.weight', '1.weight'})
+        for k, key_patches in deltas.items():
+            (strength, (delta,), strength_model), = key_patches
+            self.assertEqual((strength, strength_model, delta.dtype), (1.0, 1.0, torch.float32))
+            expected = patcher.calculate_weight(patches[k], original[k].float(), k)
+            self.assertTrue(torch.allclose(original[k].float() + delta, expected, atol=1e-5))
+        for k, v in model.state_dict().items():
+            self.assertTrue(torch.equal(v, original[k]))
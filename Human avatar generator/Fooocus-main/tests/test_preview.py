@@ -0,0 +1,48 @@
+import threading
+import unittest
+
+import torch
+
+from modules.preview import PreviewThrottle
+
+
+class TestPreviewThrottle(unittest.TestCase):
+    def test_every_n_steps_and_consumer(self):
+        ready = [True]
+        throttle = PreviewThrottle(deliver=None, every_n_steps=2, consumer_ready=lambda: ready[0])
+
+        self.assertEqual([step for step in range(6) if throttle(step, 6)], [0, 2, 4])
+        ready[0] = False
+        self.assertFalse(throttle(0, 6))
+
+    def test_min_interval(self):
+        throttle = PreviewThrottle(deliver=None, min_interval=60.0)
+
+        self.assertTrue(throttle(0, 10))
+        self.assertFalse(throttle(1, 10))
+
+    def test_asynchronous_render(self):
+        delivered = []
+        release = threading.Event()
+
+        def previewer(x0, step, total_steps):
+            release.wait()
+            return x0.sum().item()
+
+        throttle = PreviewThrottle(deliver=delivered.append, asynchronous=True)
+        x0 = torch.ones(2, 2)
+        self.assertTrue(throttle(0, 10))
+        self.assertIsNone(throttle.render(previewer, x0, 0, 10))
+
+        # the latent is copied, the sampler may keep writing to its own
+        x0.zero_()
+        self.assertFalse(throttle(1, 10))
+
+        release.set()
+        throttle.flush()
+        self.assertEqual(delivered, [4.0])
+        self.assertTrue(throttle(2, 10))
+
+    def test_synchronous_render(self):
+        throttle = PreviewThrottle(deliver=None)
+        self.assertEqual(throttle.render(lambda x0, step, total_steps: step, torch.zeros(1), 3, 10), 3)
@@ -0,0 +1,77 @@
+import copy
+import threading
+import unittest
+
+from modules.task_queue import TaskQueue, YieldList
+
+
+class FakeTask:
+    def __init__(self, name, priority=0, user=None):
+        self.name = name
+        self.priority = priority
+        self.user = user
+        self.yields = YieldList()
+        self.results = []
+
+
+class TestTaskQueue(unittest.TestCase):
+    def test_priority_and_fair_share(self):
+        queue = TaskQueue()
+        a1, a2, a3 = FakeTask('a1', user='a'), FakeTask('a2', user='a'), FakeTask('a3', user='a')
+        b1, b2 = FakeTask('b1', user='b'), FakeTask('b2', user='b')
+        urgent = FakeTask('urgent', priority=1, user='a')
+        for task in [a1, a2, a3, b1, b2, urgent]:
+            queue.put(task)
+
+        order = [queue.get().name for _ in range(6)]
+        self.assertEqual(order, ['urgent', 'b1', 'a1', 'b2', 'a2', 'a3'])
+
+    def test_cancel_queued_task(self):
+        queue = TaskQueue()
+        first, second = FakeTask('first'), FakeTask('second')
+        queue.put(first)
+        queue.put(second)
+
+        self.assertEqual(queue.position(second), 2)
+        self.assertTrue(queue.cancel(first))
+        self.assertFalse(queue.cancel(first))
+        self.assertEqual(first.yields[-1], ['finish', []])
+        self.assertEqual(queue.position(second), 1)
+        self.assertEqual(second.yields[-1][1][1], 'Waiting in queue, position 1/1 ...')
+
+        metrics = queue.metrics()
+        self.assertEqual((metrics['depth'], metrics['cancelled'], metrics['max_depth']), (1, 1, 2))
+
+    def test_blocking_handoff(self):
+        queue = TaskQueue()
+        task = FakeTask('task')
+        received = []
+        consumer = threading.Thread(target=lambda: received.append(queue.get(timeout=5)))
+        consumer.start()
+        queue.append(task)
+        consumer.join(timeout=5)
+
+        self.assertEqual(received, [task])
+        self.assertIsNone(queue.get(timeout=0.01))
+        with self.assertRaises(IndexError):
+            queue.pop(0)
+
+    def test_wait_does_not_take(self):
+        queue = TaskQueue()
+        self.assertFalse(queue.wait(timeout=0.01))
+        task = FakeTask('a')
+        threading.Timer(0.01, queue.put, args=(task,)).start()
+        self.assertTrue(queue.wait(timeout=5))
+        self.assertEqual(len(queue), 1)
+        self.assertIs(queue.get(timeout=0.01), task)
+
+    def test_yield_list(self):
+        yields = YieldList()
+        self.assertFalse(yields.wait(timeout=0.01))
+        threading.Timer(0.01, yields.append, args=(['finish', []],)).start()
+        self.assertTrue(yields.wait(timeout=5))
+        self.assertEqual(yields.pop(0), ['finish', []])
+
+        copied = copy.deepcopy(YieldList([['preview', (1, 'a', None)]]))
+        self.assertEqual(copied, [['preview', (1, 'a', None)]])
+        self.assertIsInstance(copied, YieldList)
@@ -0,0 +1,29 @@
+import unittest
+
+import torch
+
+from ldm_patched.modules.utils import tiled_scale
+
+
+class TestTiledScale(unittest.TestCase):
+    def test_tiles_blend_to_untiled_result(self):
+        torch.manual_seed(0)
+        x = torch.randn(2, 3, 70, 90)
+        upscale = lambda a: torch.nn.functional.interpolate(a, scale_factor=4, mode='nearest')
+
+        expected = upscale(x)
+        for tile_batch_size, workers in [(1, 1), (4, 1), (3, 3)]:
+            result = tiled_scale(x, upscale, tile_x=32, tile_y=32, overlap=8, upscale_amount=4,
+                                 tile_batch_size=tile_batch_size, workers=workers)
+            self.assertTrue(torch.allclose(result, expected, atol=1e-5))
+
+    def test_batched_tiles_match_single_tiles(self):
+        torch.manual_seed(0)
+        conv = torch.nn.Conv2d(4, 4, 3, padding=1)
+        x = torch.randn(1, 4, 37, 53)
+
+        with torch.inference_mode():
+            expected = tiled_scale(x, conv, tile_x=16, tile_y=16, overlap=4, upscale_amount=1, out_channels=4)
+            result = tiled_scale(x, conv, tile_x=16, tile_y=16, overlap=4, upscale_amount=1, out_channels=4,
+                                 tile_batch_size=5, workers=2)
+        self.assertTrue(torch.allclose(result, expected, atol=1e-6))
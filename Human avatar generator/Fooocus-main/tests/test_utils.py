@@ -1,4 +1,6 @@
 import os
+import random
+import tempfile
 import unittest
 
 import modules.flags
@@ -135,3 +137,29 @@ class TestUtils(unittest.TestCase):
             expected = test["output"]
             actual = util.parse_lora_references_from_prompt(prompt, loras, loras_limit=loras_limit, lora_filenames=lora_filenames)
             self.assertEqual(expected, actual)
+
+    def test_can_apply_wildcards(self):
+        old_filenames, old_path = modules.config.wildcard_filenames, modules.config.path_wildcards
+        with tempfile.TemporaryDirectory() as path:
+            os.makedirs(os.path.join(path, 'sub'))
+            for filename, content in [('color.txt', 'red\n\nblue\n'), ('sub/flower.txt', '__color__ rose\n'),
+                                      ('empty.txt', '')]:
+                with open(os.path.join(path, filename), 'w', encoding='utf-8') as f:
+                    f.write(content)
+            modules.config.wildcard_filenames = ['color.txt', os.path.join('sub', 'flower.txt'), 'empty.txt']
+            modules.config.path_wildcards = path
+            try:
+                self.assertEqual('red rose, red', util.apply_wildcards('__flower__, __color__', random.Random(0), 0, True))
+                self.assertEqual('blue, blue rose', util.apply_wildcards('__color__, __flower__', random.Random(0), 1, True))
+                self.assertEqual('empty and missing', util.apply_wildcards('__empty__ and __missing__', random.Random(0), 0, False))
+
+                rng = random.Random(1)
+                expected = [rng.choice(['red', 'blue']) for _ in range(3)]
+                self.assertEqual(', '.join(expected), util.apply_wildcards('__color__, __color__, __color__', random.Random(1), 0, False))
+
+                with open(os.path.join(path, 'color.txt'), 'w', encoding='utf-8') as f:
+                    f.write('green\n')
+                os.utime(os.path.join(path, 'color.txt'), ns=(0, 0))
+                self.assertEqual('green', util.apply_wildcards('__color__', random.Random(0), 0, True))
+            finally:
+                modules.config.wildcard_filenames, modules.config.path_wildcards = old_filenames, old_path
@@ -17,9 +17,10 @@ import args_manager
 import copy
 import launch
 from extras.inpaint_mask import SAMOptions
+from modules import startup_profiler
 
 from modules.sdxl_styles import legal_style_names
-from modules.private_logger import get_current_html_path
+from modules.private_logger import get_current_html_path, wait_for_images
 from modules.ui_gradio_extensions import reload_javascript
 from modules.auth import auth_enabled, check_auth
 from modules.util import is_json
@@ -30,7 +31,7 @@ def get_task(*args):
 
     return worker.AsyncTask(args=args)
 
-def generate_clicked(task: worker.AsyncTask):
+def generate_clicked(task: worker.AsyncTask, request: gr.Request):
     import ldm_patched.modules.model_management as model_management
 
     with model_management.interrupt_processing_mutex:
@@ -48,25 +49,36 @@ def generate_clicked(task: worker.AsyncTask):
         gr.update(visible=False, value=None), \
         gr.update(visible=False)
 
-    worker.async_tasks.append(task)
+    task.user = getattr(request, 'username', None) or (request.client.host if request.client else None)
+    worker.async_tasks.put(task)
+
+    # image of a skipped preview, shown with the next preview that has none
+    skipped_image = None
 
     while not finished:
-        time.sleep(0.01)
-        if len(task.yields) > 0:
+        if task.yields.wait():
             flag, product = task.yields.pop(0)
             if flag == 'preview':
+                percentage, title, image = product
 
                 # help bad internet connection by skipping duplicated preview
                 if len(task.yields) > 0:  # if we have the next item
                     if task.yields[0][0] == 'preview':   # if the next item is also a preview
                         # print('Skipped one preview for better internet connection.')
+                        if image is not None:
+                            skipped_image = image
                         continue
 
-                percentage, title, image = product
+                if image is None:
+                    image = skipped_image
+                skipped_image = None
                 yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
                     gr.update(visible=True, value=image) if image is not None else gr.update(), \
                     gr.update(), \
                     gr.update(visible=False)
+            if flag in ['results', 'finish']:
+                # images are written in the background, gradio needs the files
+                wait_for_images(product)
             if flag == 'results':
                 yield gr.update(visible=True), \
                     gr.update(visible=True), \
@@ -188,6 +200,8 @@ with shared.gradio_root:
                         currentTask.last_stop = 'stop'
                         if (currentTask.processing):
                             model_management.interrupt_current_processing()
+                        else:
+                            worker.async_tasks.cancel(currentTask)
                         return currentTask
 
                     def skip_clicked(currentTask):
@@ -869,7 +883,7 @@ with shared.gradio_root:
                                 queue=False, show_progress=False)
 
                 def refresh_files_clicked():
-                    modules.config.update_files()
+                    modules.config.update_files(rebuild=True)
                     results = [gr.update(choices=modules.config.model_filenames)]
                     results += [gr.update(choices=['None'] + modules.config.model_filenames)]
                     results += [gr.update(choices=[flags.default_vae] + modules.config.vae_filenames)]
@@ -1117,6 +1131,9 @@ def dump_default_english_config():
 
 # dump_default_english_config()
 
+startup_profiler.mark('import webui and build UI')
+startup_profiler.report_when(lambda: getattr(shared.gradio_root, 'local_url', None) is not None, 'start gradio server')
+
 shared.gradio_root.launch(
     inbrowser=args_manager.args.in_browser,
     server_name=args_manager.args.listen,
@@ -0,0 +1,162 @@
+# The same file is kept in "LIP-SYNC FILE" and "LIP-SYNC on videos": both trees are run on their own
+# and import it from next to their inference.py, so a change to one copy must be made to the other.
+import subprocess
+from math import gcd
+
+import librosa
+import numpy as np
+from scipy import signal
+from hparams import hparams as hp
+
+# Sample rate of the high quality mix that ends up in the final video.
+# The lip-sync model only ever sees the hp.sample_rate copy.
+master_sample_rate = 48000
+
+def load_segment(path, sr=master_sample_rate, mono=True):
+    """Decode any file librosa/ffmpeg can read into a float32 buffer, (samples,) if mono else (channels, samples)
+    """
+    wav = librosa.core.load(path, sr=sr, mono=mono)[0].astype(np.float32, copy=False)
+    return wav if mono else np.atleast_2d(wav)
+
+def match_channels(segments):
+    """Bring (channels, samples) segments to the largest channel count, other layouts are downmixed and spread
+    """
+    channels = max(s.shape[0] for s in segments)
+    matched = []
+    for s in segments:
+        if s.shape[0] != channels:
+            s = np.repeat(s.mean(axis=0, keepdims=True), channels, axis=0)
+        matched.append(s)
+    return matched
+
+def loudness_db(wav, sr, block_ms=400, gate_db=-70.):
+    """Gated loudness in dBFS, computed over non-overlapping blocks (BS.1770 gating without K-weighting)
+    """
+    wav = np.atleast_2d(wav)
+    block = max(1, int(sr * block_ms / 1000))
+    n_blocks = wav.shape[-1] // block
+    if n_blocks == 0:
+        blocks = wav[:, np.newaxis]
+    else:
+        blocks = wav[:, :n_blocks * block].reshape(wav.shape[0], n_blocks, block)
+    # channels are summed in power like BS.1770 does
+    power = np.mean(np.square(blocks, dtype=np.float64), axis=(0, 2))
+    block_db = 10 * np.log10(np.maximum(power, 1e-12))
+
+    gated = power[block_db > gate_db]
+    if gated.size == 0:
+        return -np.inf
+    relative_gate = 10 * np.log10(np.mean(gated)) - 10
+    gated = power[block_db > max(gate_db, relative_gate)]
+    return 10 * np.log10(np.mean(gated))
+
+def normalize_loudness(wav, sr, target_db=-20., peak=0.99):
+    """Scale wav in place to target_db, backing off if that would clip
+    """
+    current_db = loudness_db(wav, sr)
+    if not np.isfinite(current_db):
+        return wav
+    gain = 10 ** ((target_db - current_db) / 20)
+    max_abs = np.max(np.abs(wav)) * gain
+    if max_abs > peak:
+        gain *= peak / max_abs
+    wav *= np.float32(gain)
+    return wav
+
+def _fade_curves(n):
+    t = np.linspace(0., 0.5 * np.pi, n, dtype=np.float32)
+    return np.sin(t), np.cos(t)
+
+def crossfade_concat(segments, sr, crossfade_ms=50.):
+    """Join segments with equal-power crossfades along their last axis into one preallocated buffer
+    """
+    if len(segments) == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    fade = int(sr * crossfade_ms / 1000)
+    lengths = [s.shape[-1] for s in segments]
+    overlaps = [min(fade, a // 2, b // 2) for a, b in zip(lengths[:-1], lengths[1:])]
+    out = np.zeros(segments[0].shape[:-1] + (sum(lengths) - sum(overlaps),), dtype=np.float32)
+
+    pos = 0
+    for i, seg in enumerate(segments):
+        head = overlaps[i - 1] if i > 0 else 0
+        tail = overlaps[i] if i < len(overlaps) else 0
+        end = pos + lengths[i]
+
+        out[..., pos + head:end - tail] += seg[..., head:lengths[i] - tail]
+        if head > 0:
+            fade_in, _ = _fade_curves(head)
+            out[..., pos:pos + head] += seg[..., :head] * fade_in
+        if tail > 0:
+            _, fade_out = _fade_curves(tail)
+            out[..., end - tail:end] += seg[..., lengths[i] - tail:] * fade_out
+
+        pos = end - tail
+    return out
+
+def resample(wav, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return wav
+    g = gcd(orig_sr, target_sr)
+    return signal.resample_poly(wav, target_sr // g, orig_sr // g, axis=-1).astype(np.float32, copy=False)
+
+class Episode:
+    """All audio of one episode, kept in memory from assembly to muxing.
+
+    Segments are decoded once with all their channels, loudness normalised and
+    crossfaded into a single (channels, samples) master buffer. The lip-sync model
+    gets a mono hp.sample_rate copy of it and the master is piped straight into
+    ffmpeg, so no intermediate wav is written. A single file that is not normalised
+    is muxed from the file itself, as it is.
+    """
+
+    def __init__(self, segments, sr=master_sample_rate, target_db=None, crossfade_ms=50., source=None):
+        self.sample_rate = sr
+        self.source = source
+        self.master = None
+        self._lipsync_wav = None
+        if source is not None:
+            return
+        segments = match_channels(segments)
+        if target_db is not None:
+            segments = [normalize_loudness(s, sr, target_db) for s in segments]
+        self.master = crossfade_concat(segments, sr, crossfade_ms)
+
+    @classmethod
+    def from_files(cls, paths, sr=master_sample_rate, **kwargs):
+        if len(paths) == 1 and kwargs.get('target_db', None) is None:
+            return cls([], sr=sr, source=paths[0], **kwargs)
+        return cls([load_segment(p, sr, mono=False) for p in paths], sr=sr, **kwargs)
+
+    @property
+    def duration(self):
+        return len(self.lipsync_wav()) / hp.sample_rate
+
+    def lipsync_wav(self):
+        if self._lipsync_wav is None:
+            if self.source is not None:
+                # the model gets the same samples as from reading the file directly
+                self._lipsync_wav = load_segment(self.source, hp.sample_rate)
+            else:
+                self._lipsync_wav = resample(self.master.mean(axis=0), self.sample_rate, hp.sample_rate)
+        return self._lipsync_wav
+
+    def mux(self, video_path, outfile):
+        """Attach the audio to video_path, the master is fed to ffmpeg as raw samples through stdin
+        """
+        if self.source is not None:
+            command = ['ffmpeg', '-y', '-i', self.source, '-i', video_path, '-strict', '-2', '-q:v', '1', outfile]
+            process = subprocess.Popen(command)
+            process.communicate()
+        else:
+            channels = self.master.shape[0]
+            command = ['ffmpeg', '-y',
+                       '-f', 'f32le', '-ar', str(self.sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+                       '-i', video_path, '-strict', '-2', '-q:v', '1', outfile]
+            # interleaved samples, frame after frame
+            master = np.ascontiguousarray(self.master.T, dtype='<f4')
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            process.communicate(memoryview(master).cast('B'))
+        if process.returncode != 0:
+            raise RuntimeError('ffmpeg failed to mux the audio into {} (exit code {})'.format(outfile, process.returncode))
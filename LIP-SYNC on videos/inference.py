@@ -1,12 +1,12 @@
 from os import listdir, path
 import numpy as np
 import scipy, cv2, os, sys, argparse, audio
-import json, subprocess, random, string
+import json, random, string
 from tqdm import tqdm
 from glob import glob
 import torch, face_detection
 from models import Wav2Lip
-import platform
+from episode import Episode
 
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
 
@@ -15,8 +15,13 @@ parser.add_argument('--checkpoint_path', type=str,
 
 parser.add_argument('--face', type=str, 
 					help='Filepath of video/image that contains faces to use', required=True)
-parser.add_argument('--audio', type=str, 
-					help='Filepath of video/audio file to use as raw audio source', required=True)
+parser.add_argument('--audio', type=str, nargs='+', 
+					help='Filepath(s) of video/audio file(s) to use as raw audio source. '
+					'Several files are crossfaded into one track, loudness-normalized with --target_db', required=True)
+parser.add_argument('--target_db', type=float, default=None, 
+					help='Loudness (dBFS) every audio segment is normalized to. By default the audio is left as it is')
+parser.add_argument('--crossfade_ms', type=float, default=50., 
+					help='Length of the crossfade between consecutive audio segments')
 parser.add_argument('--outfile', type=str, help='Video path to save result. See default for an e.g.', 
 								default='results/result_voice.mp4')
 
@@ -214,14 +219,9 @@ def main():
 
 	print ("Number of frames available for inference: "+str(len(full_frames)))
 
-	if not args.audio.endswith('.wav'):
-		print('Extracting raw audio...')
-		command = 'ffmpeg -y -i {} -strict -2 {}'.format(args.audio, 'temp/temp.wav')
-
-		subprocess.call(command, shell=True)
-		args.audio = 'temp/temp.wav'
-
-	wav = audio.load_wav(args.audio, 16000)
+	print('Assembling audio...')
+	episode = Episode.from_files(args.audio, target_db=args.target_db, crossfade_ms=args.crossfade_ms)
+	wav = episode.lipsync_wav()
 	mel = audio.melspectrogram(wav)
 	print(mel.shape)
 
@@ -273,8 +273,7 @@ def main():
 
 	out.release()
 
-	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
-	subprocess.call(command, shell=platform.system() != 'Windows')
+	episode.mux('temp/result.avi', args.outfile)
 
 if __name__ == '__main__':
 	main()
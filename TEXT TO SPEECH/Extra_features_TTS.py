@@ -2,29 +2,104 @@ import streamlit as st
 import pyttsx3
 import os
 import tempfile
+import threading
+import queue
+import itertools
 import base64
-from io import BytesIO
+from concurrent.futures import Future
+
+class SpeechWorker:
+    """Owns a single pyttsx3 engine on a dedicated thread.
+
+    pyttsx3 drivers are not thread safe and must be driven from the thread that
+    created them, so every request goes through a queue. Requests that pile up
+    while the engine is busy are rendered together in one runAndWait() call.
+    """
+
+    def __init__(self):
+        self._requests = queue.Queue()
+        self._ready = threading.Event()
+        self._voices = {}
+        self._init_error = None
+        # pyttsx3 can only render to a file, so reuse one directory for all of them
+        self._output_dir = tempfile.mkdtemp(prefix="pyttsx3_")
+        self._counter = itertools.count()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get_voices(self):
+        self._ready.wait()
+        if self._init_error is not None:
+            raise self._init_error
+        return self._voices
+
+    def submit(self, text, voice_id, rate, volume):
+        future = Future()
+        self._requests.put((text, voice_id, rate, volume, future))
+        return future
+
+    def _run(self):
+        try:
+            engine = pyttsx3.init()
+            self._voices = {voice.name: voice.id for voice in engine.getProperty('voices')}
+        except Exception as e:
+            self._init_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        while True:
+            batch = [self._requests.get()]
+            while True:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            self._render(engine, batch)
+
+    def _render(self, engine, batch):
+        jobs = []
+        for text, voice_id, rate, volume, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            path = os.path.join(self._output_dir, f"{next(self._counter)}.mp3")
+            # Property changes are queued by the driver, so each file gets its own settings
+            engine.setProperty('voice', voice_id)
+            engine.setProperty('rate', rate)
+            engine.setProperty('volume', volume)
+            engine.save_to_file(text, path)
+            jobs.append((path, future))
+
+        if not jobs:
+            return
+
+        try:
+            engine.runAndWait()
+        except Exception as e:
+            for path, future in jobs:
+                future.set_exception(e)
+            return
+
+        for path, future in jobs:
+            try:
+                with open(path, 'rb') as f:
+                    future.set_result(f.read())
+                os.unlink(path)
+            except Exception as e:
+                future.set_exception(e)
+
+@st.cache_resource
+def get_speech_worker():
+    return SpeechWorker()
 
 def get_available_voices():
-    engine = pyttsx3.init()
-    voices = engine.getProperty('voices')
-    return {voice.name: voice.id for voice in voices}
+    return get_speech_worker().get_voices()
 
 def text_to_speech(text, voice_id, rate, volume):
-    engine = pyttsx3.init()
-    engine.setProperty('voice', voice_id)
-    engine.setProperty('rate', rate)
-    engine.setProperty('volume', volume)
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-        engine.save_to_file(text, fp.name)
-        engine.runAndWait()
-        return fp.name
-
-def get_binary_file_downloader_html(bin_file, file_label='File'):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    bin_str = base64.b64encode(data).decode()
+    return get_speech_worker().submit(text, voice_id, rate, volume).result()
+
+def get_binary_file_downloader_html(audio_bytes, file_label='File'):
+    bin_str = base64.b64encode(audio_bytes).decode()
     href = f'<a href="data:audio/mpeg;base64,{bin_str}" download="audio.mp3">Download {file_label}</a>'
     return href
 
@@ -49,20 +124,13 @@ def main():
     if st.button("Convert to Speech"):
         if text:
             try:
-                audio_file = text_to_speech(text, voices[selected_voice], rate, volume)
-                
-                # Read the audio file
-                with open(audio_file, 'rb') as f:
-                    audio_bytes = f.read()
+                audio_bytes = text_to_speech(text, voices[selected_voice], rate, volume)
                 
                 # Play the audio
                 st.audio(audio_bytes, format='audio/mp3')
                 
                 # Offer download option
-                st.markdown(get_binary_file_downloader_html(audio_file, 'Audio'), unsafe_allow_html=True)
-                
-                # Clean up the temporary file
-                os.unlink(audio_file)
+                st.markdown(get_binary_file_downloader_html(audio_bytes, 'Audio'), unsafe_allow_html=True)
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
         else:
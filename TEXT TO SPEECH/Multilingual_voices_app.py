@@ -2,7 +2,12 @@ import streamlit as st
 import asyncio
 import edge_tts
 import io
+import re
+import time
+import zipfile
 import base64
+import threading
+from collections import OrderedDict
 
 # Set page config at the very beginning
 st.set_page_config(page_title="Advanced Multilingual Text-to-Speech Converter", page_icon="🎤")
@@ -41,6 +46,109 @@ async def text_to_speech(text, voice, rate):
             audio_data += chunk["data"]
     return audio_data
 
+# edge-tts streams constant bitrate 24kHz/48kbit mono mp3, so duration follows from the size
+EDGE_TTS_BITRATE = 48000
+MAX_CHUNK_CHARS = 1000
+MAX_CONCURRENT_REQUESTS = 32
+CHUNK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])')
+
+def split_sentences(text, max_chars=MAX_CHUNK_CHARS):
+    chunks, current = [], ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+class ChunkCache:
+    """LRU of rendered chunks, capped by the size of their audio. Shared by all sessions, hence the lock."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            audio_data = self.entries.get(key)
+            if audio_data is not None:
+                self.entries.move_to_end(key)
+            return audio_data
+
+    def put(self, key, audio_data):
+        with self.lock:
+            if key in self.entries or len(audio_data) > self.max_bytes:
+                return
+            self.entries[key] = audio_data
+            self.size += len(audio_data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+@st.cache_resource
+def get_chunk_cache():
+    return ChunkCache(CHUNK_CACHE_MAX_BYTES)
+
+async def render_chunk(chunk, voice, rate, semaphore):
+    cache = get_chunk_cache()
+    key = (voice, rate, chunk)
+    audio_data = cache.get(key)
+    if audio_data is not None:
+        return audio_data
+    async with semaphore:
+        audio_data = await text_to_speech(chunk, voice, rate)
+    cache.put(key, audio_data)
+    return audio_data
+
+async def render_voice(chunks, voice, rate, semaphore):
+    start = time.perf_counter()
+    parts = await asyncio.gather(*(render_chunk(c, voice, rate, semaphore) for c in chunks))
+    # mp3 frames can be concatenated as-is
+    audio_data = b"".join(parts)
+    latency = time.perf_counter() - start
+    return audio_data, latency
+
+async def render_all_voices(text, voice_names, rate):
+    chunks = split_sentences(text)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    # a voice that fails is reported on its own instead of failing the whole bundle
+    results = await asyncio.gather(*(render_voice(chunks, VOICES[name], rate, semaphore) for name in voice_names),
+                                   return_exceptions=True)
+    return dict(zip(voice_names, results))
+
+def build_voice_bundle(results):
+    """Zip of the voices that rendered, their metrics, and {voice name: error} of the ones that did not"""
+    metrics = []
+    errors = {}
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, "w", zipfile.ZIP_STORED) as zf:
+        for voice_name, result in results.items():
+            if isinstance(result, BaseException):
+                errors[voice_name] = f"{type(result).__name__}: {result}"
+                continue
+            audio_data, latency = result
+            zf.writestr(f"{VOICES[voice_name]}.mp3", audio_data)
+            metrics.append({
+                "Voice": voice_name,
+                "Duration (s)": round(len(audio_data) * 8 / EDGE_TTS_BITRATE, 2),
+                "Latency (s)": round(latency, 2),
+            })
+        lines = ["voice,duration_s,latency_s"]
+        lines += [f"{VOICES[m['Voice']]},{m['Duration (s)']},{m['Latency (s)']}" for m in metrics]
+        zf.writestr("metrics.csv", "\n".join(lines) + "\n")
+        if errors:
+            zf.writestr("errors.txt", "".join(f"{VOICES[name]}: {error}\n" for name, error in errors.items()))
+    return bundle.getvalue(), metrics, errors
+
 def get_binary_file_downloader_html(bin_file, file_label='File'):
     bin_str = base64.b64encode(bin_file).decode()
     href = f'<a href="data:application/octet-stream;base64,{bin_str}" download="{file_label}">Download {file_label}</a>'
@@ -55,6 +163,8 @@ with col1:
 with col2:
     rate_option = st.selectbox("Select speech rate:", ["Very Slow", "Slow", "Normal", "Fast", "Very Fast"])
 
+render_all = st.checkbox("Render in all voices (zipped bundle)")
+
 rate_map = {
     "Very Slow": "-50%",
     "Slow": "-25%",
@@ -64,7 +174,17 @@ rate_map = {
 }
 
 if st.button("Convert to Speech"):
-    if text_input:
+    if text_input and render_all:
+        with st.spinner(f"Converting text to speech in {len(VOICES)} voices..."):
+            start = time.perf_counter()
+            results = asyncio.run(render_all_voices(text_input, list(VOICES.keys()), rate_map[rate_option]))
+            bundle, metrics, errors = build_voice_bundle(results)
+            st.success(f"Rendered {len(metrics)} voices in {time.perf_counter() - start:.2f} seconds!")
+            for name, error in errors.items():
+                st.warning(f"{name} failed: {error}")
+            st.table(metrics)
+            st.markdown(get_binary_file_downloader_html(bundle, 'voices.zip'), unsafe_allow_html=True)
+    elif text_input:
         with st.spinner("Converting text to speech..."):
             voice = VOICES[voice_name]
             rate = rate_map[rate_option]
@@ -88,5 +208,6 @@ st.sidebar.markdown("""
 - Multiple languages and voices
 - Adjustable speech rate
 - Male and female voices for most languages
+- Render one script in every voice at once
 - Download option for generated audio
 """)
\ No newline at end of file